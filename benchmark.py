@@ -0,0 +1,835 @@
+import sys
+import os
+import json
+import time
+import email
+import base64
+import random
+import argparse
+import tempfile
+import threading
+import urllib.parse
+import mimetypes
+import subprocess
+import http.server
+
+from PyQt5.QtCore import QBuffer, QCoreApplication, QEventLoop, QIODevice, QTimer, QUrl
+from PyQt5.QtGui import QColor, QImage
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtWebEngineWidgets import QWebEngineDownloadItem, QWebEngineView
+
+# web.py при импорте создает папки загрузок и профиля в домашнем каталоге,
+# а часть замеров пишет туда же. Как и дочернему процессу браузера,
+# замерам дается временный домашний каталог, он удаляется при выходе
+if __name__ == '__main__' and '--browser-child' not in sys.argv:
+    bench_home = tempfile.TemporaryDirectory(prefix='web-benchmark-')
+    os.environ['HOME'] = os.environ['USERPROFILE'] = bench_home.name
+
+import web
+
+# Локальный HTTP-сервер для замеров: отдает сгенерированные файлы,
+# поддерживает Range и умеет ограничивать скорость одного соединения,
+# как это делают настоящие серверы
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    files = {}
+    rate_per_connection = 0      # байт/с, 0 — без ограничения
+    latency = 0.0                # секунд до ответа, как задержка сети
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        data = self.files.get(self.path.split('?')[0])
+        if data is None:
+            self.send_error(404)
+            return
+
+        start, end = 0, len(data) - 1
+        status = 200
+        range_header = self.headers.get('Range')
+        if range_header and range_header.startswith('bytes='):
+            first, _, last = range_header[6:].partition('-')
+            start = int(first) if first else 0
+            end = min(int(last), len(data) - 1) if last else len(data) - 1
+            if start > end:
+                self.send_error(416)
+                return
+            status = 206
+
+        content_type = mimetypes.guess_type(self.path.split('?')[0])[0]
+        self.send_response(status)
+        self.send_header('Content-Type', content_type or 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', f'"{len(data)}"')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        self.end_headers()
+        self.send_body(data, start, end + 1)
+
+    def send_body(self, data, start, stop):
+        chunk = 64 * 1024
+        began = time.perf_counter()
+        sent = 0
+        try:
+            for pos in range(start, stop, chunk):
+                piece = data[pos:min(pos + chunk, stop)]
+                self.wfile.write(piece)
+                sent += len(piece)
+                if self.rate_per_connection:
+                    delay = sent / self.rate_per_connection - (time.perf_counter() - began)
+                    if delay > 0:
+                        time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+def start_fixture_server(files, rate_per_connection=0, latency=0.0):
+    handler = type('Handler', (FixtureHandler,), {
+        'files': files, 'rate_per_connection': rate_per_connection, 'latency': latency})
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+def bench_segmented_download(base_url, data, connections, workdir):
+    size = len(data)
+    path = os.path.join(workdir, f'segmented-{connections}.bin')
+    transfer = web.SegmentedTransfer(f'{base_url}/large.bin', path, connections)
+    began = time.perf_counter()
+    transfer.start()
+    transfer.wait()
+    elapsed = time.perf_counter() - began
+    ok = False
+    if transfer.done:
+        with open(path, 'rb') as f:
+            ok = f.read() == data
+        os.remove(path)
+    return {
+        'name': 'segmented_download',
+        'connections': connections,
+        'bytes': size,
+        'seconds': round(elapsed, 4),
+        'mb_per_s': round(size / elapsed / (1024 * 1024), 2),
+        'ok': ok,
+        'error': transfer.error,
+    }
+
+def fill_history(store, count):
+    # Синтетическая история: много сайтов, у каждого много страниц
+    words = ['github', 'google', 'docs', 'mail', 'wiki', 'jira', 'confluence', 'grafana',
+             'kibana', 'dashboard', 'report', 'python', 'qt', 'news', 'shop']
+    now = time.time()
+    rows = []
+    for i in range(count):
+        host = f'{random.choice(words)}{random.randint(0, 5000)}.{random.choice(["com", "org", "ru"])}'
+        url = f'https://{host}/{random.choice(words)}/{i}'
+        rows.append((url, web.history_key(url), f'{random.choice(words).title()} page {i}',
+                     1, now, now / store.half_life + random.random() * 5))
+    conn = store.connect()
+    with conn:
+        conn.executemany(
+            'INSERT INTO urls (url, key, title, visit_count, last_visit, rank) VALUES (?, ?, ?, ?, ?, ?)',
+            rows)
+    return conn
+
+def bench_history_search(conn, store, queries, repeat=20):
+    results = []
+    for text in queries:
+        store.search(conn, text)
+        began = time.perf_counter()
+        for _ in range(repeat):
+            found = store.search(conn, text)
+        elapsed = (time.perf_counter() - began) / repeat
+        results.append({
+            'name': 'history_search',
+            'query': text,
+            'ms': round(elapsed * 1000, 3),
+            'results': len(found),
+        })
+    return results
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def bench_omnibox_keystrokes(omnibox, store, conn, inputs):
+    # Каждое нажатие: классификатор и открытые вкладки синхронно в UI,
+    # поиск по истории — то, что потом сделает поток History
+    instant = []
+    history = []
+    for text in inputs:
+        for end in range(1, len(text) + 1):
+            typed = text[:end]
+            began = time.perf_counter()
+            omnibox.instant_suggestions(typed)
+            instant.append(time.perf_counter() - began)
+            began = time.perf_counter()
+            store.search(conn, typed)
+            history.append(time.perf_counter() - began)
+    results = []
+    for name, samples in (('omnibox_instant', instant), ('omnibox_history', history)):
+        results.append({
+            'name': name,
+            'keystrokes': len(samples),
+            'mean_us': round(sum(samples) / len(samples) * 1e6, 1),
+            'p50_us': round(percentile(samples, 0.5) * 1e6, 1),
+            'p99_us': round(percentile(samples, 0.99) * 1e6, 1),
+        })
+    return results
+
+def fixture_page(name):
+    paragraphs = ''.join(
+        f'<p>Абзац {n}. ' + 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 20 + '</p>'
+        for n in range(50))
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>Страница {name}</title>'
+            f'</head><body><h1>Страница {name}</h1>{paragraphs}</body></html>').encode('utf-8')
+
+def wait_for(condition, timeout):
+    # Крутим цикл событий Qt, пока условие не выполнится
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            return False
+        QApplication.processEvents(QEventLoop.WaitForMoreEvents)
+    return True
+
+def timing_summary(name, samples, **extra):
+    result = {'name': name, 'count': len(samples)}
+    if samples:
+        result.update({
+            'mean_ms': round(sum(samples) / len(samples) * 1000, 2),
+            'p50_ms': round(percentile(samples, 0.5) * 1000, 2),
+            'p99_ms': round(percentile(samples, 0.99) * 1000, 2),
+            'max_ms': round(max(samples) * 1000, 2),
+        })
+    result.update(extra)
+    return result
+
+def browser_rss(window):
+    # Память браузера вместе с процессами рендереров вкладок
+    pids = {os.getpid()}
+    for i in range(window.tabs.count()):
+        view = window.tabs.widget(i)
+        if isinstance(view, QWebEngineView):
+            pids.add(view.page().renderProcessPid())
+    return sum(web.process_rss(pid) or 0 for pid in pids if pid)
+
+def bench_tabs(window, base_url, count):
+    latencies = []
+    started = {}
+    loaded = {}
+    rss_before = browser_rss(window)
+    for i in range(count):
+        url = QUrl(f'{base_url}/pages/{i}.html')
+        began = time.perf_counter()
+        window.add_new_tab(url)
+        latencies.append(time.perf_counter() - began)
+        started[i] = began
+        view = window.tabs.widget(window.tabs.count() - 1)
+        view.loadFinished.connect(
+            lambda ok, i=i: loaded.setdefault(i, (ok, time.perf_counter())))
+    complete = wait_for(lambda: len(loaded) == count, 60 + count)
+    rss_after = browser_rss(window)
+    load_times = [moment - started[i] for i, (_, moment) in loaded.items()]
+    failed = sum(1 for ok, _ in loaded.values() if not ok)
+    mb = 1024 * 1024
+    return [
+        timing_summary('add_new_tab', latencies),
+        timing_summary('load_finished', load_times, failed=failed, complete=complete),
+        {
+            'name': 'rss_per_tab',
+            'tabs': count,
+            'rss_before_mb': round(rss_before / mb, 1),
+            'rss_after_mb': round(rss_after / mb, 1),
+            'mb_per_tab': round((rss_after - rss_before) / count / mb, 1),
+        },
+    ]
+
+def bench_tab_switch(window, switches):
+    # Переключение с учетом отложенной materialize_tab и перерисовки
+    rng = random.Random(0)
+    count = window.tabs.count()
+    samples = []
+    for _ in range(switches):
+        index = (window.tabs.currentIndex() + 1 + rng.randrange(count - 1)) % count
+        began = time.perf_counter()
+        window.tabs.setCurrentIndex(index)
+        QApplication.processEvents()
+        samples.append(time.perf_counter() - began)
+    return timing_summary('tab_switch', samples, tabs=count)
+
+def bench_view_pool(window, base_url, count):
+    # Ctrl+T с паузой между вкладками: без запаса и с запасом готовых вкладок.
+    # Время — от add_new_tab до loadFinished, в него входит запуск рендерера
+    pool = window.view_pool
+    results = []
+    for size in (0, web.VIEW_POOL_SIZE):
+        pool.set_size(size)
+        wait_for(lambda: len(pool.ready) >= size, 10)
+        hits_before = pool.hits
+        samples = []
+        for i in range(count):
+            wait_for(lambda: len(pool.ready) >= size, 10)
+            loaded = []
+            began = time.perf_counter()
+            window.add_new_tab(QUrl(f'{base_url}/pages/start.html'))
+            window.tabs.currentWidget().loadFinished.connect(loaded.append)
+            wait_for(lambda: loaded, 30)
+            samples.append(time.perf_counter() - began)
+        results.append(timing_summary('new_tab_to_load_finished', samples,
+                                      pool_size=size, pool_hits=pool.hits - hits_before))
+    pool.set_size(web.VIEW_POOL_SIZE)
+    return results
+
+def bench_browser_download(window, base_url, size, segmented):
+    # Загрузка через handle_download и окно загрузок, как у пользователя
+    window.auto_accept_action.setChecked(True)
+    window.segmented_action.setChecked(segmented)
+    entries = window.get_downloads_window().model.entries
+    known = len(entries)
+    finished_states = (QWebEngineDownloadItem.DownloadCompleted,
+                       QWebEngineDownloadItem.DownloadCancelled,
+                       QWebEngineDownloadItem.DownloadInterrupted)
+
+    began = time.perf_counter()
+    window.tabs.currentWidget().page().download(QUrl(f'{base_url}/large.bin'))
+    complete = wait_for(lambda: len(entries) > known and entries[known].state in finished_states,
+                        300)
+    elapsed = time.perf_counter() - began
+
+    ok = False
+    if complete:
+        entry = entries[known]
+        ok = (entry.state == QWebEngineDownloadItem.DownloadCompleted
+              and os.path.getsize(entry.download_path) == size)
+        os.remove(entry.download_path)
+    return {
+        'name': 'browser_download',
+        'engine': 'segmented' if segmented else 'webengine',
+        'bytes': size,
+        'seconds': round(elapsed, 4),
+        'mb_per_s': round(size / elapsed / (1024 * 1024), 2),
+        'ok': ok,
+    }
+
+def bench_render_pool(window, base_url, pages, count):
+    # Пакетная обработка адресов скрытыми страницами, как batch.submit
+    # сервера управления и web.py render: страниц в секунду при разном
+    # размере пула, со скриптом и с сохранением в PDF
+    results = []
+    urls = [f'{base_url}/pages/{n % pages}.html?render={n}' for n in range(count)]
+    pdf_dir = os.path.join(web.downloads_path, 'render-bench')
+    os.makedirs(pdf_dir, exist_ok=True)
+    for output, size in [(output, size) for output in ('script', 'pdf')
+                         for size in sorted({1, web.RENDER_POOL_SIZE})]:
+        pool = web.RenderPool(window.profile, size)
+        done = []
+        began = time.perf_counter()
+        for n, url in enumerate(urls):
+            if output == 'pdf':
+                task = web.RenderTask(url, callback=done.append, pdf=os.path.join(pdf_dir, f'{n}.pdf'))
+            else:
+                task = web.RenderTask(url, script='document.body.innerText.length', callback=done.append)
+            pool.submit(task)
+        wait_for(lambda: len(done) == len(urls), 300)
+        elapsed = time.perf_counter() - began
+        pool.close()
+        results.append({
+            'name': 'render_pool',
+            'output': output,
+            'pool_size': size,
+            'pages': len(done),
+            'failed': sum('error' in result for result in done),
+            'seconds': round(elapsed, 3),
+            'pages_per_s': round(len(done) / elapsed, 1),
+        })
+    return results
+
+def run_browser_child(args):
+    web.register_offline_scheme()
+    app = QApplication(sys.argv[:1])
+    # Без таймера WaitForMoreEvents может ждать событий вечно
+    heartbeat = QTimer()
+    heartbeat.start(20)
+
+    size = args.size_mb * 1024 * 1024
+    files = {f'/pages/{i}.html': fixture_page(i) for i in range(args.browser_tabs)}
+    files['/pages/start.html'] = fixture_page('start')
+    files['/large.bin'] = os.urandom(size)
+    server, base_url = start_fixture_server(files, args.rate_kb * 1024)
+
+    # Первая вкладка восстанавливается из сессии и не ходит в интернет
+    with open(web.session_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'op': 'open', 'id': 1, 'url': f'{base_url}/pages/start.html'}) + '\n')
+
+    window = web.Browser()
+    window.show()
+    window.finish_startup()
+    wait_for(lambda: False, 1)
+
+    results = bench_tabs(window, base_url, args.browser_tabs)
+    results.append(bench_tab_switch(window, args.switches))
+    results.extend(bench_view_pool(window, base_url, 10))
+    results.extend(bench_render_pool(window, base_url, args.browser_tabs, 100))
+    for segmented in (False, True):
+        results.append(bench_browser_download(window, base_url, size, segmented))
+
+    window.close()
+    server.shutdown()
+    app.processEvents()
+    return results
+
+def run_browser(args, workdir):
+    # Браузер запускается в отдельном процессе: offscreen-платформа и
+    # домашняя папка во временном каталоге, чтобы не трогать настоящие
+    # профиль, историю и сессию
+    env = dict(os.environ, HOME=workdir, USERPROFILE=workdir, QT_QPA_PLATFORM='offscreen')
+    command = [sys.executable, os.path.abspath(__file__), '--browser-child',
+               '--browser-tabs', str(args.browser_tabs), '--switches', str(args.switches),
+               '--size-mb', str(args.size_mb), '--rate-kb', str(args.rate_kb)]
+    process = subprocess.run(command, env=env, capture_output=True, text=True, encoding='utf-8')
+    try:
+        # Последняя строка — результаты, выше могут быть сообщения браузера
+        return json.loads(process.stdout.strip().splitlines()[-1])['results']
+    except (ValueError, IndexError):
+        return [{'name': 'browser', 'ok': False, 'error': process.stderr[-2000:]}]
+
+def synthetic_filters(count, rng):
+    # Похоже на EasyList: в основном домены, остальное — пути и опции
+    words = ['ad', 'ads', 'banner', 'track', 'pixel', 'promo', 'sponsor', 'analytics',
+             'beacon', 'popunder', 'affiliate', 'metrics', 'tag', 'stats', 'click']
+    lines = ['[Adblock Plus 2.0]', '! Синтетический список для замеров']
+    for i in range(count):
+        kind = rng.random()
+        word = rng.choice(words)
+        if kind < 0.55:
+            lines.append(f'||{word}{i}.{rng.choice(["com", "net", "io"])}^')
+        elif kind < 0.75:
+            lines.append(f'/{word}/{rng.choice(words)}{i}/*')
+        elif kind < 0.85:
+            lines.append(f'||cdn{i}.example.net/{word}/*$script,third-party')
+        elif kind < 0.93:
+            lines.append(f'&{word}_{i}=')
+        elif kind < 0.97:
+            lines.append(f'@@||{word}{i}.com/allowed/*')
+        else:
+            lines.append(f'example{i}.com##.{word}')
+    return lines
+
+def synthetic_requests(count, filters, rng):
+    # Большая часть запросов — обычные ресурсы страниц, около 15% — реклама
+    blocked_hosts = [line[2:-1] for line in filters if line.startswith('||') and line.endswith('^')]
+    sites = [f'site{i}.com' for i in range(200)]
+    types = ['script', 'image', 'stylesheet', 'xmlhttprequest', 'font', 'subdocument']
+    requests = []
+    for i in range(count):
+        first_party = rng.choice(sites)
+        if rng.random() < 0.15:
+            host = rng.choice(blocked_hosts)
+        else:
+            host = rng.choice([first_party, f'static.{first_party}', 'cdn.jsdelivr.net',
+                               'fonts.gstatic.com', 'www.google-analytics.com'])
+        url = f'https://{host}/assets/{rng.choice(["app", "vendor", "img", "css"])}/{i}.js?v={i % 7}'
+        requests.append((url, host, first_party, rng.choice(types)))
+    return requests
+
+def read_requests(path):
+    # Записанные запросы: адрес, затем необязательно хост страницы и тип
+    requests = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            url = fields[0]
+            host = urllib.parse.urlsplit(url).hostname or ''
+            first_party = fields[1] if len(fields) > 1 else ''
+            resource_type = fields[2] if len(fields) > 2 else 'other'
+            requests.append((url, host, first_party, resource_type))
+    return requests
+
+def run_blocker(args, workdir):
+    rng = random.Random(0)
+    if args.filters:
+        files = args.filters.split(',')
+    else:
+        path = os.path.join(workdir, 'synthetic.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(synthetic_filters(args.filter_rules, rng)))
+        files = [path]
+    cache_path = os.path.join(workdir, 'filters.cache')
+
+    began = time.perf_counter()
+    index = web.FilterIndex.load(files, cache_path)
+    parse_seconds = time.perf_counter() - began
+    began = time.perf_counter()
+    index = web.FilterIndex.load(files, cache_path)
+    cache_seconds = time.perf_counter() - began
+
+    if args.requests:
+        requests = read_requests(args.requests)
+    else:
+        lines = []
+        for path in files:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                lines.extend(line.strip() for line in f)
+        requests = synthetic_requests(args.request_count, lines, rng)
+
+    # Первый проход компилирует выражения, замеряется второй
+    for request in requests:
+        index.should_block(*request)
+    samples = []
+    blocked = 0
+    for request in requests:
+        began = time.perf_counter()
+        if index.should_block(*request):
+            blocked += 1
+        samples.append(time.perf_counter() - began)
+
+    return [{
+        'name': 'content_blocker',
+        'rules': index.size(),
+        'parse_ms': round(parse_seconds * 1000, 1),
+        'cache_load_ms': round(cache_seconds * 1000, 1),
+        'cache_bytes': os.path.getsize(cache_path),
+        'requests': len(requests),
+        'blocked': blocked,
+        'mean_us': round(sum(samples) / len(samples) * 1e6, 2),
+        'p50_us': round(percentile(samples, 0.5) * 1e6, 2),
+        'p99_us': round(percentile(samples, 0.99) * 1e6, 2),
+        'max_us': round(max(samples) * 1e6, 2),
+    }]
+
+def synthetic_mhtml(index, shared, rng):
+    # MHTML как у Chromium: уникальная страница плюс общие ресурсы сайта
+    boundary = f'----MultipartBoundary--{index:08d}'
+    url = f'https://intranet.example.com/report/{index}'
+    html = fixture_page(index) + rng.randbytes(4096).hex().encode('ascii')
+    parts = [('text/html', url, html)]
+    parts.extend(shared)
+    parts.append(('image/png', f'{url}/chart.png', rng.randbytes(20000)))
+    chunks = [f'From: <Saved by Blink>\r\nSnapshot-Content-Location: {url}\r\n'
+              f'Subject: Report {index}\r\nMIME-Version: 1.0\r\n'
+              f'Content-Type: multipart/related;\r\n\ttype="text/html";\r\n'
+              f'\tboundary="{boundary}"\r\n\r\n'.encode('ascii')]
+    for content_type, location, data in parts:
+        chunks.append(f'--{boundary}\r\nContent-Type: {content_type}\r\n'
+                      f'Content-Transfer-Encoding: base64\r\n'
+                      f'Content-Location: {location}\r\n\r\n'.encode('ascii'))
+        chunks.append(base64.encodebytes(data).replace(b'\n', b'\r\n'))
+        chunks.append(b'\r\n')
+    chunks.append(f'--{boundary}--\r\n'.encode('ascii'))
+    return url, b''.join(chunks)
+
+def run_archive(args, workdir):
+    rng = random.Random(0)
+    shared = [
+        ('text/css', 'https://intranet.example.com/static/app.css', rng.randbytes(100 * 1024)),
+        ('application/javascript', 'https://intranet.example.com/static/app.js', rng.randbytes(300 * 1024)),
+        ('font/woff2', 'https://intranet.example.com/static/font.woff2', rng.randbytes(80 * 1024)),
+    ]
+    pages = [synthetic_mhtml(i, shared, rng) for i in range(args.archive_pages)]
+    source = os.path.join(workdir, 'page.mhtml')
+
+    # Как раньше: каждая страница целиком в своем файле
+    plain_dir = os.path.join(workdir, 'plain')
+    os.makedirs(plain_dir)
+    began = time.perf_counter()
+    for i, (url, data) in enumerate(pages):
+        with open(os.path.join(plain_dir, f'{i}.mhtml'), 'wb') as f:
+            f.write(data)
+    plain_seconds = time.perf_counter() - began
+    plain_bytes = web.directory_size(plain_dir)
+
+    store = web.ArchiveStore(os.path.join(workdir, 'archive'))
+    ingest = []
+    for url, data in pages:
+        with open(source, 'wb') as f:
+            f.write(data)
+        began = time.perf_counter()
+        store.add_mhtml(source, url)
+        ingest.append(time.perf_counter() - began)
+    stored_bytes = web.directory_size(store.root)
+
+    manifest = os.path.join(store.pages_path, sorted(os.listdir(store.pages_path))[0])
+    exported = store.export_mhtml(manifest, os.path.join(workdir, 'exported.mhtml'))
+    with open(exported, 'rb') as f:
+        restored = email.message_from_binary_file(f)
+    ok = len([part for part in restored.walk() if not part.is_multipart()]) == len(shared) + 2
+
+    return [{
+        'name': 'archive',
+        'pages': len(pages),
+        'plain_bytes': plain_bytes,
+        'archive_bytes': stored_bytes,
+        'space_ratio': round(stored_bytes / plain_bytes, 3),
+        'plain_write_ms': round(plain_seconds * 1000, 1),
+        'ingest_ms': round(sum(ingest) * 1000, 1),
+        'ingest_p50_ms': round(percentile(ingest, 0.5) * 1000, 2),
+        'export_ok': ok,
+    }]
+
+def read_offline_page(store, urls):
+    # Как схема archive:// отдает страницу: каждая часть ищется по адресу
+    # и читается кусками по 64 КБ через MappedReply
+    total = 0
+    for url in urls:
+        reply = web.MappedReply(store.body(store.lookup(url)))
+        while not reply.atEnd():
+            total += len(reply.read(64 * 1024))
+    return total
+
+def run_offline(args, workdir):
+    rng = random.Random(0)
+    shared = [
+        ('text/css', 'https://intranet.example.com/static/app.css', rng.randbytes(100 * 1024)),
+        ('application/javascript', 'https://intranet.example.com/static/app.js', rng.randbytes(300 * 1024)),
+    ]
+    pages = [synthetic_mhtml(i, shared, rng) for i in range(args.archive_pages)]
+    source = os.path.join(workdir, 'page.mhtml')
+
+    store = web.OfflineStore(os.path.join(workdir, 'offline'))
+    archive = web.ArchiveStore(os.path.join(workdir, 'archive'))
+    ingest = []
+    for url, data in pages:
+        with open(source, 'wb') as f:
+            f.write(data)
+        began = time.perf_counter()
+        store.add_mhtml(source, url)
+        ingest.append(time.perf_counter() - began)
+        archive.add_mhtml(source, url)
+
+    began = time.perf_counter()
+    reopened = web.OfflineStore(store.root)
+    index_load = time.perf_counter() - began
+
+    # Открытие страницы: из офлайн-хранилища и прежним путем, сборкой MHTML
+    sample = pages[::max(1, len(pages) // 20)]
+    offline_open = []
+    for url, _ in sample:
+        began = time.perf_counter()
+        read_offline_page(reopened, [url, f'{url}/chart.png'] + [part[1] for part in shared])
+        offline_open.append(time.perf_counter() - began)
+    manifests = sorted(os.listdir(archive.pages_path))[::max(1, len(pages) // 20)]
+    export_open = []
+    for name in manifests:
+        began = time.perf_counter()
+        archive.export_mhtml(os.path.join(archive.pages_path, name), os.path.join(workdir, 'out.mhtml'))
+        export_open.append(time.perf_counter() - began)
+
+    segments = [name for name in os.listdir(store.root) if name.endswith('.warc')]
+    stored = sum(os.path.getsize(os.path.join(store.root, name)) for name in segments)
+    return [
+        timing_summary('offline_ingest', ingest, pages=len(pages)),
+        timing_summary('offline_open', offline_open, engine='mmap'),
+        timing_summary('offline_open', export_open, engine='export_mhtml'),
+        {
+            'name': 'offline_store',
+            'pages': len(reopened.pages),
+            'entries': len(reopened.entries),
+            'segment_bytes': stored,
+            'index_bytes': os.path.getsize(reopened.index_path),
+            'index_load_ms': round(index_load * 1000, 2),
+        },
+    ]
+
+def fixture_images(count, rng):
+    # PNG разных размеров, каждая десятая повторяет предыдущую под другим адресом
+    files = {}
+    previous = None
+    for i in range(count):
+        if previous is not None and i % 10 == 9:
+            data = previous
+        else:
+            image = QImage(rng.randint(400, 1600), rng.randint(300, 1200), QImage.Format_RGB32)
+            image.fill(QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+            buffer = QBuffer()
+            buffer.open(QIODevice.WriteOnly)
+            image.save(buffer, 'PNG')
+            data = previous = bytes(buffer.data())
+        files[f'/gallery/{i}.png'] = data
+    return files
+
+def run_images(args, workdir):
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])
+    rng = random.Random(0)
+    files = fixture_images(args.images, rng)
+    server, base_url = start_fixture_server(files, args.rate_kb * 1024, args.latency_ms / 1000)
+    urls = [base_url + path for path in files]
+    results = []
+    for parallel in (1, web.IMAGE_MAX_PARALLEL):
+        harvester = web.ImageHarvester(max_parallel=parallel)
+        done = []
+        harvester.finished.connect(done.append)
+        directory = os.path.join(workdir, f'images-{parallel}')
+        began = time.perf_counter()
+        harvester.harvest(urls, directory, base_url)
+        wait_for(lambda: done, 600)
+        elapsed = time.perf_counter() - began
+        harvester.close()
+        stats = done[0] if done else {}
+        results.append({
+            'name': 'image_harvest',
+            'parallel': parallel,
+            'images': len(urls),
+            'saved': stats.get('saved'),
+            'duplicates': stats.get('duplicates'),
+            'failed': stats.get('failed'),
+            'seconds': round(elapsed, 3),
+            'images_per_s': round(len(urls) / elapsed, 1),
+        })
+    server.shutdown()
+    app.processEvents()
+    return results
+
+def run_segmented(args, workdir):
+    size = args.size_mb * 1024 * 1024
+    files = {'/large.bin': os.urandom(size)}
+    server, base_url = start_fixture_server(files, args.rate_kb * 1024)
+    results = []
+    for connections in [int(n) for n in args.connections.split(',')]:
+        results.append(bench_segmented_download(base_url, files['/large.bin'],
+                                                connections, workdir))
+    server.shutdown()
+    return results
+
+def run_history(args, workdir):
+    store = web.HistoryStore(os.path.join(workdir, 'history.db'))
+    conn = fill_history(store, args.history_size)
+    queries = ['g', 'git', 'jira', 'github12', 'dash rep', 'docs/pyth', 'https://www.gra', 'zzz']
+    return bench_history_search(conn, store, queries)
+
+def run_omnibox(args, workdir):
+    store = web.HistoryStore(os.path.join(workdir, 'omnibox.db'))
+    conn = fill_history(store, args.history_size // 10)
+    tabs = [(i, f'https://intranet.example.com/report/{i}', f'Отчет {i}')
+            for i in range(args.tabs)]
+    history = web.History(store)
+    omnibox = web.Omnibox(history, lambda: tabs)
+    inputs = ['github.com/phancyn/mini-Browser', 'how to profile qt event loop',
+              'localhost:8080/dashboard', 'отчет 42', 'jira1234.org/browse/ABC-1']
+    results = bench_omnibox_keystrokes(omnibox, store, conn, inputs)
+    history.close()
+    return results
+
+def run_tabsearch(args, workdir):
+    # Индекс по тексту args.tabs вкладок: синтетические страницы по 3000 слов
+    # и номер задачи в каждой, как в трекере
+    rng = random.Random(0)
+    vocabulary = [''.join(rng.choice('абвгдежзиклмнопрстуфхцчшэюя') for _ in range(rng.randint(3, 10)))
+                  for _ in range(50000)]
+    index = web.TabTextIndex()
+    indexing = []
+    for tab_id in range(args.tabs):
+        text = ' '.join(rng.choice(vocabulary) for _ in range(3000)) + f' Задача PROJ-{tab_id}'
+        began = time.perf_counter()
+        index.process(tab_id, f'Вкладка {tab_id}', f'https://tracker.example.com/{tab_id}', text)
+        indexing.append(time.perf_counter() - began)
+    queries = ['proj-42', 'задача proj', vocabulary[7], vocabulary[7][:3],
+               f'{vocabulary[1]} {vocabulary[2]}', 'несуществующее']
+    results = [timing_summary('tab_search_index', indexing, words=index.stats()[1])]
+    for text in queries:
+        samples = []
+        for _ in range(20):
+            began = time.perf_counter()
+            found = index.search(text)
+            samples.append(time.perf_counter() - began)
+        results.append(timing_summary('tab_search_query', samples, query=text, results=len(found)))
+    index.close()
+    return results
+
+def run_network(args, workdir):
+    # Цена записи одного запроса в журнал и сборка HAR по заполненному буферу
+    rng = random.Random(0)
+    recorder = web.NetworkRecorder()
+    urls = [f'https://cdn{rng.randrange(20)}.example.com/static/{rng.randrange(10 ** 6)}.js'
+            for _ in range(1000)]
+    count = args.request_count
+    began = time.perf_counter()
+    for i in range(count):
+        # Запросы десяти вкладок вперемешку
+        recorder.record(i % 10, 1, 'GET', urls[i % len(urls)])
+    record_seconds = time.perf_counter() - began
+
+    tab_id = 0
+    timing = [{'name': url, 'startTime': 10.0, 'duration': 40.0, 'domainLookupStart': 10.0,
+               'domainLookupEnd': 12.0, 'connectStart': 12.0, 'connectEnd': 20.0,
+               'requestStart': 21.0, 'responseStart': 35.0, 'responseEnd': 50.0,
+               'transferSize': 2048, 'encodedBodySize': 1800, 'decodedBodySize': 6000}
+              for url in urls]
+    began = time.perf_counter()
+    exported = recorder.export_har(os.path.join(workdir, 'tab.har'), tab_id, 'Вкладка', '', timing)
+    export_seconds = time.perf_counter() - began
+    return [{
+        'name': 'network_record',
+        'requests': count,
+        'buffer': len(recorder.records),
+        'ns_per_request': round(record_seconds / count * 1e9),
+    }, {
+        'name': 'network_har_export',
+        'entries': exported,
+        'ms': round(export_seconds * 1000, 1),
+        'bytes': os.path.getsize(os.path.join(workdir, 'tab.har')),
+    }]
+
+SUITES = {
+    'segmented': run_segmented,
+    'history': run_history,
+    'omnibox': run_omnibox,
+    'browser': run_browser,
+    'blocker': run_blocker,
+    'archive': run_archive,
+    'images': run_images,
+    'offline': run_offline,
+    'tabsearch': run_tabsearch,
+    'network': run_network,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры производительности браузера')
+    parser.add_argument('suites', nargs='*', default=list(SUITES),
+                        help='какие замеры запускать: ' + ', '.join(SUITES))
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--connections', default='1,2,4,8')
+    parser.add_argument('--rate-kb', type=int, default=4096,
+                        help='ограничение скорости одного соединения на сервере, КБ/с')
+    parser.add_argument('--history-size', type=int, default=1000000)
+    parser.add_argument('--tabs', type=int, default=500)
+    parser.add_argument('--browser-tabs', type=int, default=20,
+                        help='сколько вкладок открывает замер browser')
+    parser.add_argument('--switches', type=int, default=200)
+    parser.add_argument('--filters', help='списки фильтров через запятую (по умолчанию синтетический)')
+    parser.add_argument('--filter-rules', type=int, default=60000,
+                        help='правил в синтетическом списке')
+    parser.add_argument('--requests', help='записанные запросы: адрес [хост страницы] [тип] в строке')
+    parser.add_argument('--request-count', type=int, default=50000,
+                        help='запросов, если записанного списка нет')
+    parser.add_argument('--archive-pages', type=int, default=200)
+    parser.add_argument('--images', type=int, default=300, help='картинок в галерее')
+    parser.add_argument('--latency-ms', type=int, default=50,
+                        help='задержка ответа сервера в замере images')
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    parser.add_argument('--browser-child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.browser_child:
+        results = run_browser_child(args)
+        print(json.dumps({'results': results}, ensure_ascii=False))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.suites:
+            results.extend(SUITES[name](args, workdir))
+
+    report = json.dumps({'results': results}, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+    print(report)
+
+if __name__ == '__main__':
+    main()
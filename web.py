@@ -1,79 +1,5193 @@
 import sys
 import os
-from PyQt5.QtCore import *
-from PyQt5.QtWidgets import *
-from PyQt5.QtWebEngineWidgets import *
-from PyQt5.QtGui import *
+import time
+
+# Отсчет трассировки запуска — до импорта Qt, который занимает заметную часть
+startup_began = time.perf_counter()
+
+from PyQt5.QtCore import (QAbstractListModel, QAbstractTableModel, QIODevice,
+                          QIdentityProxyModel, QModelIndex, QObject, QPointF, QRect, QSize,
+                          QSortFilterProxyModel, QTimer, QUrl, Qt, pyqtSignal)
+from PyQt5.QtWidgets import (QAbstractItemView, QAction, QApplication,
+                             QCheckBox, QCompleter, QDialog, QDockWidget, QFileDialog,
+                             QFormLayout, QHBoxLayout, QHeaderView, QLabel,
+                             QLineEdit, QListView, QMainWindow, QMenu,
+                             QMessageBox, QPushButton, QSpinBox, QStyle,
+                             QStyleOptionProgressBar, QStyledItemDelegate,
+                             QTableView, QTabWidget, QToolBar, QToolButton,
+                             QVBoxLayout, QWidget)
+from PyQt5.QtWebEngineWidgets import (QWebEngineDownloadItem, QWebEnginePage,
+                                      QWebEngineProfile, QWebEngineView)
+from PyQt5.QtWebEngineCore import (QWebEngineUrlRequestInfo,
+                                   QWebEngineUrlRequestInterceptor,
+                                   QWebEngineUrlRequestJob, QWebEngineUrlScheme,
+                                   QWebEngineUrlSchemeHandler)
+from PyQt5.QtNetwork import QLocalServer
+from PyQt5.QtGui import (QColor, QDesktopServices, QFont, QFontMetrics, QIcon, QImage,
+                         QStandardItem, QStandardItemModel)
 import shutil
+import json
+import queue
+import signal
+import threading
+import urllib.parse
+import urllib.request
+import http.cookiejar
+import sqlite3
+import math
+import argparse
+import contextlib
+import functools
+import inspect
+import traceback
+import bisect
+import re
+import ipaddress
+import mimetypes
+import pickle
+import email
+import email.parser
+import email.header
+import mmap
+import uuid
+import base64
+import binascii
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque, namedtuple
 from pathlib import Path
 
-# Скрываем консоль Windows
-if sys.platform == 'win32':
-    import win32gui
-    import win32con
-    # Скрываем консоль
-    hwnd = win32gui.GetForegroundWindow()
-    win32gui.ShowWindow(hwnd, win32con.SW_HIDE)
+# Скрываем консоль Windows (только при запуске, не при импорте)
+if sys.platform == 'win32' and __name__ == '__main__':
+    import win32gui
+    import win32con
+    # Скрываем консоль
+    hwnd = win32gui.GetForegroundWindow()
+    win32gui.ShowWindow(hwnd, win32con.SW_HIDE)
+
+# Трассировка запуска: python web.py --trace-startup
+STARTUP_DEFER_TIMEOUT = 1000     # мс, запасной запуск, если окно не отрисовалось
+
+class StartupTrace:
+    def __init__(self, enabled, began):
+        self.enabled = enabled
+        self.began = began
+        self.marks = []
+        self.reported = False
+
+    def mark(self, name):
+        if self.enabled:
+            self.marks.append((name, time.perf_counter()))
+
+    def report(self):
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        lines = ['Запуск (мс):']
+        previous = self.began
+        for name, moment in self.marks:
+            lines.append(f"  {name:<20} {(moment - previous) * 1000:8.1f}"
+                         f"   всего {(moment - self.began) * 1000:8.1f}")
+            previous = moment
+        print('\n'.join(lines), file=sys.stderr)
+
+startup_trace = StartupTrace('--trace-startup' in sys.argv, startup_began)
+
+# Трассировка интерфейса: python web.py --trace-ui
+# Обработчики и зависания цикла событий пишутся в формате Chrome trace,
+# файл открывается в chrome://tracing или ui.perfetto.dev
+STALL_CHECK_INTERVAL = 50        # мс между отметками цикла событий
+STALL_THRESHOLD = 250            # мс опоздания, после которых снимается стек
+TRACE_MAX_EVENTS = 200000        # событий в кольцевом буфере
+
+class UiTracer:
+    # События трассировки копятся в кольцевом буфере; deque.append
+    # потокобезопасен, поэтому писать могут и рабочие потоки
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.began = time.perf_counter()
+        self.pid = os.getpid()
+        self.events = deque(maxlen=TRACE_MAX_EVENTS)
+        self.thread_names = {}
+
+    def timestamp(self, moment=None):
+        return round(((moment or time.perf_counter()) - self.began) * 1e6, 1)
+
+    def thread_id(self):
+        tid = threading.get_native_id()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        return tid
+
+    def complete(self, name, began, ended, tid=None, args=None):
+        event = {'name': name, 'ph': 'X', 'ts': self.timestamp(began),
+                 'dur': round((ended - began) * 1e6, 1), 'pid': self.pid,
+                 'tid': tid or self.thread_id()}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def instant(self, name, tid=None, args=None):
+        event = {'name': name, 'ph': 'i', 's': 't', 'ts': self.timestamp(),
+                 'pid': self.pid, 'tid': tid or self.thread_id()}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        if not self.enabled:
+            yield
+            return
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, began, time.perf_counter(), args=args)
+
+    def save(self, path):
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid,
+                     'args': {'name': name}} for tid, name in list(self.thread_names.items())]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + list(self.events), 'displayTimeUnit': 'ms'},
+                      f, ensure_ascii=False)
+        return len(self.events)
+
+ui_tracer = UiTracer('--trace-ui' in sys.argv)
+
+def traced(name):
+    # Отрезок трассировки вокруг обработчика. Лишние аргументы сигнала
+    # отбрасываются, как это делает PyQt для обычного метода
+    def decorate(func):
+        code = func.__code__
+        limit = None if code.co_flags & inspect.CO_VARARGS else code.co_argcount
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if limit is not None:
+                args = args[:limit]
+            if not ui_tracer.enabled:
+                return func(*args, **kwargs)
+            with ui_tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+class StallWatchdog(QObject):
+    # Таймер в потоке интерфейса ставит отметку каждые STALL_CHECK_INTERVAL мс,
+    # отдельный поток проверяет, как давно она была. Если цикл событий стоит
+    # дольше STALL_THRESHOLD, поток снимает стек главного потока, пока тот
+    # не освободится; по окончании зависание попадает в трассировку и stderr.
+    def __init__(self, registry=None, parent=None):
+        super().__init__(parent)
+        self.registry = registry
+        self.main_ident = threading.get_ident()
+        self.main_tid = threading.get_native_id()
+        self.lock = threading.Lock()
+        self.samples = []
+        self.last_tick = time.perf_counter()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stalls = 0
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.setInterval(STALL_CHECK_INTERVAL)
+        self.timer.timeout.connect(self.tick)
+        if registry is not None:
+            registry.describe('browser_ui_event_loop_lag_seconds', 'histogram',
+                              'Опоздание цикла событий интерфейса')
+            registry.describe('browser_ui_stalls_total', 'counter',
+                              f'Зависания интерфейса дольше {STALL_THRESHOLD} мс')
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.last_tick = time.perf_counter()
+        # Как в ProcessSampler: свое событие на каждый поток, иначе
+        # остановленный поток, не успевший проснуться, продолжит работу
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.watch, args=(self.stop_event,),
+                                       name='StallWatchdog', daemon=True)
+        self.thread.start()
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+        self.stop_event.set()
+        self.thread = None
+
+    def tick(self):
+        now = time.perf_counter()
+        lag = max(0.0, now - self.last_tick - STALL_CHECK_INTERVAL / 1000)
+        began = self.last_tick
+        self.last_tick = now
+        if self.registry is not None:
+            self.registry.observe('browser_ui_event_loop_lag_seconds', lag)
+        with self.lock:
+            samples, self.samples = self.samples, []
+        if lag * 1000 < STALL_THRESHOLD:
+            return
+        self.stalls += 1
+        if self.registry is not None:
+            self.registry.inc('browser_ui_stalls_total')
+        # Первый снимок стека показывает, где цикл событий застрял
+        stack = samples[0][1] if samples else ''
+        ui_tracer.complete('Зависание интерфейса', began, now, tid=self.main_tid,
+                           args={'lag_ms': round(lag * 1000), 'stack': stack})
+        print(f"Зависание интерфейса {lag * 1000:.0f} мс" +
+              (f", стек:\n{stack}" if stack else ''), file=sys.stderr)
+
+    def watch(self, stop_event):
+        last_sample = 0.0
+        while not stop_event.wait(STALL_CHECK_INTERVAL / 2000):
+            now = time.perf_counter()
+            stalled = now - self.last_tick - STALL_CHECK_INTERVAL / 1000
+            if stalled * 1000 < STALL_THRESHOLD or now - last_sample < STALL_THRESHOLD / 1000:
+                continue
+            last_sample = now
+            frame = sys._current_frames().get(self.main_ident)
+            if frame is None:
+                continue
+            stack = ''.join(traceback.format_stack(frame))
+            del frame
+            with self.lock:
+                self.samples.append((now, stack))
+            # Каждый снимок виден на шкале главного потока
+            ui_tracer.instant('Стек при зависании', tid=self.main_tid,
+                              args={'stalled_ms': round(stalled * 1000), 'stack': stack})
+
+# Создаем папку для загрузок, если её нет
+downloads_path = os.path.join(os.path.expanduser('~'), 'Downloads', 'WebBrowser')
+if not os.path.exists(downloads_path):
+    os.makedirs(downloads_path)
+
+# Папка для данных браузера (сессия и т.п.)
+app_data_path = os.path.join(os.path.expanduser('~'), '.webbrowser')
+if not os.path.exists(app_data_path):
+    os.makedirs(app_data_path)
+
+session_path = os.path.join(app_data_path, 'session.jsonl')
+SESSION_COMPACT_AFTER = 500      # записей в журнале до его сжатия
+
+# Постоянный профиль и HTTP-кэш
+PROFILE_NAME = 'WebBrowser'
+profile_path = os.path.join(app_data_path, 'profile')
+cache_path = os.path.join(app_data_path, 'cache')
+HTTP_CACHE_TYPE = 'disk'         # 'disk' или 'memory'
+HTTP_CACHE_SIZE_MB = 512         # предельный размер кэша на диске
+CACHE_USAGE_INTERVAL = 30000     # мс между пересчетами размера кэша в окне «Кэш»
+
+# История посещений
+history_db_path = os.path.join(app_data_path, 'history.db')
+HISTORY_SUGGESTIONS = 8          # подсказок в строке адреса
+HISTORY_HALF_LIFE_DAYS = 14      # через сколько дней посещение весит вдвое меньше
+HISTORY_SCAN_LIMIT = 5000        # сколько строк может просмотреть один запрос
+HISTORY_QUERY_BUDGET_MS = 8      # предел времени на полнотекстовый поиск
+HISTORY_PREFIX_BONUS = 4         # совпадение по началу адреса важнее совпадения слова
+
+# Строка адреса: адрес или поисковый запрос
+public_suffix_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public_suffix_list.dat')
+OMNIBOX_SCHEMES = {'http', 'https', 'ftp', 'file', 'about', 'data', 'view-source',
+                   'chrome', 'qrc', 'blob'}
+OMNIBOX_SCHEME_RE = re.compile(r'^([a-zA-Z][a-zA-Z0-9+.-]*):')
+OMNIBOX_LABEL_RE = re.compile(r'^(?!-)[\w-]{1,63}(?<!-)$')
+OMNIBOX_DEBOUNCE_MS = 40         # пауза в наборе перед поиском по истории
+OMNIBOX_TAB_SUGGESTIONS = 3      # сколько открытых вкладок подсказывать
+
+# Блокировка запросов по спискам фильтров в формате EasyList:
+# списки (*.txt) кладутся в filters_path
+filters_path = os.path.join(app_data_path, 'filters')
+if not os.path.exists(filters_path):
+    os.makedirs(filters_path)
+filters_cache_path = os.path.join(app_data_path, 'filters.cache')
+CONTENT_BLOCKING = True
+FILTER_CACHE_VERSION = 1
+FILTER_TOKEN_RE = re.compile(r'[a-z0-9%]+')
+FILTER_COMMON_TOKENS = {'http', 'https', 'www', 'com', 'net', 'org', 'js', 'html', 'php'}
+FILTER_DOMAIN_RE = re.compile(r'^\|\|[a-z0-9.-]+\^$')
+FILTER_TYPES = {'script', 'image', 'stylesheet', 'object', 'xmlhttprequest', 'subdocument',
+                'ping', 'media', 'font', 'websocket', 'other'}
+FILTER_TYPE_ALIASES = {'xhr': 'xmlhttprequest', 'frame': 'subdocument', 'css': 'stylesheet'}
+# Типы запросов QtWebEngine в типы опций фильтров; None — не фильтруется
+FILTER_RESOURCE_TYPES = {
+    QWebEngineUrlRequestInfo.ResourceTypeMainFrame: None,
+    QWebEngineUrlRequestInfo.ResourceTypeSubFrame: 'subdocument',
+    QWebEngineUrlRequestInfo.ResourceTypeStylesheet: 'stylesheet',
+    QWebEngineUrlRequestInfo.ResourceTypeScript: 'script',
+    QWebEngineUrlRequestInfo.ResourceTypeImage: 'image',
+    QWebEngineUrlRequestInfo.ResourceTypeFontResource: 'font',
+    QWebEngineUrlRequestInfo.ResourceTypeObject: 'object',
+    QWebEngineUrlRequestInfo.ResourceTypeMedia: 'media',
+    QWebEngineUrlRequestInfo.ResourceTypeFavicon: 'image',
+    QWebEngineUrlRequestInfo.ResourceTypeXhr: 'xmlhttprequest',
+    QWebEngineUrlRequestInfo.ResourceTypePing: 'ping',
+}
+
+# Журнал сетевых запросов вкладок для экспорта в HAR
+NETWORK_RECORDING = True         # писать запросы в кольцевой буфер
+NETWORK_LOG_SIZE = 20000         # запросов в буфере, старые вытесняются
+NETWORK_RESOURCE_TYPES = dict(FILTER_RESOURCE_TYPES)
+NETWORK_RESOURCE_TYPES[QWebEngineUrlRequestInfo.ResourceTypeMainFrame] = 'document'
+
+# Архив страниц: ресурсы хранятся один раз под своим SHA-256
+archive_path = os.path.join(downloads_path, 'Archive')
+ARCHIVE_MAX_IN_FLIGHT = 4        # страниц загружается и сохраняется одновременно
+ARCHIVE_TIMEOUT = 120            # секунд на загрузку и сохранение одной страницы
+
+# Офлайн-копии посещенных страниц, открываются как archive://адрес
+offline_path = os.path.join(app_data_path, 'offline')
+OFFLINE_SCHEME = 'archive'
+OFFLINE_CAPTURE = False          # сохранять каждую загруженную страницу (включается в меню)
+OFFLINE_RECAPTURE_AFTER = 24 * 3600  # секунд, пока копия считается свежей
+OFFLINE_SEGMENT_SIZE = 256 * 1024 * 1024
+OFFLINE_MAX_BYTES = 1024 * 1024 * 1024  # предел на диске; сверх него старые страницы удаляются
+OFFLINE_COMPACT_TARGET = 0.75    # до какой доли предела сжимать хранилище
+OFFLINE_EXCLUDED_HOSTS = []      # сайты (и их поддомены), которые не сохраняются
+
+# Управление из скриптов: python web.py --control, JSON-RPC через локальный сокет
+CONTROL_SERVER = '--control' in sys.argv
+control_socket_name = ('webbrowser-control' if sys.platform == 'win32'
+                       else os.path.join(app_data_path, 'control.sock'))
+# Пакетная обработка адресов скрытыми страницами; каждая загружающаяся
+# страница занимает процесс рендерера, поэтому предел — по числу ядер
+RENDER_POOL_SIZE = min(8, os.cpu_count() or 4)
+RENDER_TIMEOUT = 60              # секунд на загрузку и обработку одного адреса
+RENDER_VIEWPORT = (1280, 800)    # px, размер окна для снимков
+RENDER_MAX_HEIGHT = 16384        # px, предел высоты снимка всей страницы
+RENDER_PAINT_DELAY = 300         # мс на отрисовку перед снимком
+RENDER_HEIGHT_JS = 'Math.max(document.documentElement.scrollHeight, document.body ? document.body.scrollHeight : 0)'
+
+# Метрики страниц
+METRICS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)   # секунды
+METRICS_PAGE_LOG = 500           # последних загрузок с полным адресом
+# Файл, куда метрики периодически выгружаются (например, для textfile-коллектора
+# node_exporter, с расширением .prom); None — только ручной экспорт из меню
+metrics_export_path = None
+METRICS_EXPORT_INTERVAL = 60000  # мс
+
+# Трассировки интерфейса (--trace-ui)
+traces_path = os.path.join(app_data_path, 'traces')
+
+# Параметры жизненного цикла фоновых вкладок
+TAB_FREEZE_DELAY = 60            # секунд в фоне до заморозки вкладки
+TAB_MEMORY_BUDGET_MB = 2048      # бюджет памяти на все вкладки
+TAB_ESTIMATED_MEMORY_MB = 150    # оценка, если память процесса узнать нельзя
+TAB_CHECK_INTERVAL = 5000        # мс между проверками вкладок
+
+# Миниатюры вкладок для обзора
+thumbnails_path = os.path.join(app_data_path, 'thumbnails')
+THUMBNAIL_SIZE = 240             # px по ширине, высота 10:16
+THUMBNAIL_CACHE_MB = 32          # миниатюр в памяти, остальные на диске
+THUMBNAIL_DELAY = 700            # мс после загрузки, чтобы страница отрисовалась
+THUMBNAIL_FORMAT = 'JPG'
+THUMBNAIL_QUALITY = 80
+
+# Поиск по тексту открытых вкладок
+TAB_SEARCH_DELAY = 1000          # мс после загрузки, чтобы скрипты дорисовали страницу
+TAB_SEARCH_MAX_CHARS = 200000    # символов текста с одной страницы
+TAB_SEARCH_RESULTS = 50
+TAB_SEARCH_PREFIX_WORDS = 64     # слов, подходящих под недописанное слово
+TAB_SEARCH_SNIPPET = 160         # символов в отрывке с совпадением
+TAB_SEARCH_RETRY_TIMEOUT = 30000 # мс ждать загрузки вкладки для повторного поиска
+
+# Запас готовых вкладок и предзагрузка подсказки строки адреса
+VIEW_POOL_SIZE = 2               # вкладок в запасе
+VIEW_POOL_FILL_DELAY = 500       # мс простоя перед подготовкой следующей
+SPECULATIVE_PRELOAD = False      # загружать первую подсказку до нажатия Enter
+PRELOAD_DELAY = 300              # мс паузы в наборе перед предзагрузкой
+PRELOAD_MAX_AGE = 30             # секунд, после которых предзагрузка устаревает
+
+# Диспетчер задач
+TASK_MANAGER_INTERVAL = 2.0      # секунд между замерами процессов
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+def process_rss(pid):
+    # Возвращает занятую процессом память в байтах или None
+    if not pid:
+        return None
+    try:
+        if sys.platform.startswith('linux'):
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+            return None
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+class TabRecord:
+    def __init__(self, view):
+        self.view = view
+        self.url = view.url()
+        self.title = 'Новая вкладка'
+        self.scroll = QPointF()
+        self.pending_scroll = None
+        self.state = TabLifecycleManager.ACTIVE
+        self.last_active = time.monotonic()
+
+class TabLifecycleManager(QObject):
+    ACTIVE = 'active'
+    FROZEN = 'frozen'
+    DISCARDED = 'discarded'
+
+    def __init__(self, tabs, memory_budget_mb=TAB_MEMORY_BUDGET_MB,
+                 freeze_delay=TAB_FREEZE_DELAY, parent=None):
+        super().__init__(parent)
+        self.tabs = tabs
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.freeze_delay = freeze_delay
+        # Порядок LRU: в начале вкладки, которые дольше всех не открывали
+        self.records = OrderedDict()
+        self.tabs.currentChanged.connect(self.tab_activated)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(TAB_CHECK_INTERVAL)
+        self.timer.timeout.connect(self.check_tabs)
+        self.timer.start()
+
+    def track(self, view):
+        record = TabRecord(view)
+        self.records[view] = record
+        view.urlChanged.connect(lambda qurl, record=record:
+            setattr(record, 'url', qurl))
+        view.titleChanged.connect(lambda title, record=record:
+            setattr(record, 'title', title))
+        view.loadFinished.connect(lambda ok, record=record:
+            self.restore_scroll(record))
+        return record
+
+    def untrack(self, view):
+        self.records.pop(view, None)
+
+    def tab_activated(self, index):
+        record = self.records.get(self.tabs.widget(index))
+        if record is None:
+            return
+        record.last_active = time.monotonic()
+        self.records.move_to_end(record.view)
+        if record.state != self.ACTIVE:
+            self.activate(record)
+
+    def activate(self, record):
+        try:
+            page = record.view.page()
+            was_discarded = record.state == self.DISCARDED
+            page.setLifecycleState(QWebEnginePage.LifecycleState.Active)
+            record.state = self.ACTIVE
+            if was_discarded:
+                # Страница перезагрузится, после загрузки вернем прокрутку
+                record.pending_scroll = QPointF(record.scroll)
+                if page.url().isEmpty():
+                    record.view.setUrl(record.url)
+            self.update_tab_style(record)
+        except Exception as e:
+            print(f"Ошибка при активации вкладки: {str(e)}")
+
+    def freeze(self, record):
+        try:
+            page = record.view.page()
+            # Не замораживаем вкладки, которые играют звук
+            if page.recentlyAudible():
+                return
+            record.scroll = page.scrollPosition()
+            page.setLifecycleState(QWebEnginePage.LifecycleState.Frozen)
+            record.state = self.FROZEN
+            self.update_tab_style(record)
+        except Exception as e:
+            print(f"Ошибка при заморозке вкладки: {str(e)}")
+
+    def discard(self, record):
+        try:
+            page = record.view.page()
+            if record.state == self.ACTIVE:
+                record.scroll = page.scrollPosition()
+            if not page.url().isEmpty():
+                record.url = page.url()
+            if page.title():
+                record.title = page.title()
+            page.setLifecycleState(QWebEnginePage.LifecycleState.Discarded)
+            record.state = self.DISCARDED
+            self.update_tab_style(record)
+        except Exception as e:
+            print(f"Ошибка при выгрузке вкладки: {str(e)}")
+
+    def restore_scroll(self, record):
+        if record.pending_scroll is None:
+            return
+        pos = record.pending_scroll
+        record.pending_scroll = None
+        if pos.x() or pos.y():
+            record.view.page().runJavaScript(
+                f"window.scrollTo({pos.x()}, {pos.y()});")
+
+    def update_tab_style(self, record):
+        index = self.tabs.indexOf(record.view)
+        if index < 0:
+            return
+        tab_bar = self.tabs.tabBar()
+        if record.state == self.ACTIVE:
+            tab_bar.setTabTextColor(index, QColor())
+            self.tabs.setTabToolTip(index, record.title)
+        else:
+            tab_bar.setTabTextColor(index, QColor('#9aa0a6'))
+            status = 'заморожена' if record.state == self.FROZEN else 'выгружена'
+            self.tabs.setTabToolTip(index, f"{record.title} ({status})")
+            if record.state == self.DISCARDED:
+                self.tabs.setTabText(index, record.title)
+
+    def check_tabs(self):
+        now = time.monotonic()
+        current = self.tabs.currentWidget()
+        for record in list(self.records.values()):
+            if record.view is current or record.state != self.ACTIVE:
+                continue
+            if now - record.last_active >= self.freeze_delay:
+                self.freeze(record)
+        self.enforce_budget()
+
+    def memory_usage(self):
+        # Процесс рендерера может быть общим для нескольких вкладок,
+        # поэтому делим его память поровну между ними
+        by_pid = {}
+        usage = {}
+        for record in self.records.values():
+            if record.state == self.DISCARDED:
+                continue
+            pid = getattr(record.view.page(), 'renderProcessPid', lambda: 0)()
+            by_pid.setdefault(pid, []).append(record)
+        for pid, records in by_pid.items():
+            rss = process_rss(pid)
+            if rss is None:
+                rss = TAB_ESTIMATED_MEMORY_MB * 1024 * 1024 * len(records)
+            for record in records:
+                usage[record.view] = rss / len(records)
+        return usage
+
+    def enforce_budget(self):
+        usage = self.memory_usage()
+        total = sum(usage.values())
+        if total <= self.memory_budget:
+            return
+        current = self.tabs.currentWidget()
+        for record in list(self.records.values()):
+            if total <= self.memory_budget:
+                break
+            if record.view is current or record.state == self.DISCARDED:
+                continue
+            total -= usage.get(record.view, 0)
+            self.discard(record)
+
+def create_profile(cache_type=HTTP_CACHE_TYPE, cache_size_mb=HTTP_CACHE_SIZE_MB):
+    # Профиль живет столько же, сколько приложение: страницы
+    # должны удаляться раньше своего профиля
+    profile = QWebEngineProfile(PROFILE_NAME, QApplication.instance())
+    profile.setPersistentStoragePath(profile_path)
+    profile.setCachePath(cache_path)
+    profile.setPersistentCookiesPolicy(QWebEngineProfile.ForcePersistentCookies)
+    if cache_type == 'memory':
+        profile.setHttpCacheType(QWebEngineProfile.MemoryHttpCache)
+    else:
+        profile.setHttpCacheType(QWebEngineProfile.DiskHttpCache)
+        profile.setHttpCacheMaximumSize(cache_size_mb * 1024 * 1024)
+    return profile
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size} B"
+        size /= 1024
+
+# Resource Timing показывает, откуда пришел ресурс: transferSize == 0 при
+# ненулевом decodedBodySize означает ответ из кэша. Чужие ресурсы без
+# Timing-Allow-Origin отдают нули и не учитываются.
+CACHE_STATS_JS = """
+(function() {
+    var entries = performance.getEntriesByType('navigation')
+        .concat(performance.getEntriesByType('resource'));
+    var hits = 0, misses = 0, cached = 0, network = 0;
+    entries.forEach(function(e) {
+        if (!e.transferSize && !e.decodedBodySize) return;
+        if (e.transferSize === 0) { hits++; cached += e.decodedBodySize; }
+        else { misses++; network += e.transferSize; }
+    });
+    return [hits, misses, cached, network];
+})();
+"""
+
+class CacheStats(QObject):
+    changed = pyqtSignal()
+    # Размер кэша на диске считается в отдельном потоке: обход папки
+    # в сотни мегабайт заметно останавливал бы интерфейс
+    disk_usage_changed = pyqtSignal(object)
+
+    def __init__(self, profile, parent=None):
+        super().__init__(parent)
+        self.profile = profile
+        self.hits = 0
+        self.misses = 0
+        self.cached_bytes = 0
+        self.network_bytes = 0
+        self.disk_bytes = None
+        self.measuring = False
+        self.disk_usage_changed.connect(self.set_disk_usage)
+
+    def collect(self, page):
+        page.runJavaScript(CACHE_STATS_JS, self.add_result)
+
+    def add_result(self, result):
+        if not result:
+            return
+        try:
+            hits, misses, cached, network = result
+            self.hits += int(hits)
+            self.misses += int(misses)
+            self.cached_bytes += int(cached)
+            self.network_bytes += int(network)
+            self.changed.emit()
+        except Exception as e:
+            print(f"Ошибка при подсчете статистики кэша: {str(e)}")
+
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def measure_disk_usage(self):
+        if self.measuring or self.profile.httpCacheType() != QWebEngineProfile.DiskHttpCache:
+            return
+        self.measuring = True
+        path = self.profile.cachePath()
+
+        def run():
+            try:
+                size = directory_size(path)
+            except Exception as e:
+                print(f"Ошибка при подсчете размера кэша: {str(e)}")
+                size = None
+            self.disk_usage_changed.emit(size)
+        threading.Thread(target=run, daemon=True).start()
+
+    def set_disk_usage(self, size):
+        self.measuring = False
+        if size is not None:
+            self.disk_bytes = size
+
+    def reset(self):
+        self.hits = self.misses = 0
+        self.cached_bytes = self.network_bytes = 0
+        self.changed.emit()
+
+class CacheWindow(QDialog):
+    def __init__(self, stats, parent=None):
+        super().__init__(parent)
+        self.stats = stats
+        self.setWindowTitle("Кэш")
+        self.setMinimumWidth(360)
+
+        layout = QFormLayout(self)
+        self.type_label = QLabel()
+        self.size_label = QLabel()
+        self.hits_label = QLabel()
+        self.ratio_label = QLabel()
+        self.saved_label = QLabel()
+        layout.addRow("Тип кэша:", self.type_label)
+        layout.addRow("Размер на диске:", self.size_label)
+        layout.addRow("Попадания / промахи:", self.hits_label)
+        layout.addRow("Доля попаданий:", self.ratio_label)
+        layout.addRow("Из кэша / из сети:", self.saved_label)
+
+        buttons = QHBoxLayout()
+        clear_btn = QPushButton("Очистить кэш")
+        clear_btn.clicked.connect(self.clear_cache)
+        buttons.addWidget(clear_btn)
+        close_btn = QPushButton("Закрыть")
+        close_btn.clicked.connect(self.close)
+        buttons.addWidget(close_btn)
+        layout.addRow(buttons)
+
+        self.stats.changed.connect(self.refresh)
+        self.stats.disk_usage_changed.connect(self.refresh_disk_usage)
+
+        # Счетчики обновляются на каждый changed, размер на диске — редко
+        self.usage_timer = QTimer(self)
+        self.usage_timer.setInterval(CACHE_USAGE_INTERVAL)
+        self.usage_timer.timeout.connect(self.stats.measure_disk_usage)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.refresh_disk_usage()
+        self.stats.measure_disk_usage()
+        self.usage_timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.usage_timer.stop()
+        super().hideEvent(event)
+
+    def refresh_disk_usage(self, size=None):
+        profile = self.stats.profile
+        if profile.httpCacheType() == QWebEngineProfile.DiskHttpCache:
+            self.type_label.setText("на диске")
+            used = "…" if self.stats.disk_bytes is None else format_size(self.stats.disk_bytes)
+            self.size_label.setText(f"{used} из {format_size(profile.httpCacheMaximumSize())}")
+        else:
+            self.type_label.setText("в памяти")
+            self.size_label.setText("—")
+
+    def refresh(self):
+        if not self.isVisible():
+            return
+        self.hits_label.setText(f"{self.stats.hits} / {self.stats.misses}")
+        self.ratio_label.setText(f"{self.stats.hit_ratio() * 100:.1f}%")
+        self.saved_label.setText(
+            f"{format_size(self.stats.cached_bytes)} / "
+            f"{format_size(self.stats.network_bytes)}")
+
+    def clear_cache(self):
+        self.stats.profile.clearHttpCache()
+        self.stats.reset()
+        self.refresh()
+        self.stats.measure_disk_usage()
+
+# Navigation Timing, Resource Timing и Paint Timing страницы, время в мс
+PAGE_METRICS_JS = """
+(function() {
+    var result = {resources: 0, transfer: 0};
+    var nav = performance.getEntriesByType('navigation')[0];
+    if (nav) {
+        result.ttfb = nav.responseStart - nav.startTime;
+        result.dom_content_loaded = nav.domContentLoadedEventEnd;
+        result.load_event = nav.loadEventEnd || nav.loadEventStart;
+        result.transfer = nav.transferSize || 0;
+    }
+    performance.getEntriesByType('resource').forEach(function(e) {
+        result.resources++;
+        result.transfer += e.transferSize || 0;
+    });
+    performance.getEntriesByType('paint').forEach(function(e) {
+        if (e.name === 'first-paint') result.first_paint = e.startTime;
+        if (e.name === 'first-contentful-paint') result.first_contentful_paint = e.startTime;
+    });
+    return result;
+})();
+"""
+
+def prometheus_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    escaped = []
+    for key, value in items:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{key}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+class MetricsRegistry:
+    # Метрики процесса: счетчики, показатели и гистограммы с метками.
+    # Метки — кортеж пар (имя, значение), чтобы серии можно было хранить в dict.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = OrderedDict()
+
+    def describe(self, name, kind, help_text, buckets=METRICS_BUCKETS):
+        with self.lock:
+            self.metrics.setdefault(name, {
+                'type': kind, 'help': help_text, 'buckets': tuple(buckets),
+                'series': {}})
+
+    def series_key(self, labels):
+        return tuple(sorted((labels or {}).items()))
+
+    def inc(self, name, labels=None, value=1):
+        with self.lock:
+            series = self.metrics[name]['series']
+            key = self.series_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def clear(self, name):
+        with self.lock:
+            self.metrics[name]['series'].clear()
+
+    def set(self, name, value, labels=None):
+        with self.lock:
+            self.metrics[name]['series'][self.series_key(labels)] = value
+
+    def observe(self, name, value, labels=None):
+        with self.lock:
+            metric = self.metrics[name]
+            key = self.series_key(labels)
+            histogram = metric['series'].get(key)
+            if histogram is None:
+                histogram = {'counts': [0] * len(metric['buckets']), 'sum': 0.0, 'count': 0}
+                metric['series'][key] = histogram
+            # Счетчики корзин хранятся без накопления, суммируются при выгрузке
+            for i, bound in enumerate(metric['buckets']):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def to_json(self):
+        result = []
+        with self.lock:
+            for name, metric in self.metrics.items():
+                series = []
+                for key, value in metric['series'].items():
+                    item = {'labels': dict(key)}
+                    if metric['type'] == 'histogram':
+                        item['buckets'] = dict(zip(
+                            (str(bound) for bound in metric['buckets']),
+                            self.cumulative(value['counts'])))
+                        item['sum'] = round(value['sum'], 6)
+                        item['count'] = value['count']
+                    else:
+                        item['value'] = value
+                    series.append(item)
+                result.append({'name': name, 'type': metric['type'],
+                               'help': metric['help'], 'series': series})
+        return result
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            for name, metric in self.metrics.items():
+                lines.append(f"# HELP {name} {metric['help']}")
+                lines.append(f"# TYPE {name} {metric['type']}")
+                for key, value in metric['series'].items():
+                    if metric['type'] != 'histogram':
+                        lines.append(f"{name}{prometheus_labels(key)} {value}")
+                        continue
+                    counts = self.cumulative(value['counts'])
+                    for bound, count in zip(metric['buckets'], counts):
+                        lines.append(f"{name}_bucket{prometheus_labels(key, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{prometheus_labels(key, [('le', '+Inf')])} {value['count']}")
+                    lines.append(f"{name}_sum{prometheus_labels(key)} {value['sum']:.6f}")
+                    lines.append(f"{name}_count{prometheus_labels(key)} {value['count']}")
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def cumulative(counts):
+        total = 0
+        result = []
+        for count in counts:
+            total += count
+            result.append(total)
+        return result
+
+class PageLoad:
+    def __init__(self, url):
+        self.url = url
+        self.started = time.perf_counter()
+        self.first_progress = None
+
+class PageMetrics(QObject):
+    # Собирает метрики загрузки страниц всех вкладок в один реестр.
+    # Метки — только хост, полные адреса идут в журнал последних загрузок.
+    TERMINATION_NAMES = {0: 'normal', 1: 'abnormal', 2: 'crashed', 3: 'killed'}
+
+    def __init__(self, registry=None, parent=None):
+        super().__init__(parent)
+        self.registry = registry or MetricsRegistry()
+        self.loads = {}
+        self.pages = deque(maxlen=METRICS_PAGE_LOG)
+
+        describe = self.registry.describe
+        describe('browser_page_loads_total', 'counter', 'Завершенные загрузки страниц')
+        describe('browser_page_first_progress_seconds', 'histogram',
+                 'От начала загрузки до первого loadProgress')
+        describe('browser_page_load_seconds', 'histogram',
+                 'От loadStarted до loadFinished')
+        describe('browser_page_ttfb_seconds', 'histogram', 'Navigation Timing: время до первого байта')
+        describe('browser_page_dom_content_loaded_seconds', 'histogram',
+                 'Navigation Timing: DOMContentLoaded')
+        describe('browser_page_load_event_seconds', 'histogram', 'Navigation Timing: событие load')
+        describe('browser_page_first_paint_seconds', 'histogram', 'Paint Timing: first-paint')
+        describe('browser_page_first_contentful_paint_seconds', 'histogram',
+                 'Paint Timing: first-contentful-paint')
+        describe('browser_page_resources_total', 'counter', 'Resource Timing: загруженные ресурсы')
+        describe('browser_page_transfer_bytes_total', 'counter',
+                 'Resource Timing: байт получено по сети')
+        describe('browser_renderer_terminations_total', 'counter',
+                 'Завершения процесса рендерера')
+
+    @staticmethod
+    def host_label(qurl):
+        return qurl.host() or qurl.scheme() or 'unknown'
+
+    def track(self, view):
+        view.loadStarted.connect(lambda view=view: self.load_started(view))
+        view.loadProgress.connect(lambda progress, view=view: self.load_progress(view, progress))
+        view.loadFinished.connect(lambda ok, view=view: self.load_finished(view, ok))
+        view.renderProcessTerminated.connect(
+            lambda status, code, view=view: self.renderer_terminated(view, status, code))
+
+    def untrack(self, view):
+        self.loads.pop(view, None)
+
+    def load_started(self, view):
+        self.loads[view] = PageLoad(view.url())
+
+    def load_progress(self, view, progress):
+        load = self.loads.get(view)
+        if load is not None and load.first_progress is None and progress > 0:
+            load.first_progress = time.perf_counter()
+
+    def load_finished(self, view, ok):
+        load = self.loads.pop(view, None)
+        if load is None:
+            return
+        try:
+            url = view.url()
+            host = self.host_label(url)
+            labels = {'host': host}
+            elapsed = time.perf_counter() - load.started
+            self.registry.inc('browser_page_loads_total',
+                              {'host': host, 'result': 'ok' if ok else 'failed'})
+            self.registry.observe('browser_page_load_seconds', elapsed, labels)
+            record = {'time': time.time(), 'url': url.toString(), 'host': host, 'ok': ok,
+                      'load_seconds': round(elapsed, 4)}
+            if load.first_progress is not None:
+                first_progress = load.first_progress - load.started
+                self.registry.observe('browser_page_first_progress_seconds', first_progress, labels)
+                record['first_progress_seconds'] = round(first_progress, 4)
+            self.pages.append(record)
+            if ok:
+                view.page().runJavaScript(PAGE_METRICS_JS,
+                    lambda result, record=record: self.add_timing(record, result))
+        except Exception as e:
+            print(f"Ошибка при сборе метрик страницы: {str(e)}")
+
+    def add_timing(self, record, result):
+        if not result:
+            return
+        try:
+            labels = {'host': record['host']}
+            for field in ('ttfb', 'dom_content_loaded', 'load_event',
+                          'first_paint', 'first_contentful_paint'):
+                value = result.get(field)
+                if value is None or value <= 0:
+                    continue
+                seconds = value / 1000
+                self.registry.observe(f'browser_page_{field}_seconds', seconds, labels)
+                record[f'{field}_seconds'] = round(seconds, 4)
+            self.registry.inc('browser_page_resources_total', labels, int(result.get('resources', 0)))
+            self.registry.inc('browser_page_transfer_bytes_total', labels, int(result.get('transfer', 0)))
+            record['resources'] = int(result.get('resources', 0))
+            record['transfer_bytes'] = int(result.get('transfer', 0))
+        except Exception as e:
+            print(f"Ошибка при разборе метрик страницы: {str(e)}")
+
+    def renderer_terminated(self, view, status, code):
+        self.loads.pop(view, None)
+        self.registry.inc('browser_renderer_terminations_total',
+                          {'status': self.TERMINATION_NAMES.get(int(status), str(int(status)))})
+        self.pages.append({'time': time.time(), 'url': view.url().toString(),
+                           'host': self.host_label(view.url()),
+                           'renderer_terminated': self.TERMINATION_NAMES.get(int(status), str(int(status))),
+                           'exit_code': code})
+
+    def to_json(self):
+        return {'metrics': self.registry.to_json(), 'pages': list(self.pages)}
+
+    def export(self, path):
+        # .prom/.txt — текстовый формат Prometheus, иначе JSON.
+        # Пишем через временный файл, чтобы коллектор не прочел половину
+        if path.endswith(('.prom', '.txt')):
+            data = self.registry.to_prometheus()
+        else:
+            data = json.dumps(self.to_json(), ensure_ascii=False, indent=2)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def save(self):
+        # Периодическая выгрузка в metrics_export_path, если он задан
+        if metrics_export_path:
+            try:
+                self.export(metrics_export_path)
+            except Exception as e:
+                print(f"Ошибка при выгрузке метрик: {str(e)}")
+
+def history_key(url):
+    # Ключ для поиска по префиксу: без схемы и www, в нижнем регистре
+    key = url.lower()
+    for prefix in ('https://', 'http://'):
+        if key.startswith(prefix):
+            key = key[len(prefix):]
+            break
+    if key.startswith('www.'):
+        key = key[4:]
+    return key
+
+class HistoryStore:
+    # История в SQLite. Частота и давность посещений сведены в одно число
+    # rank = log2(взвешенное число посещений) + время / период полураспада,
+    # поэтому порядок не меняется со временем и rank можно индексировать.
+    def __init__(self, path=history_db_path, half_life_days=HISTORY_HALF_LIFE_DAYS):
+        self.path = path
+        self.half_life = half_life_days * 24 * 3600
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS urls (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL UNIQUE,
+                key TEXT NOT NULL,
+                title TEXT NOT NULL DEFAULT '',
+                visit_count INTEGER NOT NULL DEFAULT 0,
+                last_visit REAL NOT NULL,
+                rank REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS urls_key ON urls(key);
+            CREATE INDEX IF NOT EXISTS urls_rank_key ON urls(rank, key);
+            CREATE VIRTUAL TABLE IF NOT EXISTS urls_fts USING fts5(
+                url, title, content='urls', content_rowid='id',
+                prefix='2 3 4', detail=column);
+            CREATE TRIGGER IF NOT EXISTS urls_ai AFTER INSERT ON urls BEGIN
+                INSERT INTO urls_fts(rowid, url, title) VALUES (new.id, new.url, new.title);
+            END;
+            CREATE TRIGGER IF NOT EXISTS urls_ad AFTER DELETE ON urls BEGIN
+                INSERT INTO urls_fts(urls_fts, rowid, url, title)
+                VALUES ('delete', old.id, old.url, old.title);
+            END;
+            CREATE TRIGGER IF NOT EXISTS urls_au AFTER UPDATE OF url, title ON urls BEGIN
+                INSERT INTO urls_fts(urls_fts, rowid, url, title)
+                VALUES ('delete', old.id, old.url, old.title);
+                INSERT INTO urls_fts(rowid, url, title) VALUES (new.id, new.url, new.title);
+            END;
+        """)
+        return conn
+
+    def add_visit(self, conn, url, when, weight=1.0):
+        row = conn.execute("SELECT rank FROM urls WHERE url = ?", (url,)).fetchone()
+        base = when / self.half_life
+        if row is None:
+            conn.execute(
+                "INSERT INTO urls (url, key, visit_count, last_visit, rank) VALUES (?, ?, 1, ?, ?)",
+                (url, history_key(url), when, math.log2(weight) + base))
+        else:
+            # Старые посещения затухают, новое добавляет weight
+            rank = math.log2(2 ** (row[0] - base) + weight) + base
+            conn.execute(
+                "UPDATE urls SET visit_count = visit_count + 1, last_visit = ?, rank = ? WHERE url = ?",
+                (when, rank, url))
+
+    def set_title(self, conn, url, title):
+        conn.execute("UPDATE urls SET title = ? WHERE url = ? AND title != ?", (title, url, title))
+
+    def search(self, conn, text, limit=HISTORY_SUGGESTIONS):
+        text = text.strip()
+        if not text:
+            return []
+        key = history_key(text)
+        found = {}
+
+        # Префикс адреса среди самых частых страниц: обход индекса (rank, key)
+        # ограничен, поэтому запрос не зависит от размера истории
+        rows = conn.execute(
+            """SELECT url, title, rank FROM urls WHERE id IN
+                   (SELECT id FROM
+                       (SELECT id, key FROM urls ORDER BY rank DESC LIMIT ?)
+                    WHERE key >= ? AND key < ? LIMIT ?)""",
+            (HISTORY_SCAN_LIMIT, key, key + '\U0010ffff', limit)).fetchall()
+        # Префикс по индексу key — для редких адресов вне верхушки
+        if len(rows) < limit:
+            rows += conn.execute(
+                "SELECT url, title, rank FROM urls WHERE key >= ? AND key < ? LIMIT ?",
+                (key, key + '\U0010ffff', HISTORY_SCAN_LIMIT // 10)).fetchall()
+        for url, title, rank in rows:
+            found[url] = (rank + HISTORY_PREFIX_BONUS, title)
+
+        # Слова в адресе и заголовке через FTS, каждое по началу слова.
+        # Если запрос не уложился во время, SQLite его прерывает
+        # и остаются подсказки по префиксу адреса.
+        if len(found) < limit:
+            words = [word for word in re.split(r'\W+', text.lower()) if word]
+            if words:
+                match = ' '.join(f'"{word}"*' for word in words)
+                deadline = time.perf_counter() + HISTORY_QUERY_BUDGET_MS / 1000
+                conn.set_progress_handler(lambda: time.perf_counter() > deadline, 1000)
+                try:
+                    rows = conn.execute(
+                        """SELECT u.url, u.title, u.rank FROM urls u JOIN
+                               (SELECT rowid FROM urls_fts WHERE urls_fts MATCH ? LIMIT ?) f
+                           ON u.id = f.rowid""",
+                        (match, HISTORY_SCAN_LIMIT // 10)).fetchall()
+                except sqlite3.Error:
+                    rows = []
+                finally:
+                    conn.set_progress_handler(None, 0)
+                for url, title, rank in rows:
+                    found.setdefault(url, (rank, title))
+
+        best = sorted(found.items(), key=lambda item: -item[1][0])[:limit]
+        return [(url, title) for url, (_, title) in best]
+
+class History(QObject):
+    # Запись и поиск идут в своих потоках со своими соединениями (WAL),
+    # UI только кладет задания и получает сигнал с результатами
+    results_ready = pyqtSignal(str, list)
+
+    def __init__(self, store=None, parent=None):
+        super().__init__(parent)
+        self.store = store or HistoryStore()
+        self.writes = queue.Queue()
+        self.search_lock = threading.Condition()
+        self.pending_query = None
+        self.searching = False
+        self.search_conn = None
+        self.closing = False
+        self.writer = threading.Thread(target=self.writer_loop, daemon=True)
+        self.searcher = threading.Thread(target=self.search_loop, daemon=True)
+        self.writer.start()
+        self.searcher.start()
+
+    def record_visit(self, url, weight=1.0):
+        if url.startswith(('http://', 'https://')):
+            self.writes.put(('visit', url, time.time(), weight))
+
+    def record_title(self, url, title):
+        if title and url.startswith(('http://', 'https://')):
+            self.writes.put(('title', url, title))
+
+    def query(self, text):
+        # Важен только последний запрос: ожидающий заменяется,
+        # а выполняющийся прерывается
+        with self.search_lock:
+            self.pending_query = text
+            if self.searching and self.search_conn is not None:
+                self.search_conn.interrupt()
+            self.search_lock.notify()
+
+    def close(self):
+        self.writes.put(None)
+        with self.search_lock:
+            self.closing = True
+            self.search_lock.notify()
+        self.writer.join()
+        self.searcher.join()
+
+    def writer_loop(self):
+        conn = self.store.connect()
+        try:
+            while True:
+                item = self.writes.get()
+                batch = [item]
+                # Все, что накопилось, пишем одной транзакцией
+                while item is not None and len(batch) < 1000:
+                    try:
+                        item = self.writes.get_nowait()
+                    except queue.Empty:
+                        break
+                    batch.append(item)
+                with conn:
+                    for item in batch:
+                        if item is None:
+                            continue
+                        if item[0] == 'visit':
+                            self.store.add_visit(conn, item[1], item[2], item[3])
+                        else:
+                            self.store.set_title(conn, item[1], item[2])
+                if batch[-1] is None:
+                    return
+        except Exception as e:
+            print(f"Ошибка при записи истории: {str(e)}")
+        finally:
+            conn.close()
+
+    def search_loop(self):
+        conn = self.store.connect()
+        self.search_conn = conn
+        try:
+            while True:
+                with self.search_lock:
+                    self.searching = False
+                    while self.pending_query is None and not self.closing:
+                        self.search_lock.wait()
+                    if self.closing:
+                        return
+                    text = self.pending_query
+                    self.pending_query = None
+                    self.searching = True
+                try:
+                    self.results_ready.emit(text, self.store.search(conn, text))
+                except sqlite3.OperationalError:
+                    # Запрос прерван более новым
+                    pass
+                except Exception as e:
+                    print(f"Ошибка при поиске по истории: {str(e)}")
+        finally:
+            self.search_conn = None
+            conn.close()
+
+class PublicSuffixList:
+    # Список публичных суффиксов (public_suffix_list.dat рядом с web.py)
+    # загружается один раз, при первой проверке адреса
+    instance_cache = None
+
+    def __init__(self, path=public_suffix_path):
+        self.rules = set()
+        self.wildcards = set()
+        self.exceptions = set()
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line or line.startswith('//'):
+                        continue
+                    rule = line.split()[0].lower()
+                    if rule.startswith('!'):
+                        self.exceptions.add(rule[1:])
+                    elif rule.startswith('*.'):
+                        self.wildcards.add(rule[2:])
+                    else:
+                        self.rules.add(rule)
+        except OSError as e:
+            print(f"Ошибка при чтении списка суффиксов: {str(e)}")
+
+    @classmethod
+    def instance(cls):
+        if cls.instance_cache is None:
+            cls.instance_cache = cls()
+        return cls.instance_cache
+
+    def suffix_labels(self, host):
+        # Сколько последних меток хоста занимает публичный суффикс, 0 — неизвестен.
+        # Перебор от длинного кандидата к короткому дает самое длинное правило.
+        labels = host.split('.')
+        for i in range(len(labels)):
+            candidate = '.'.join(labels[i:])
+            if candidate in self.exceptions:
+                return len(labels) - i - 1
+            if candidate in self.rules:
+                return len(labels) - i
+            if i + 1 < len(labels) and '.'.join(labels[i + 1:]) in self.wildcards:
+                return len(labels) - i
+        return 0
+
+def unicode_host(host):
+    if 'xn--' not in host:
+        return host
+    try:
+        return host.encode('ascii').decode('idna')
+    except UnicodeError:
+        return host
+
+def classify_input(text):
+    # 'url', 'search' или None для пустой строки. Только локальные проверки,
+    # без DNS, чтобы укладываться в микросекунды на каждое нажатие
+    text = text.strip()
+    if not text:
+        return None
+    match = OMNIBOX_SCHEME_RE.match(text)
+    if match and match.group(1).lower() in OMNIBOX_SCHEMES:
+        return 'url'
+    if any(ch.isspace() for ch in text):
+        return 'search'
+
+    hostport = re.split(r'[/?#]', text, 1)[0]
+    rest = text[len(hostport):]
+    hostport = hostport.rpartition('@')[2]
+    if hostport.startswith('['):
+        return 'url' if ']' in hostport else 'search'
+    host, sep, port = hostport.partition(':')
+    if sep and not port.isdigit():
+        return 'search'
+    host = unicode_host(host.lower().rstrip('.'))
+    if not host:
+        return 'search'
+    if host == 'localhost' or host.endswith('.localhost'):
+        return 'url'
+    try:
+        ipaddress.IPv4Address(host)
+        return 'url'
+    except ValueError:
+        pass
+
+    labels = host.split('.')
+    if not all(OMNIBOX_LABEL_RE.match(label) for label in labels):
+        return 'search'
+    if len(labels) == 1:
+        # Имена из локальной сети: intranet/ или dashboard:8080
+        return 'url' if sep or rest.startswith('/') else 'search'
+    suffix = PublicSuffixList.instance().suffix_labels(host)
+    if suffix and len(labels) > suffix:
+        return 'url'
+    return 'search'
+
+def search_url(text):
+    # quote_plus кодирует и '+', иначе Google прочитает его как пробел
+    return QUrl('https://www.google.com/search?q=' + urllib.parse.quote_plus(text))
+
+Suggestion = namedtuple('Suggestion', 'kind text title tab_id')
+
+class Omnibox(QObject):
+    # Подсказки строки адреса. Классификатор и открытые вкладки считаются
+    # сразу на каждое нажатие, история — после паузы в наборе. Ответы
+    # на устаревший текст отбрасываются.
+    suggestions_ready = pyqtSignal(str, list)
+
+    def __init__(self, history, open_tabs, parent=None):
+        super().__init__(parent)
+        self.history = history
+        # open_tabs() -> [(tab_id, url, title)]
+        self.open_tabs = open_tabs
+        self.text = None
+        self.instant = []
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(OMNIBOX_DEBOUNCE_MS)
+        self.timer.timeout.connect(self.query_history)
+        self.history.results_ready.connect(self.history_results)
+
+    def update(self, text):
+        self.text = text
+        self.instant = self.instant_suggestions(text)
+        self.suggestions_ready.emit(text, self.instant)
+        if text.strip():
+            self.timer.start()
+        else:
+            self.timer.stop()
+
+    def cancel(self):
+        self.timer.stop()
+        self.text = None
+
+    def instant_suggestions(self, text):
+        kind = classify_input(text)
+        if kind is None:
+            return []
+        text = text.strip()
+        items = [Suggestion(kind, text, '', None)]
+        needle = text.lower()
+        for tab_id, url, title in self.open_tabs():
+            if needle in url.lower() or needle in title.lower():
+                items.append(Suggestion('tab', url, title, tab_id))
+                if len(items) > OMNIBOX_TAB_SUGGESTIONS:
+                    break
+        return items
+
+    def query_history(self):
+        if self.text:
+            self.history.query(self.text)
+
+    def history_results(self, text, rows):
+        if text != self.text:
+            return
+        merged = list(self.instant)
+        seen = {item.text for item in merged}
+        for url, title in rows:
+            if url not in seen:
+                seen.add(url)
+                merged.append(Suggestion('history', url, title, None))
+        self.suggestions_ready.emit(text, merged)
+
+def filter_options(text):
+    # Разбор опций правила после '$'. None — правило с опциями, которые
+    # здесь не поддерживаются (csp, redirect, popup...): такое правило
+    # пропускаем, а не применяем шире, чем задумано
+    match_case = False
+    third_party = None
+    types = set()
+    not_types = set()
+    include = set()
+    exclude = set()
+    for option in text.split(','):
+        option = option.strip()
+        negated = option.startswith('~')
+        name = option.lstrip('~')
+        if name == 'domain' or name.startswith('domain='):
+            for domain in name[7:].split('|'):
+                if domain.startswith('~'):
+                    exclude.add(domain[1:].lower())
+                elif domain:
+                    include.add(domain.lower())
+        elif name == 'match-case':
+            match_case = True
+        elif name in ('third-party', '3p'):
+            third_party = not negated
+        elif name in ('first-party', '1p'):
+            third_party = negated
+        elif name == 'important':
+            pass
+        elif FILTER_TYPE_ALIASES.get(name, name) in FILTER_TYPES:
+            (not_types if negated else types).add(FILTER_TYPE_ALIASES.get(name, name))
+        else:
+            return None
+    return (match_case, third_party, frozenset(types) or None,
+            frozenset(not_types) or None, frozenset(include) or None, frozenset(exclude) or None)
+
+def filter_regex(pattern):
+    # Шаблон ABP в регулярное выражение: || — домен или поддомен,
+    # | — начало или конец адреса, ^ — разделитель, * — что угодно
+    prefix = ''
+    suffix = ''
+    if pattern.startswith('||'):
+        prefix = r'^[a-z][a-z0-9+.-]*://(?:[^/?#]*\.)?'
+        pattern = pattern[2:]
+    elif pattern.startswith('|'):
+        prefix = '^'
+        pattern = pattern[1:]
+    if pattern.endswith('|'):
+        suffix = '$'
+        pattern = pattern[:-1]
+    parts = []
+    for char in pattern.strip('*'):
+        if char == '*':
+            parts.append('.*')
+        elif char == '^':
+            parts.append(r'(?:[^\w.%-]|$)')
+        else:
+            parts.append(re.escape(char))
+    return prefix + ''.join(parts) + suffix
+
+def filter_tokens(pattern):
+    # Токены шаблона, которые в подходящем адресе обязательно стоят целиком:
+    # не у '*' и не у неякорного края. По ним правило попадает в индекс
+    left_anchored = pattern.startswith('|')
+    right_anchored = pattern.endswith('|')
+    body = pattern.lower()
+    tokens = []
+    for match in FILTER_TOKEN_RE.finditer(body):
+        start, end = match.span()
+        before = body[start - 1] if start else None
+        after = body[end] if end < len(body) else None
+        if before == '*' or after == '*':
+            continue
+        if (before is None or before == '|') and not left_anchored:
+            continue
+        if (after is None or after == '|') and not right_anchored:
+            continue
+        tokens.append(match.group())
+    return tokens
+
+def parse_filter(line):
+    # Возвращает (исключение, домен, шаблон, опции) или None для строк,
+    # которые к блокировке запросов не относятся
+    line = line.strip()
+    if not line or line.startswith(('!', '[')):
+        return None
+    if '##' in line or '#@#' in line or '#?#' in line or '#$#' in line:
+        return None
+    exception = line.startswith('@@')
+    if exception:
+        line = line[2:]
+    options = None
+    if '$' in line:
+        line, _, option_text = line.rpartition('$')
+        options = filter_options(option_text)
+        if options is None:
+            return None
+    if len(line) > 1 and line.startswith('/') and line.endswith('/'):
+        # Регулярные выражения слишком дороги для каждого запроса
+        return None
+    if line.strip('*|^') == '':
+        return None
+    if options is None and FILTER_DOMAIN_RE.match(line):
+        return exception, line[2:-1].lower(), None, None
+    if options is None or not options[0]:
+        line = line.lower()
+    return exception, None, line, options
+
+class FilterRuleSet:
+    # Правила одного вида (блокирующие или исключения):
+    # домены без опций — в множестве, остальное — по токенам
+    def __init__(self):
+        self.domains = set()
+        self.tokens = {}
+        self.generic = []
+        self.compiled = {}
+
+    def add(self, domain, pattern, options):
+        if domain is not None:
+            self.domains.add(domain)
+            return
+        rule = (filter_regex(pattern), options)
+        tokens = filter_tokens(pattern)
+        if not tokens:
+            self.generic.append(rule)
+            return
+        # Самый редкий из токенов: короче списки кандидатов.
+        # Токены, которые есть почти в любом адресе, — в последнюю очередь
+        token = min(tokens, key=lambda token: (token in FILTER_COMMON_TOKENS,
+                                               len(self.tokens.get(token, ())), -len(token)))
+        self.tokens.setdefault(token, []).append(rule)
+
+    def size(self):
+        return len(self.domains) + len(self.generic) + sum(len(rules) for rules in self.tokens.values())
+
+    def matches(self, request, url_tokens):
+        if self.domains:
+            host = request.host
+            while True:
+                if host in self.domains:
+                    return True
+                dot = host.find('.')
+                if dot < 0:
+                    break
+                host = host[dot + 1:]
+        tokens = self.tokens
+        for token in url_tokens:
+            rules = tokens.get(token)
+            if rules is not None:
+                for rule in rules:
+                    if self.rule_matches(rule, request):
+                        return True
+        for rule in self.generic:
+            if self.rule_matches(rule, request):
+                return True
+        return False
+
+    def rule_matches(self, rule, request):
+        source, options = rule
+        if options is not None and not request.options_match(options):
+            return False
+        regex = self.compiled.get(source)
+        if regex is None:
+            regex = self.compiled[source] = re.compile(source)
+        target = request.url if options is not None and options[0] else request.lowered
+        return regex.search(target) is not None
+
+class FilterRequest:
+    def __init__(self, url, host, first_party, resource_type, index):
+        self.url = url
+        self.lowered = url.lower()
+        self.host = host
+        self.first_party = first_party
+        self.resource_type = resource_type
+        self.index = index
+        self.is_third_party = None
+
+    def third_party(self):
+        if self.is_third_party is None:
+            self.is_third_party = (not self.first_party or
+                                   self.index.site(self.host) != self.index.site(self.first_party))
+        return self.is_third_party
+
+    def options_match(self, options):
+        _, third_party, types, not_types, include, exclude = options
+        if types is not None and self.resource_type not in types:
+            return False
+        if not_types is not None and self.resource_type in not_types:
+            return False
+        if third_party is not None and self.third_party() != third_party:
+            return False
+        if include is not None or exclude is not None:
+            host = self.first_party
+            included = include is None
+            while host:
+                if exclude is not None and host in exclude:
+                    return False
+                if include is not None and host in include:
+                    included = True
+                dot = host.find('.')
+                host = host[dot + 1:] if dot >= 0 else ''
+            return included
+        return True
+
+class FilterIndex:
+    # Скомпилированные списки фильтров. Сохраняется в бинарный кэш,
+    # чтобы при запуске не разбирать текст списков заново
+    def __init__(self):
+        self.block = FilterRuleSet()
+        self.allow = FilterRuleSet()
+        self.sites = {}
+
+    @classmethod
+    def from_lines(cls, lines):
+        index = cls()
+        for line in lines:
+            rule = parse_filter(line)
+            if rule is not None:
+                exception, domain, pattern, options = rule
+                (index.allow if exception else index.block).add(domain, pattern, options)
+        return index
+
+    @staticmethod
+    def list_files(path=None):
+        path = path or filters_path
+        try:
+            names = sorted(name for name in os.listdir(path) if name.endswith('.txt'))
+        except OSError:
+            return []
+        return [os.path.join(path, name) for name in names]
+
+    @staticmethod
+    def cache_key(files):
+        key = [FILTER_CACHE_VERSION]
+        for path in files:
+            stat = os.stat(path)
+            key.append((os.path.basename(path), stat.st_size, stat.st_mtime_ns))
+        return key
+
+    @classmethod
+    def load(cls, files=None, cache_path=None):
+        # Из кэша, если списки не менялись, иначе разбор текста и новый кэш
+        files = cls.list_files() if files is None else files
+        cache_path = cache_path or filters_cache_path
+        key = cls.cache_key(files)
+        try:
+            with open(cache_path, 'rb') as f:
+                cached_key, index = pickle.load(f)
+            if cached_key == key:
+                return index
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Ошибка при чтении кэша фильтров: {str(e)}")
+
+        def lines():
+            for path in files:
+                with open(path, encoding='utf-8', errors='replace') as f:
+                    yield from f
+        index = cls.from_lines(lines())
+        try:
+            temp_path = cache_path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                pickle.dump((key, index), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, cache_path)
+        except Exception as e:
+            print(f"Ошибка при записи кэша фильтров: {str(e)}")
+        return index
+
+    def __getstate__(self):
+        # Скомпилированные выражения и кэш сайтов в файл не пишем
+        return {'block': (self.block.domains, self.block.tokens, self.block.generic),
+                'allow': (self.allow.domains, self.allow.tokens, self.allow.generic)}
+
+    def __setstate__(self, state):
+        self.sites = {}
+        for name in ('block', 'allow'):
+            rules = FilterRuleSet()
+            rules.domains, rules.tokens, rules.generic = state[name]
+            setattr(self, name, rules)
+
+    def size(self):
+        return self.block.size() + self.allow.size()
+
+    def site(self, host):
+        # Регистрируемый домен для проверки third-party, с кэшем
+        site = self.sites.get(host)
+        if site is None:
+            if len(self.sites) > 4096:
+                self.sites.clear()
+            labels = host.split('.')
+            suffix = PublicSuffixList.instance().suffix_labels(host) or 1
+            site = self.sites[host] = '.'.join(labels[-suffix - 1:])
+        return site
+
+    def should_block(self, url, host, first_party='', resource_type='other'):
+        request = FilterRequest(url, host, first_party, resource_type, self)
+        url_tokens = set(FILTER_TOKEN_RE.findall(request.lowered))
+        return (self.block.matches(request, url_tokens) and
+                not self.allow.matches(request, url_tokens))
+
+class ContentBlocker(QWebEngineUrlRequestInterceptor):
+    # interceptRequest вызывается в IO-потоке Chromium для каждого запроса,
+    # поэтому здесь только поиск по готовому индексу. Индекс строится
+    # в отдельном потоке и подменяется целиком.
+    def __init__(self, parent=None, registry=None):
+        super().__init__(parent)
+        self.index = FilterIndex()
+        self.enabled = CONTENT_BLOCKING
+        self.registry = registry
+        # Офлайн-хранилище: запросы сохраненной страницы к другим сайтам
+        # (CDN, шрифты) уводятся на их копии в archive://
+        self.offline_store = None
+        # Журнал запросов: заблокированные записываются здесь, остальные —
+        # перехватчиками страниц вкладок
+        self.recorder = None
+        # Страницы, открытые не GET-запросом (отправка форм): их не
+        # сохраняем офлайн
+        self.form_pages = set()
+        self.checked = 0
+        self.blocked = 0
+        if registry is not None:
+            registry.describe('browser_requests_blocked_total', 'counter',
+                              'Запросы, заблокированные фильтрами')
+            registry.describe('browser_filter_rules', 'gauge', 'Правил в индексе фильтров')
+            registry.describe('browser_filter_load_seconds', 'gauge',
+                              'Время загрузки индекса фильтров')
+
+    def load_async(self, files=None):
+        def run():
+            began = time.perf_counter()
+            index = FilterIndex.load(files)
+            self.index = index
+            if self.registry is not None:
+                self.registry.set('browser_filter_rules', index.size())
+                self.registry.set('browser_filter_load_seconds', time.perf_counter() - began)
+        threading.Thread(target=run, daemon=True).start()
+
+    def interceptRequest(self, info):
+        if info.resourceType() == QWebEngineUrlRequestInfo.ResourceTypeMainFrame:
+            key = offline_key(info.requestUrl())
+            if bytes(info.requestMethod()) == b'GET':
+                self.form_pages.discard(key)
+            else:
+                self.form_pages.add(key)
+        store = self.offline_store
+        if store is not None and info.firstPartyUrl().scheme() == OFFLINE_SCHEME:
+            url = info.requestUrl()
+            if url.scheme() in ('http', 'https') and store.lookup(url) is not None:
+                info.redirect(offline_url(url))
+                return
+        if not self.enabled:
+            return
+        try:
+            resource_type = FILTER_RESOURCE_TYPES.get(info.resourceType(), 'other')
+            if resource_type is None:
+                return
+            self.checked += 1
+            url = info.requestUrl()
+            if self.index.should_block(url.toString(), url.host().lower(),
+                                       info.firstPartyUrl().host().lower(), resource_type):
+                info.block(True)
+                self.blocked += 1
+                if self.registry is not None:
+                    self.registry.inc('browser_requests_blocked_total')
+                if self.recorder is not None:
+                    self.recorder.record(None, info.resourceType(),
+                                         bytes(info.requestMethod()).decode('ascii', 'replace'),
+                                         url.toString(), info.firstPartyUrl().toString(), True)
+        except Exception as e:
+            print(f"Ошибка при фильтрации запроса: {str(e)}")
+
+# Тайминги запросов страницы для HAR: navigation и resource из Resource Timing
+NETWORK_TIMING_JS = """
+(function() {
+    var fields = ['name', 'startTime', 'duration', 'domainLookupStart', 'domainLookupEnd',
+                  'connectStart', 'connectEnd', 'secureConnectionStart', 'requestStart',
+                  'responseStart', 'responseEnd', 'transferSize', 'encodedBodySize',
+                  'decodedBodySize', 'nextHopProtocol', 'responseStatus',
+                  'domContentLoadedEventStart', 'loadEventStart'];
+    var entries = performance.getEntriesByType('navigation')
+        .concat(performance.getEntriesByType('resource'));
+    return entries.map(function(e) {
+        var row = {};
+        fields.forEach(function(f) { if (f in e) row[f] = e[f]; });
+        return row;
+    });
+})();
+"""
+
+def har_time(seconds):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds)) + f'.{int(seconds * 1000) % 1000:03d}Z'
+
+def har_timings(entry):
+    # Фазы запроса в мс по записи Resource Timing. Для чужих сайтов без
+    # Timing-Allow-Origin браузер отдает только длительность
+    if entry is None:
+        return {'blocked': -1, 'dns': -1, 'connect': -1, 'ssl': -1,
+                'send': 0, 'wait': 0, 'receive': 0}
+    if not entry.get('requestStart'):
+        return {'blocked': -1, 'dns': -1, 'connect': -1, 'ssl': -1,
+                'send': 0, 'wait': 0, 'receive': round(max(0.0, entry.get('duration', 0)), 3)}
+    dns = max(0.0, entry['domainLookupEnd'] - entry['domainLookupStart'])
+    connect = max(0.0, entry['connectEnd'] - entry['connectStart'])
+    secure = entry.get('secureConnectionStart') or 0
+    return {
+        'blocked': round(max(0.0, entry['requestStart'] - entry['startTime'] - dns - connect), 3),
+        'dns': round(dns, 3),
+        'connect': round(connect, 3),
+        'ssl': round(entry['connectEnd'] - secure, 3) if secure else -1,
+        'send': 0,
+        'wait': round(max(0.0, entry['responseStart'] - entry['requestStart']), 3),
+        'receive': round(max(0.0, entry['responseEnd'] - entry['responseStart']), 3),
+    }
+
+class NetworkRecorder:
+    # Журнал запросов: кортежи в deque фиксированной длины, старые вытесняются.
+    # Запись — одно добавление в очередь, поэтому журнал не выключают;
+    # тайминги Resource Timing и сборка HAR — только при экспорте.
+    def __init__(self, size=NETWORK_LOG_SIZE):
+        self.enabled = NETWORK_RECORDING
+        self.records = deque(maxlen=size)
+
+    def record(self, tab_id, resource_type, method, url, first_party='', blocked=False):
+        if self.enabled:
+            self.records.append((time.time(), tab_id, resource_type, method, url, first_party, blocked))
+
+    def tab_records(self, tab_id, page_url=''):
+        # Заблокированные запросы записаны без вкладки (их видит только
+        # перехватчик профиля) и относятся к ней по адресу страницы
+        return [record for record in list(self.records)
+                if record[1] == tab_id or (record[1] is None and page_url and record[5] == page_url)]
+
+    def har(self, tab_id, title, page_url, timing_entries=None):
+        records = self.tab_records(tab_id, page_url)
+        main_frame = QWebEngineUrlRequestInfo.ResourceTypeMainFrame
+        # Resource Timing есть только у открытого сейчас документа:
+        # тайминги сопоставляются с запросами после последнего перехода
+        current = 0
+        for i, record in enumerate(records):
+            if record[2] == main_frame:
+                current = i
+        timings = {}
+        for entry in timing_entries or []:
+            timings.setdefault(entry.get('name'), deque()).append(entry)
+
+        pages = []
+        entries = []
+        for i, (started, _, resource_type, method, url, _, blocked) in enumerate(records):
+            if resource_type == main_frame or not pages:
+                pages.append({'startedDateTime': har_time(started), 'id': f'page_{len(pages) + 1}',
+                              'title': url, 'pageTimings': {'onContentLoad': -1, 'onLoad': -1}})
+            entry = None
+            if i >= current and not blocked and timings.get(url):
+                entry = timings[url].popleft()
+                if resource_type == main_frame:
+                    pages[-1]['title'] = title or url
+                    pages[-1]['pageTimings'] = {
+                        'onContentLoad': round(entry.get('domContentLoadedEventStart', -1), 3),
+                        'onLoad': round(entry.get('loadEventStart') or -1, 3)}
+            phases = har_timings(entry)
+            version = (entry or {}).get('nextHopProtocol') or ''
+            query = urllib.parse.parse_qsl(urllib.parse.urlsplit(url).query, keep_blank_values=True)
+            item = {
+                'pageref': pages[-1]['id'],
+                'startedDateTime': har_time(started),
+                'time': round(sum(value for name, value in phases.items() if name != 'ssl' and value > 0), 3),
+                'request': {'method': method, 'url': url, 'httpVersion': version,
+                            'cookies': [], 'headers': [],
+                            'queryString': [{'name': name, 'value': value} for name, value in query],
+                            'headersSize': -1, 'bodySize': -1},
+                'response': {'status': (entry or {}).get('responseStatus', 0), 'statusText': '',
+                             'httpVersion': version, 'cookies': [], 'headers': [],
+                             'content': {'size': (entry or {}).get('decodedBodySize', 0), 'mimeType': ''},
+                             'redirectURL': '', 'headersSize': -1,
+                             'bodySize': entry.get('encodedBodySize', -1) if entry else -1,
+                             '_transferSize': (entry or {}).get('transferSize', 0)},
+                'cache': {},
+                'timings': phases,
+                '_resourceType': NETWORK_RESOURCE_TYPES.get(resource_type, 'other'),
+            }
+            if blocked:
+                item['_error'] = 'net::ERR_BLOCKED_BY_CLIENT'
+            entries.append(item)
+        return {'log': {'version': '1.2',
+                        'creator': {'name': 'Web Browser', 'version': '1.0'},
+                        'pages': pages, 'entries': entries}}
+
+    def export_har(self, path, tab_id, title, page_url, timing_entries=None):
+        har = self.har(tab_id, title, page_url, timing_entries)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(har, f, ensure_ascii=False, indent=1)
+        return len(har['log']['entries'])
+
+class TabRequestRecorder(QWebEngineUrlRequestInterceptor):
+    # Перехватчик страницы одной вкладки, только пишет запрос в журнал.
+    # Qt вызывает его после перехватчика профиля (ContentBlocker)
+    # и только для запросов, которые тот не заблокировал
+    def __init__(self, recorder, tab_id, parent=None):
+        super().__init__(parent)
+        self.recorder = recorder
+        self.tab_id = tab_id
+
+    def interceptRequest(self, info):
+        if self.recorder.enabled:
+            self.recorder.record(self.tab_id, info.resourceType(),
+                                 bytes(info.requestMethod()).decode('ascii', 'replace'),
+                                 info.requestUrl().toString())
+
+class SessionJournal:
+    # Сессия хранится как журнал операций, одна JSON-запись на строку.
+    # Запись идет в отдельном потоке, поэтому UI никогда не ждет диска.
+    def __init__(self, path, compact_after=SESSION_COMPACT_AFTER):
+        self.path = path
+        self.compact_after = compact_after
+        self.state = {'tabs': [], 'active': None}
+        self.entries = 0
+        self.queue = queue.Queue()
+        self.thread = None
+
+    @staticmethod
+    def apply(state, entry):
+        op = entry.get('op')
+        tabs = state['tabs']
+        if op == 'open':
+            tab = {'id': entry['id'], 'url': entry.get('url', ''),
+                   'title': entry.get('title', '')}
+            index = entry.get('index', len(tabs))
+            tabs.insert(max(0, min(index, len(tabs))), tab)
+        elif op == 'update':
+            for tab in tabs:
+                if tab['id'] == entry['id']:
+                    if 'url' in entry:
+                        tab['url'] = entry['url']
+                    if 'title' in entry:
+                        tab['title'] = entry['title']
+                    break
+        elif op == 'close':
+            state['tabs'] = [tab for tab in tabs if tab['id'] != entry['id']]
+            if state['active'] == entry['id']:
+                state['active'] = None
+        elif op == 'active':
+            state['active'] = entry['id']
+
+    def load(self):
+        # Восстанавливаем состояние; оборванная последняя строка
+        # после падения просто пропускается
+        self.state = {'tabs': [], 'active': None}
+        self.entries = 0
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.apply(self.state, entry)
+                    self.entries += 1
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Ошибка при чтении сессии: {str(e)}")
+        return self.state['tabs'], self.state['active']
+
+    def start(self):
+        # Сразу сжимаем журнал, чтобы он не рос между запусками
+        self.compact()
+        self.thread = threading.Thread(target=self.writer_loop, daemon=True)
+        self.thread.start()
+
+    def append(self, entry):
+        self.queue.put(entry)
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def snapshot_entries(self):
+        entries = []
+        for index, tab in enumerate(self.state['tabs']):
+            entries.append({'op': 'open', 'index': index, **tab})
+        if self.state['active'] is not None:
+            entries.append({'op': 'active', 'id': self.state['active']})
+        return entries
+
+    def compact(self):
+        try:
+            tmp_path = self.path + '.tmp'
+            entries = self.snapshot_entries()
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.entries = len(entries)
+        except Exception as e:
+            print(f"Ошибка при сжатии журнала сессии: {str(e)}")
+
+    def writer_loop(self):
+        f = open(self.path, 'a', encoding='utf-8')
+        try:
+            while True:
+                entry = self.queue.get()
+                if entry is None:
+                    break
+                self.apply(self.state, entry)
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                f.flush()
+                self.entries += 1
+                if self.entries > self.compact_after:
+                    f.close()
+                    self.compact()
+                    f = open(self.path, 'a', encoding='utf-8')
+        except Exception as e:
+            print(f"Ошибка при записи сессии: {str(e)}")
+        finally:
+            f.close()
+
+class TabPlaceholder(QWidget):
+    # Легкая заглушка восстановленной вкладки: QWebEngineView
+    # создается только при первом переходе на вкладку
+    def __init__(self, tab_id, url, title, parent=None):
+        super().__init__(parent)
+        self.tab_id = tab_id
+        self.url = url
+        self.title = title
+
+class TabInfo:
+    def __init__(self, tab_id, widget, url='', title=''):
+        self.tab_id = tab_id
+        self.widget = widget
+        self.url = url
+        self.title = title
+        self.icon = QIcon()
+        # Состояние загрузки для tab.wait сервера управления
+        self.loading = False
+        self.load_ok = True
+
+class TabRegistry(QAbstractListModel):
+    # Все вкладки по постоянному id. Порядок строк совпадает с порядком
+    # вкладок в QTabWidget, а id -> строка хранится в dict, поэтому поиск
+    # вкладки не перебирает виджеты. Заголовки, иконки и адреса копятся
+    # и применяются разом на следующем проходе цикла событий.
+    TabIdRole = Qt.UserRole + 1
+    SearchRole = Qt.UserRole + 2
+
+    def __init__(self, tabs, parent=None):
+        super().__init__(parent)
+        self.tabs = tabs
+        self.infos = {}
+        self.order = []
+        self.rows = {}
+        self.pending = {}
+        self.flush_scheduled = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.order)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        info = self.infos[self.order[index.row()]]
+        if role == Qt.DisplayRole:
+            return info.title or info.url or 'Новая вкладка'
+        if role == Qt.DecorationRole:
+            return info.icon
+        if role == Qt.ToolTipRole:
+            return info.url
+        if role == self.TabIdRole:
+            return info.tab_id
+        if role == self.SearchRole:
+            return f"{info.title} {info.url}"
+        return None
+
+    def get(self, tab_id):
+        return self.infos.get(tab_id)
+
+    def row(self, tab_id):
+        return self.rows.get(tab_id, -1)
+
+    def __iter__(self):
+        return (self.infos[tab_id] for tab_id in self.order)
+
+    def reindex(self, start):
+        for row in range(start, len(self.order)):
+            self.rows[self.order[row]] = row
+
+    def insert(self, tab_id, widget, url, title, index=None):
+        row = len(self.order) if index is None else max(0, min(index, len(self.order)))
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.infos[tab_id] = TabInfo(tab_id, widget, url, title)
+        self.order.insert(row, tab_id)
+        self.reindex(row)
+        self.endInsertRows()
+        self.tabs.insertTab(row, widget, title)
+        self.tabs.setTabToolTip(row, url)
+        return row
+
+    def remove(self, tab_id):
+        row = self.rows.get(tab_id)
+        if row is None:
+            return None
+        self.beginRemoveRows(QModelIndex(), row, row)
+        info = self.infos.pop(tab_id)
+        del self.order[row]
+        del self.rows[tab_id]
+        self.pending.pop(tab_id, None)
+        self.reindex(row)
+        self.endRemoveRows()
+        self.tabs.removeTab(row)
+        return info.widget
+
+    def replace_widget(self, tab_id, widget):
+        # Заглушка восстановленной вкладки заменяется настоящей страницей
+        row = self.rows[tab_id]
+        info = self.infos[tab_id]
+        old = info.widget
+        info.widget = widget
+        current = self.tabs.currentIndex() == row
+        self.tabs.insertTab(row, widget, info.icon, info.title)
+        self.tabs.setTabToolTip(row, info.url)
+        if current:
+            self.tabs.setCurrentIndex(row)
+        self.tabs.removeTab(row + 1)
+        return old
+
+    def update(self, tab_id, **changes):
+        if tab_id not in self.infos:
+            return
+        self.pending.setdefault(tab_id, {}).update(changes)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            QTimer.singleShot(0, self.flush)
+
+    def flush(self):
+        self.flush_scheduled = False
+        pending, self.pending = self.pending, {}
+        changed_rows = []
+        for tab_id, changes in pending.items():
+            info = self.infos.get(tab_id)
+            if info is None:
+                continue
+            row = self.rows[tab_id]
+            for name, value in changes.items():
+                setattr(info, name, value)
+            if 'title' in changes:
+                self.tabs.setTabText(row, info.title or 'Новая вкладка')
+            if 'icon' in changes:
+                self.tabs.setTabIcon(row, info.icon)
+            changed_rows.append(row)
+        if changed_rows:
+            self.dataChanged.emit(self.index(min(changed_rows)), self.index(max(changed_rows)))
+
+class TabListPanel(QWidget):
+    # Вертикальный список вкладок с поиском по заголовку и адресу.
+    # QListView с одинаковой высотой строк рисует только видимые строки,
+    # поэтому сотни вкладок не замедляют ни список, ни фильтр.
+    close_requested = pyqtSignal(int)
+
+    def __init__(self, registry, tabs, parent=None):
+        super().__init__(parent)
+        self.registry = registry
+        self.tabs = tabs
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(4, 4, 4, 4)
+        self.search = QLineEdit()
+        self.search.setPlaceholderText('Поиск по вкладкам')
+        self.search.setClearButtonEnabled(True)
+        layout.addWidget(self.search)
+
+        self.proxy = QSortFilterProxyModel(self)
+        self.proxy.setSourceModel(registry)
+        self.proxy.setFilterRole(TabRegistry.SearchRole)
+        self.proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.search.textChanged.connect(self.proxy.setFilterFixedString)
+        self.search.returnPressed.connect(lambda: self.activate(self.proxy.index(0, 0)))
+
+        self.view = QListView()
+        self.view.setModel(self.proxy)
+        self.view.setUniformItemSizes(True)
+        self.view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.view.setIconSize(QSize(16, 16))
+        self.view.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.view.customContextMenuRequested.connect(self.show_context_menu)
+        self.view.clicked.connect(self.activate)
+        self.view.activated.connect(self.activate)
+        layout.addWidget(self.view)
+
+        self.tabs.currentChanged.connect(self.sync_selection)
+        self.proxy.modelReset.connect(lambda: self.sync_selection(self.tabs.currentIndex()))
+
+    def activate(self, index):
+        if index.isValid():
+            self.tabs.setCurrentIndex(self.proxy.mapToSource(index).row())
+
+    def sync_selection(self, row):
+        index = self.proxy.mapFromSource(self.registry.index(row)) if row >= 0 else QModelIndex()
+        self.view.setCurrentIndex(index)
+        if index.isValid():
+            self.view.scrollTo(index)
+
+    def show_context_menu(self, pos):
+        index = self.view.indexAt(pos)
+        if not index.isValid():
+            return
+        row = self.proxy.mapToSource(index).row()
+        menu = QMenu(self)
+        close_action = menu.addAction('Закрыть вкладку')
+        if menu.exec_(self.view.viewport().mapToGlobal(pos)) is close_action:
+            self.close_requested.emit(row)
+
+class TabThumbnails(QObject):
+    # Миниатюры вкладок. Снимок вида (grab) делается в потоке интерфейса,
+    # уменьшение, запись на диск и чтение с диска — в отдельном потоке.
+    # В памяти — LRU с пределом по байтам; вытесненные миниатюры остаются
+    # на диске, поэтому у замороженных, выгруженных и восстановленных
+    # из сессии вкладок есть последний снимок.
+    ready = pyqtSignal(int)
+    loaded = pyqtSignal(int, QImage)
+
+    def __init__(self, root=None, limit_mb=THUMBNAIL_CACHE_MB, parent=None):
+        super().__init__(parent)
+        self.root = root or thumbnails_path
+        os.makedirs(self.root, exist_ok=True)
+        self.limit = limit_mb * 1024 * 1024
+        self.images = OrderedDict()
+        self.bytes = 0
+        self.loading = set()
+        # id закрытых вкладок (новым вкладкам id не повторяются): снимок,
+        # который еще обрабатывался при закрытии, в память не попадает
+        self.removed = set()
+        # Один поток: снимки и чтения одной вкладки идут по порядку
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.loaded.connect(self.put)
+
+    def path(self, tab_id):
+        return os.path.join(self.root, f'{tab_id}.{THUMBNAIL_FORMAT.lower()}')
+
+    def capture(self, tab_id, view):
+        if tab_id in self.removed or not view.isVisible():
+            return False
+        try:
+            image = view.grab().toImage()
+        except Exception as e:
+            print(f"Ошибка при снимке вкладки: {str(e)}")
+            return False
+        if image.isNull():
+            return False
+        self.executor.submit(self.process, tab_id, image)
+        return True
+
+    def process(self, tab_id, image):
+        try:
+            thumbnail = image.scaled(THUMBNAIL_SIZE, THUMBNAIL_SIZE * 10 // 16,
+                                     Qt.KeepAspectRatioByExpanding, Qt.SmoothTransformation)
+            thumbnail = thumbnail.copy(0, 0, THUMBNAIL_SIZE, THUMBNAIL_SIZE * 10 // 16)
+            path = self.path(tab_id)
+            temp_path = f'{path}.tmp'
+            if thumbnail.save(temp_path, THUMBNAIL_FORMAT, THUMBNAIL_QUALITY):
+                os.replace(temp_path, path)
+            self.loaded.emit(tab_id, thumbnail)
+        except Exception as e:
+            print(f"Ошибка при сохранении миниатюры: {str(e)}")
+
+    def load(self, tab_id):
+        image = QImage(self.path(tab_id))
+        if not image.isNull():
+            self.loaded.emit(tab_id, image)
+
+    def put(self, tab_id, image):
+        self.loading.discard(tab_id)
+        if tab_id in self.removed:
+            return
+        old = self.images.pop(tab_id, None)
+        if old is not None:
+            self.bytes -= old.sizeInBytes()
+        self.images[tab_id] = image
+        self.bytes += image.sizeInBytes()
+        while self.bytes > self.limit and len(self.images) > 1:
+            _, evicted = self.images.popitem(last=False)
+            self.bytes -= evicted.sizeInBytes()
+        self.ready.emit(tab_id)
+
+    def get(self, tab_id):
+        # Миниатюра из памяти или None; с диска она читается в фоне
+        # и приходит сигналом ready
+        image = self.images.get(tab_id)
+        if image is not None:
+            self.images.move_to_end(tab_id)
+            return image
+        if tab_id not in self.loading and os.path.exists(self.path(tab_id)):
+            self.loading.add(tab_id)
+            self.executor.submit(self.load, tab_id)
+        return None
+
+    def remove(self, tab_id):
+        self.removed.add(tab_id)
+        self.loading.discard(tab_id)
+        image = self.images.pop(tab_id, None)
+        if image is not None:
+            self.bytes -= image.sizeInBytes()
+        self.executor.submit(self.delete_files, [self.path(tab_id)])
+
+    def prune(self, tab_ids):
+        # Снимки вкладок, которых больше нет в сессии
+        keep = {os.path.basename(self.path(tab_id)) for tab_id in tab_ids}
+        self.executor.submit(self.delete_files, [os.path.join(self.root, name)
+                                                 for name in os.listdir(self.root)
+                                                 if name not in keep])
+
+    @staticmethod
+    def delete_files(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+class TabOverviewModel(QIdentityProxyModel):
+    # Вкладки из TabRegistry с миниатюрами вместо иконок
+    def __init__(self, registry, thumbnails, parent=None):
+        super().__init__(parent)
+        self.registry = registry
+        self.thumbnails = thumbnails
+        self.setSourceModel(registry)
+        self.placeholder = QImage(THUMBNAIL_SIZE, THUMBNAIL_SIZE * 10 // 16, QImage.Format_RGB32)
+        self.placeholder.fill(QColor('#e8eaed'))
+        thumbnails.ready.connect(self.thumbnail_ready)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DecorationRole and index.isValid():
+            tab_id = super().data(index, TabRegistry.TabIdRole)
+            image = self.thumbnails.get(tab_id)
+            return image if image is not None else self.placeholder
+        return super().data(index, role)
+
+    def thumbnail_ready(self, tab_id):
+        row = self.registry.row(tab_id)
+        if row >= 0:
+            index = self.index(row, 0)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+class TabOverview(QDialog):
+    # Сетка вкладок с миниатюрами и поиском. Список рисует только видимые
+    # ячейки, поэтому и миниатюры с диска читаются только для них
+    def __init__(self, registry, thumbnails, tabs, parent=None):
+        super().__init__(parent)
+        self.tabs = tabs
+        self.setWindowTitle("Обзор вкладок")
+        self.resize(980, 640)
+
+        layout = QVBoxLayout(self)
+        self.search = QLineEdit()
+        self.search.setPlaceholderText("Поиск по вкладкам")
+        self.search.setClearButtonEnabled(True)
+        layout.addWidget(self.search)
+
+        self.model = TabOverviewModel(registry, thumbnails, self)
+        self.proxy = QSortFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+        self.proxy.setFilterRole(TabRegistry.SearchRole)
+        self.proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.search.textChanged.connect(self.proxy.setFilterFixedString)
+        self.search.returnPressed.connect(lambda: self.activate(self.proxy.index(0, 0)))
+
+        size = QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE * 10 // 16)
+        self.view = QListView()
+        self.view.setModel(self.proxy)
+        self.view.setViewMode(QListView.IconMode)
+        self.view.setMovement(QListView.Static)
+        self.view.setResizeMode(QListView.Adjust)
+        self.view.setUniformItemSizes(True)
+        self.view.setIconSize(size)
+        self.view.setGridSize(size + QSize(24, 44))
+        self.view.setTextElideMode(Qt.ElideRight)
+        self.view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.view.clicked.connect(self.activate)
+        self.view.activated.connect(self.activate)
+        layout.addWidget(self.view)
+
+    def showEvent(self, event):
+        self.search.clear()
+        self.search.setFocus()
+        index = self.proxy.mapFromSource(self.model.index(self.tabs.currentIndex(), 0))
+        self.view.setCurrentIndex(index)
+        super().showEvent(event)
+
+    def activate(self, index):
+        if index.isValid():
+            self.tabs.setCurrentIndex(self.model.mapToSource(self.proxy.mapToSource(index)).row())
+            self.accept()
+
+# Видимый текст страницы для поиска по вкладкам
+TAB_TEXT_JS = """
+(function() {
+    var body = document.body;
+    return body ? body.innerText.slice(0, %d) : '';
+})();
+""" % TAB_SEARCH_MAX_CHARS
+
+WORD_RE = re.compile(r'\w+')
+
+def tokenize(text):
+    return WORD_RE.findall(text.lower())
+
+class TabTextIndex(QObject):
+    # Обратный индекс по тексту открытых вкладок: слово -> {id вкладки: частота}.
+    # Разбор текста идет в отдельном потоке, под блокировкой только замена
+    # списков вкладки, поэтому поиск в потоке интерфейса не ждет индексации.
+    # Словарь дополнительно хранится отсортированным для поиска по началу слова.
+    indexed = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.lock = threading.Lock()
+        self.postings = {}
+        self.vocabulary = []
+        self.terms = {}
+        self.lengths = {}
+        self.docs = {}
+        self.total_length = 0
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def add(self, tab_id, title, url, text):
+        self.executor.submit(self.process, tab_id, title, url, text)
+
+    def remove(self, tab_id):
+        self.executor.submit(self.process, tab_id, None, None, None)
+
+    def process(self, tab_id, title, url, text):
+        try:
+            counts = {}
+            if text is not None:
+                # Текст в нижнем регистре хранится рядом с исходным:
+                # отрывки для результатов ищутся в нем без lower() на каждый запрос
+                lowered = text.lower()
+                # Заголовок считается дважды: совпадение в нем важнее
+                for token in tokenize(f'{title}\n{title}\n{url}\n{lowered}'):
+                    counts[token] = counts.get(token, 0) + 1
+            with self.lock:
+                self.drop(tab_id)
+                if text is not None:
+                    self.insert(tab_id, counts, (title, url, text, lowered))
+            if text is not None:
+                self.indexed.emit(tab_id)
+        except Exception as e:
+            print(f"Ошибка при индексации вкладки: {str(e)}")
+
+    def drop(self, tab_id):
+        for token in self.terms.pop(tab_id, ()):
+            posting = self.postings[token]
+            del posting[tab_id]
+            if not posting:
+                del self.postings[token]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+        self.total_length -= self.lengths.pop(tab_id, 0)
+        self.docs.pop(tab_id, None)
+
+    def insert(self, tab_id, counts, doc):
+        for token, count in counts.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                bisect.insort(self.vocabulary, token)
+            posting[tab_id] = count
+        self.terms[tab_id] = list(counts)
+        length = sum(counts.values())
+        self.lengths[tab_id] = length
+        self.total_length += length
+        self.docs[tab_id] = doc
+
+    def expand(self, token):
+        # Слова словаря, начинающиеся с token
+        start = bisect.bisect_left(self.vocabulary, token)
+        words = []
+        for word in self.vocabulary[start:start + TAB_SEARCH_PREFIX_WORDS]:
+            if not word.startswith(token):
+                break
+            words.append(word)
+        return words
+
+    def search(self, query, limit=TAB_SEARCH_RESULTS):
+        # Вкладки, где есть все слова запроса, по убыванию BM25.
+        # Последнее слово, пока его набирают, ищется по началу
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        typing = not query[-1:].isspace()
+        with self.lock:
+            if not self.docs:
+                return []
+            average = self.total_length / len(self.docs)
+            scores = None
+            for i, token in enumerate(tokens):
+                words = self.expand(token) if typing and i == len(tokens) - 1 else [token]
+                token_scores = {}
+                for word in words:
+                    posting = self.postings.get(word)
+                    if not posting:
+                        continue
+                    idf = math.log(1 + (len(self.docs) - len(posting) + 0.5) / (len(posting) + 0.5))
+                    for tab_id, count in posting.items():
+                        if scores is not None and tab_id not in scores:
+                            continue
+                        norm = 1.2 * (0.25 + 0.75 * self.lengths[tab_id] / average)
+                        score = idf * count * 2.2 / (count + norm)
+                        token_scores[tab_id] = max(token_scores.get(tab_id, 0.0), score)
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {tab_id: scores[tab_id] + score for tab_id, score in token_scores.items()}
+                if not scores:
+                    return []
+            best = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+            docs = [(tab_id, score, self.docs[tab_id]) for tab_id, score in best]
+
+        phrase = query.strip().lower()
+        hits = []
+        for tab_id, score, (title, url, text, lowered) in docs:
+            # Точное совпадение всей фразы поднимает вкладку выше
+            position = lowered.find(phrase)
+            if position >= 0 and len(tokens) > 1:
+                score *= 2
+            if position < 0:
+                position = max(0, lowered.find(tokens[0]))
+            hits.append((score, tab_id, title, url, self.snippet(text, position)))
+        hits.sort(key=lambda hit: -hit[0])
+        return hits
+
+    @staticmethod
+    def snippet(text, position):
+        start = max(0, position - TAB_SEARCH_SNIPPET // 2)
+        fragment = ' '.join(text[start:start + TAB_SEARCH_SNIPPET].split())
+        return ('…' if start else '') + fragment + '…'
+
+    def stats(self):
+        with self.lock:
+            return len(self.docs), len(self.postings)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+class TabSearchModel(QAbstractListModel):
+    TabIdRole = Qt.UserRole + 1
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.hits = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.hits)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        score, tab_id, title, url, snippet = self.hits[index.row()]
+        if role == Qt.DisplayRole:
+            return f"{title or url}\n{snippet}"
+        if role == Qt.ToolTipRole:
+            return url
+        if role == self.TabIdRole:
+            return tab_id
+        return None
+
+    def set_hits(self, hits):
+        self.beginResetModel()
+        self.hits = hits
+        self.endResetModel()
+
+class TabSearchDialog(QDialog):
+    # Поиск по тексту всех вкладок; выбранная вкладка открывается
+    # с подсветкой найденного
+    open_hit = pyqtSignal(int, str)
+
+    def __init__(self, index, parent=None):
+        super().__init__(parent)
+        self.index = index
+        self.setWindowTitle("Поиск по вкладкам")
+        self.resize(720, 520)
+
+        layout = QVBoxLayout(self)
+        self.search = QLineEdit()
+        self.search.setPlaceholderText("Текст на страницах открытых вкладок")
+        self.search.setClearButtonEnabled(True)
+        self.search.textChanged.connect(self.run_search)
+        self.search.returnPressed.connect(lambda: self.activate(self.model.index(0)))
+        layout.addWidget(self.search)
+
+        self.model = TabSearchModel(self)
+        self.view = QListView()
+        self.view.setModel(self.model)
+        self.view.setWordWrap(True)
+        self.view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.view.clicked.connect(self.activate)
+        self.view.activated.connect(self.activate)
+        layout.addWidget(self.view)
+
+        self.status = QLabel()
+        layout.addWidget(self.status)
+
+        # Пока окно открыто, новые страницы попадают в результаты
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(300)
+        self.refresh_timer.timeout.connect(lambda: self.run_search(self.search.text()))
+        index.indexed.connect(lambda tab_id: self.refresh_timer.start() if self.isVisible() else None)
+
+    def showEvent(self, event):
+        self.search.selectAll()
+        self.search.setFocus()
+        self.run_search(self.search.text())
+        super().showEvent(event)
+
+    def run_search(self, text):
+        began = time.perf_counter()
+        hits = self.index.search(text)
+        elapsed = (time.perf_counter() - began) * 1000
+        self.model.set_hits(hits)
+        pages, words = self.index.stats()
+        if text.strip():
+            self.status.setText(f"Найдено: {len(hits)} · {elapsed:.1f} мс · "
+                                f"в индексе {pages} вкладок, {words} слов")
+        else:
+            self.status.setText(f"В индексе {pages} вкладок, {words} слов")
+
+    def activate(self, index):
+        if index.isValid():
+            self.open_hit.emit(index.data(TabSearchModel.TabIdRole), self.search.text().strip())
+            self.accept()
+
+class ViewPool(QObject):
+    # Запас заранее созданных вкладок. Создание QWebEngineView и запуск
+    # рендерера — самая долгая часть Ctrl+T, поэтому вкладки готовятся
+    # по одной, пока окно простаивает, а add_new_tab берет готовую.
+    def __init__(self, profile, registry, size=VIEW_POOL_SIZE, parent=None):
+        super().__init__(parent)
+        self.profile = profile
+        self.registry = registry
+        self.size = size
+        self.ready = deque()        # (view, секунд на создание и прогрев)
+        self.warming = {}           # view -> начало создания
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.0
+
+        self.fill_timer = QTimer(self)
+        self.fill_timer.setSingleShot(True)
+        self.fill_timer.setInterval(VIEW_POOL_FILL_DELAY)
+        self.fill_timer.timeout.connect(self.fill)
+
+        registry.describe('browser_view_pool_requests_total', 'counter',
+                          'Новые вкладки: из запаса (hit) или созданные заново (miss)')
+        registry.describe('browser_view_pool_saved_seconds_total', 'counter',
+                          'Оценка времени, сэкономленного запасом вкладок')
+        registry.describe('browser_view_create_seconds', 'histogram',
+                          'Создание QWebEngineView со страницей')
+        self.schedule()
+
+    def create(self):
+        began = time.perf_counter()
+        view = QWebEngineView()
+        view.setPage(QWebEnginePage(self.profile, view))
+        self.registry.observe('browser_view_create_seconds', time.perf_counter() - began)
+        return view
+
+    def schedule(self):
+        if len(self.ready) + len(self.warming) < self.size and not self.fill_timer.isActive():
+            self.fill_timer.start()
+
+    def set_size(self, size):
+        self.size = size
+        while len(self.ready) > size:
+            self.ready.pop()[0].deleteLater()
+        self.schedule()
+
+    def fill(self):
+        try:
+            began = time.perf_counter()
+            view = self.create()
+            self.warming[view] = began
+            view.loadFinished.connect(lambda ok, view=view: self.warmed(view))
+            # Пустая страница запускает процесс рендерера заранее
+            view.setUrl(QUrl('about:blank'))
+        except Exception as e:
+            print(f"Ошибка при подготовке вкладки: {str(e)}")
+
+    def warmed(self, view):
+        began = self.warming.pop(view, None)
+        if began is None:
+            return
+        view.loadFinished.disconnect()
+        self.ready.append((view, time.perf_counter() - began))
+        self.schedule()
+
+    def take(self):
+        # Готовая вкладка или None, тогда вкладку создает вызывающий
+        if not self.ready:
+            self.misses += 1
+            self.registry.inc('browser_view_pool_requests_total', {'result': 'miss'})
+            self.schedule()
+            return None
+        view, cost = self.ready.popleft()
+        self.hits += 1
+        self.saved += cost
+        self.registry.inc('browser_view_pool_requests_total', {'result': 'hit'})
+        self.registry.inc('browser_view_pool_saved_seconds_total', value=cost)
+
+        # about:blank прогрева не должен остаться в истории «Назад»
+        def forget_warmup(ok, view=view):
+            view.loadFinished.disconnect(forget_warmup)
+            view.page().history().clear()
+        view.loadFinished.connect(forget_warmup)
+        self.schedule()
+        return view
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'saved_ms': round(self.saved * 1000, 1)}
+
+    def close(self):
+        self.fill_timer.stop()
+        for view, _ in self.ready:
+            view.deleteLater()
+        for view in self.warming:
+            view.deleteLater()
+        self.ready.clear()
+        self.warming.clear()
+
+def preload_key(qurl):
+    # https://example.com, https://example.com/ и адрес с #якорем — одна страница
+    qurl = qurl.adjusted(QUrl.RemoveFragment | QUrl.StripTrailingSlash)
+    if not qurl.path():
+        qurl.setPath('/')
+    return qurl.toString()
+
+class PagePreloader(QObject):
+    # Предзагрузка первой подсказки строки адреса в скрытой странице.
+    # Если пользователь подтверждает тот же адрес, страница переходит
+    # во вкладку уже загруженной или хотя бы начавшей загрузку.
+    def __init__(self, profile, registry, enabled=SPECULATIVE_PRELOAD, parent=None):
+        super().__init__(parent)
+        self.profile = profile
+        self.registry = registry
+        self.enabled = enabled
+        self.candidate = None
+        self.page = None
+        self.url = None
+        self.started = None
+        self.finished_at = None
+        self.load_ok = None
+        self.used = 0
+        self.wasted = 0
+        self.missed = 0
+        self.saved = 0.0
+
+        # Пока пользователь печатает, подсказка меняется на каждое нажатие
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(PRELOAD_DELAY)
+        self.timer.timeout.connect(self.start)
+
+        registry.describe('browser_preload_total', 'counter',
+                          'Предзагрузки: использованные (used), выброшенные (wasted), '
+                          'переходы без готовой страницы (miss)')
+        registry.describe('browser_preload_saved_seconds_total', 'counter',
+                          'Время загрузки страниц, выполненное до подтверждения')
+
+    def suggest(self, qurl):
+        # qurl None — подсказки для предзагрузки нет
+        if not self.enabled:
+            return
+        if qurl is not None and preload_key(qurl) == self.url:
+            self.timer.stop()
+            return
+        self.candidate = qurl
+        self.timer.start()
+
+    def start(self):
+        self.discard()
+        qurl = self.candidate
+        self.candidate = None
+        if qurl is None or qurl.scheme() not in ('http', 'https'):
+            return
+        try:
+            self.page = QWebEnginePage(self.profile, self)
+            self.page.setAudioMuted(True)
+            self.page.loadFinished.connect(self.load_finished)
+            self.url = preload_key(qurl)
+            self.started = time.perf_counter()
+            self.finished_at = None
+            self.load_ok = None
+            self.page.setUrl(qurl)
+        except Exception as e:
+            print(f"Ошибка при предзагрузке страницы: {str(e)}")
+
+    def load_finished(self, ok):
+        if self.finished_at is None:
+            self.finished_at = time.perf_counter()
+            self.load_ok = ok
+
+    def take(self, qurl):
+        # Предзагруженная страница для qurl или None
+        if not self.enabled:
+            return None
+        self.timer.stop()
+        self.candidate = None
+        fresh = self.started is not None and time.perf_counter() - self.started < PRELOAD_MAX_AGE
+        if self.page is None or not fresh or preload_key(qurl) != self.url:
+            self.discard()
+            self.missed += 1
+            self.registry.inc('browser_preload_total', {'result': 'miss'})
+            return None
+        page = self.page
+        self.page = None
+        self.url = None
+        page.loadFinished.disconnect(self.load_finished)
+        page.setAudioMuted(False)
+        saved = (self.finished_at or time.perf_counter()) - self.started
+        self.used += 1
+        self.saved += saved
+        self.registry.inc('browser_preload_total', {'result': 'used'})
+        self.registry.inc('browser_preload_saved_seconds_total', value=saved)
+        return page
+
+    def discard(self):
+        self.timer.stop()
+        if self.page is None:
+            return
+        self.wasted += 1
+        self.registry.inc('browser_preload_total', {'result': 'wasted'})
+        self.page.deleteLater()
+        self.page = None
+        self.url = None
+
+    def stats(self):
+        total = self.used + self.missed
+        return {'used': self.used, 'wasted': self.wasted, 'missed': self.missed,
+                'hit_rate': self.used / total if total else 0.0,
+                'saved_ms': round(self.saved * 1000, 1)}
+
+def process_cpu_seconds(pid):
+    # Процессорное время процесса (user + system) в секундах или None
+    if not pid:
+        return None
+    try:
+        if sys.platform.startswith('linux'):
+            with open(f'/proc/{pid}/stat') as f:
+                # Имя процесса в скобках может содержать пробелы
+                fields = f.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        import psutil
+        times = psutil.Process(pid).cpu_times()
+        return times.user + times.system
+    except Exception:
+        return None
+
+class ProcessSampler(QObject):
+    # Память и CPU процессов замеряются в отдельном потоке: чтение /proc
+    # для десятков рендереров не должно задерживать интерфейс.
+    # sampled(dict): pid -> (rss в байтах или None, CPU в % или None)
+    sampled = pyqtSignal(dict)
+
+    def __init__(self, interval=TASK_MANAGER_INTERVAL, parent=None):
+        super().__init__(parent)
+        self.interval = interval
+        self.pids = frozenset()
+        self.previous = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def set_pids(self, pids):
+        # Набор подменяется целиком, поток читает его без блокировки
+        self.pids = frozenset(pid for pid in pids if pid)
+
+    def start(self):
+        if self.thread is None:
+            # У каждого потока свое событие: остановленный поток может
+            # еще не проснуться, когда запускается следующий
+            self.stop_event = threading.Event()
+            self.previous = {}
+            self.thread = threading.Thread(target=self.run, args=(self.stop_event,), daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread = None
+
+    def run(self, stop_event):
+        while not stop_event.is_set():
+            try:
+                samples = self.sample()
+                if not stop_event.is_set():
+                    self.sampled.emit(samples)
+            except Exception as e:
+                print(f"Ошибка при замере процессов: {str(e)}")
+            stop_event.wait(self.interval)
+
+    def sample(self):
+        now = time.monotonic()
+        samples = {}
+        current = {}
+        for pid in self.pids:
+            cpu_seconds = process_cpu_seconds(pid)
+            cpu = None
+            if cpu_seconds is not None:
+                current[pid] = (cpu_seconds, now)
+                previous = self.previous.get(pid)
+                if previous is not None and now > previous[1]:
+                    cpu = (cpu_seconds - previous[0]) / (now - previous[1]) * 100
+            samples[pid] = (process_rss(pid), cpu)
+        self.previous = current
+        return samples
+
+    def close(self):
+        self.stop_event.set()
+
+class TaskManager(QObject):
+    # Сопоставляет вкладки процессам рендерера и делит замеры процесса
+    # поровну между вкладками, которые его используют. Результат —
+    # строки для окна, JSON и показатели в реестре метрик.
+    updated = pyqtSignal()
+
+    def __init__(self, tab_registry, metrics_registry, parent=None):
+        super().__init__(parent)
+        self.tab_registry = tab_registry
+        self.metrics_registry = metrics_registry
+        self.rows = []
+        self.browser = {}
+        self.sampled_at = None
+
+        self.sampler = ProcessSampler(parent=self)
+        self.sampler.sampled.connect(self.apply_samples)
+        self.targets = []
+
+        describe = metrics_registry.describe
+        describe('browser_tab_memory_bytes', 'gauge',
+                 'Память рендерера, приходящаяся на вкладку')
+        describe('browser_tab_cpu_percent', 'gauge',
+                 'Загрузка CPU рендерера, приходящаяся на вкладку')
+        describe('browser_process_memory_bytes', 'gauge', 'Память процесса браузера')
+        describe('browser_process_cpu_percent', 'gauge', 'Загрузка CPU процесса браузера')
+
+    def start(self):
+        self.collect_targets()
+        self.sampler.start()
+
+    def stop(self):
+        # Для периодической выгрузки метрик замеры нужны и без окна
+        if not metrics_export_path:
+            self.sampler.stop()
+
+    def collect_targets(self):
+        # Вызывается в потоке интерфейса: страницы Qt трогать можно только здесь
+        targets = []
+        for info in self.tab_registry:
+            pid = None
+            if isinstance(info.widget, QWebEngineView):
+                pid = getattr(info.widget.page(), 'renderProcessPid', lambda: 0)() or None
+            targets.append((info.tab_id, pid))
+        self.targets = targets
+        self.sampler.set_pids([pid for _, pid in targets] + [os.getpid()])
+
+    def apply_samples(self, samples):
+        try:
+            shared = {}
+            for _, pid in self.targets:
+                if pid:
+                    shared[pid] = shared.get(pid, 0) + 1
+            rows = []
+            for tab_id, pid in self.targets:
+                info = self.tab_registry.get(tab_id)
+                if info is None:
+                    continue
+                rss, cpu = samples.get(pid, (None, None))
+                tabs = shared.get(pid, 0)
+                rows.append({
+                    'tab_id': tab_id,
+                    'title': info.title,
+                    'url': info.url,
+                    'pid': pid,
+                    'tabs_in_process': tabs,
+                    'memory_bytes': int(rss / tabs) if rss is not None else None,
+                    'cpu_percent': round(cpu / tabs, 1) if cpu is not None else None,
+                })
+            rss, cpu = samples.get(os.getpid(), (None, None))
+            self.browser = {'pid': os.getpid(), 'memory_bytes': rss,
+                            'cpu_percent': round(cpu, 1) if cpu is not None else None}
+            self.rows = rows
+            self.sampled_at = time.time()
+            self.export_metrics()
+            self.updated.emit()
+        except Exception as e:
+            print(f"Ошибка при обновлении диспетчера задач: {str(e)}")
+        # Вкладки открываются и закрываются, pid меняется после падения рендерера
+        self.collect_targets()
+
+    def export_metrics(self):
+        registry = self.metrics_registry
+        # Закрытые вкладки не должны оставаться в выгрузке
+        registry.clear('browser_tab_memory_bytes')
+        registry.clear('browser_tab_cpu_percent')
+        for row in self.rows:
+            labels = {'tab': str(row['tab_id']),
+                      'host': PageMetrics.host_label(QUrl(row['url']))}
+            if row['memory_bytes'] is not None:
+                registry.set('browser_tab_memory_bytes', row['memory_bytes'], labels)
+            if row['cpu_percent'] is not None:
+                registry.set('browser_tab_cpu_percent', row['cpu_percent'], labels)
+        if self.browser['memory_bytes'] is not None:
+            registry.set('browser_process_memory_bytes', self.browser['memory_bytes'])
+        if self.browser['cpu_percent'] is not None:
+            registry.set('browser_process_cpu_percent', self.browser['cpu_percent'])
+
+    def to_json(self):
+        return {'time': self.sampled_at, 'browser': self.browser, 'tabs': self.rows}
+
+    def kill(self, tab_id):
+        # Рендерер завершается целиком, вместе со всеми его вкладками;
+        # вкладки покажут ошибку, перезагрузка запустит новый процесс
+        for row in self.rows:
+            if row['tab_id'] == tab_id and row['pid']:
+                os.kill(row['pid'], getattr(signal, 'SIGKILL', signal.SIGTERM))
+                return True
+        return False
+
+    def close(self):
+        self.sampler.close()
+
+class TaskTableModel(QAbstractTableModel):
+    COLUMNS = ('Вкладка', 'Процесс', 'Память', 'CPU')
+
+    def __init__(self, manager, parent=None):
+        super().__init__(parent)
+        self.manager = manager
+        self.rows = []
+        manager.updated.connect(self.refresh)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return row['title'] or row['url'] or 'Новая вкладка'
+            if column == 1:
+                if not row['pid']:
+                    return '—'
+                shared = row['tabs_in_process']
+                return f"{row['pid']} (×{shared})" if shared > 1 else str(row['pid'])
+            if column == 2:
+                return format_size(row['memory_bytes']) if row['memory_bytes'] is not None else '—'
+            if column == 3:
+                return f"{row['cpu_percent']:.1f}%" if row['cpu_percent'] is not None else '—'
+        if role == Qt.UserRole:
+            # Значение для сортировки: числа, а не подписи
+            if column == 0:
+                return (row['title'] or row['url']).lower()
+            if column == 1:
+                return row['pid'] or 0
+            if column == 2:
+                return row['memory_bytes'] or 0
+            if column == 3:
+                return row['cpu_percent'] or 0.0
+        if role == Qt.ToolTipRole:
+            return row['url']
+        if role == Qt.TextAlignmentRole and column > 0:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def refresh(self):
+        rows = self.manager.rows
+        if [row['tab_id'] for row in rows] == [row['tab_id'] for row in self.rows]:
+            # Те же вкладки: обновляем значения, выделение и сортировка остаются
+            self.rows = rows
+            if rows:
+                self.dataChanged.emit(self.index(0, 0),
+                                      self.index(len(rows) - 1, len(self.COLUMNS) - 1))
+            return
+        self.beginResetModel()
+        self.rows = rows
+        self.endResetModel()
+
+class TaskManagerWindow(QDialog):
+    def __init__(self, manager, browser, parent=None):
+        super().__init__(parent)
+        self.manager = manager
+        self.browser = browser
+        self.setWindowTitle("Диспетчер задач")
+        self.resize(640, 420)
+
+        layout = QVBoxLayout(self)
+        self.model = TaskTableModel(manager, self)
+        self.proxy = QSortFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+        self.proxy.setSortRole(Qt.UserRole)
+        self.proxy.setDynamicSortFilter(True)
+
+        self.view = QTableView()
+        self.view.setModel(self.proxy)
+        self.view.setSortingEnabled(True)
+        self.view.sortByColumn(2, Qt.DescendingOrder)
+        self.view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.view.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.view.verticalHeader().hide()
+        self.view.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.view.doubleClicked.connect(self.switch_to_tab)
+        layout.addWidget(self.view)
+
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+
+        buttons = QHBoxLayout()
+        reload_btn = QPushButton("Перезагрузить")
+        reload_btn.clicked.connect(self.reload_selected)
+        buttons.addWidget(reload_btn)
+        kill_btn = QPushButton("Завершить процесс")
+        kill_btn.clicked.connect(self.kill_selected)
+        buttons.addWidget(kill_btn)
+        buttons.addStretch()
+        export_btn = QPushButton("Экспорт JSON")
+        export_btn.clicked.connect(self.export_json)
+        buttons.addWidget(export_btn)
+        close_btn = QPushButton("Закрыть")
+        close_btn.clicked.connect(self.close)
+        buttons.addWidget(close_btn)
+        layout.addLayout(buttons)
+
+        manager.updated.connect(self.update_summary)
+
+    def showEvent(self, event):
+        self.manager.start()
+        self.model.refresh()
+        self.update_summary()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        # Срабатывает и при закрытии окна
+        self.manager.stop()
+        super().hideEvent(event)
+
+    def update_summary(self):
+        browser = self.manager.browser
+        if not browser or browser['memory_bytes'] is None:
+            self.summary_label.setText("Браузер: —")
+            return
+        text = f"Браузер (pid {browser['pid']}): {format_size(browser['memory_bytes'])}"
+        if browser['cpu_percent'] is not None:
+            text += f", CPU {browser['cpu_percent']:.1f}%"
+        self.summary_label.setText(text)
+
+    def selected_row(self):
+        indexes = self.view.selectionModel().selectedRows()
+        if not indexes:
+            return None
+        return self.model.rows[self.proxy.mapToSource(indexes[0]).row()]
+
+    def switch_to_tab(self, index):
+        row = self.model.rows[self.proxy.mapToSource(index).row()]
+        tab_index = self.browser.tab_registry.row(row['tab_id'])
+        if tab_index >= 0:
+            self.browser.tabs.setCurrentIndex(tab_index)
+
+    def reload_selected(self):
+        row = self.selected_row()
+        info = self.browser.tab_registry.get(row['tab_id']) if row else None
+        if info is not None and isinstance(info.widget, QWebEngineView):
+            info.widget.reload()
+
+    def kill_selected(self):
+        row = self.selected_row()
+        if row is None or not row['pid']:
+            return
+        if row['tabs_in_process'] > 1:
+            reply = QMessageBox.question(
+                self, "Завершить процесс",
+                f"Процесс {row['pid']} отображает вкладок: {row['tabs_in_process']}. "
+                f"Все они будут остановлены. Продолжить?",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes:
+                return
+        try:
+            self.manager.kill(row['tab_id'])
+        except Exception as e:
+            print(f"Ошибка при завершении процесса: {str(e)}")
+
+    def export_json(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Экспорт диспетчера задач",
+                                              os.path.join(downloads_path, 'tasks.json'),
+                                              "JSON (*.json)")
+        if not path:
+            return
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.manager.to_json(), f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"Ошибка при экспорте диспетчера задач: {str(e)}")
+
+class ArchiveStore:
+    # Архив страниц: MHTML разбирается на части, каждая часть хранится
+    # один раз в objects/ под своим SHA-256, а в pages/ лежит манифест
+    # страницы со ссылками на части. Общие CSS, JS и шрифты сайта
+    # занимают место один раз, сколько бы страниц их ни использовало.
+    def __init__(self, root=None):
+        self.root = root or archive_path
+        self.objects_path = os.path.join(self.root, 'objects')
+        self.pages_path = os.path.join(self.root, 'pages')
+        os.makedirs(self.objects_path, exist_ok=True)
+        os.makedirs(self.pages_path, exist_ok=True)
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_path, digest[:2], digest)
+
+    def put(self, data):
+        # Возвращает хэш и сколько байт реально записано (0 — уже было)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if os.path.exists(path):
+            return digest, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        return digest, len(data)
+
+    @staticmethod
+    def header_items(message, skip):
+        return [(name, ' '.join(str(value).split())) for name, value in message.items()
+                if name.lower() not in skip]
+
+    @staticmethod
+    def split_headers(data):
+        # Заголовки и тело; строки MHTML обычно через CRLF, но бывает и LF
+        end, skip = data.find(b'\r\n\r\n'), 4
+        lf_end = data.find(b'\n\n')
+        if lf_end >= 0 and (end < 0 or lf_end < end):
+            end, skip = lf_end, 2
+        if end < 0:
+            return data, b''
+        return data[:end], data[end + skip:]
+
+    @classmethod
+    def split_mhtml(cls, data):
+        # Быстрый разбор MHTML: email.message_from_bytes построчно
+        # разбирает мегабайты base64 в несколько раз медленнее
+        parser = email.parser.BytesHeaderParser()
+        head, body = cls.split_headers(data)
+        message = parser.parsebytes(head)
+        boundary = message.get_param('boundary')
+        if not boundary:
+            return message, [(message, body)]
+        parts = []
+        for chunk in body.split(b'--' + boundary.encode('ascii', 'replace'))[1:]:
+            if chunk.startswith(b'--'):
+                break
+            head, body = cls.split_headers(chunk.lstrip(b'\r\n'))
+            headers = parser.parsebytes(head)
+            if body.endswith(b'\r\n'):
+                body = body[:-2]
+            elif body.endswith(b'\n'):
+                body = body[:-1]
+            encoding = (headers.get('Content-Transfer-Encoding') or '').strip().lower()
+            if encoding == 'base64':
+                body = binascii.a2b_base64(body)
+            elif encoding == 'quoted-printable':
+                body = binascii.a2b_qp(body)
+            parts.append((headers, body))
+        return message, parts
+
+    def add_mhtml(self, mhtml_path, url=''):
+        with open(mhtml_path, 'rb') as f:
+            message, mhtml_parts = self.split_mhtml(f.read())
+        parts = []
+        logical = stored = 0
+        for headers, data in mhtml_parts:
+            digest, written = self.put(data)
+            logical += len(data)
+            stored += written
+            parts.append({'headers': self.header_items(headers, ('content-transfer-encoding',)),
+                          'sha256': digest, 'size': len(data)})
+
+        manifest = {
+            'url': url,
+            'saved': time.time(),
+            'type': message.get_param('type') or 'text/html',
+            'headers': self.header_items(message, ('content-type', 'mime-version')),
+            'parts': parts,
+        }
+        name = re.sub(r'[^\w.-]+', '_', url.split('://', 1)[-1])[:80] or 'page'
+        data = json.dumps(manifest, ensure_ascii=False).encode('utf-8')
+        path = os.path.join(self.pages_path,
+                            f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-"
+                            f"{hashlib.sha256(data).hexdigest()[:8]}.json")
+        with open(path, 'wb') as f:
+            f.write(data)
+        return {'manifest': path, 'parts': len(parts),
+                'logical_bytes': logical, 'stored_bytes': stored + len(data)}
+
+    def export_mhtml(self, manifest_path, out_path):
+        # Собирает обычный MHTML из манифеста, его можно открыть во вкладке
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        boundary = '----MultipartBoundary--' + os.urandom(12).hex()
+        with open(out_path, 'wb') as out:
+            for name, value in manifest['headers']:
+                out.write(f'{name}: {value}\r\n'.encode('utf-8'))
+            out.write(f'MIME-Version: 1.0\r\nContent-Type: multipart/related;\r\n'
+                      f'\ttype="{manifest["type"]}";\r\n\tboundary="{boundary}"\r\n\r\n'.encode('utf-8'))
+            for part in manifest['parts']:
+                out.write(f'--{boundary}\r\n'.encode('utf-8'))
+                for name, value in part['headers']:
+                    out.write(f'{name}: {value}\r\n'.encode('utf-8'))
+                out.write(b'Content-Transfer-Encoding: base64\r\n\r\n')
+                with open(self.object_path(part['sha256']), 'rb') as f:
+                    out.write(base64.encodebytes(f.read()).replace(b'\n', b'\r\n'))
+                out.write(b'\r\n')
+            out.write(f'--{boundary}--\r\n'.encode('utf-8'))
+        return out_path
+
+class ArchiveJob:
+    def __init__(self, url, tab_id=None):
+        self.url = url
+        self.tab_id = tab_id      # id открытой вкладки или None для адреса из списка
+        self.page = None          # скрытая страница, если вкладки нет
+        self.temp_path = None
+        self.timer = None
+        self.download = None      # загрузка MHTML, когда ее забрал claim
+
+class PageArchiver(QObject):
+    # Сохраняет страницы в MHTML, не больше ARCHIVE_MAX_IN_FLIGHT сразу,
+    # и складывает их в ArchiveStore. Разбор MHTML и запись на диск идут
+    # в отдельном потоке; задание считается активным, пока не записано.
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(dict)
+    ingested = pyqtSignal(object, object)
+
+    def __init__(self, profile, tab_registry, store=None, parent=None):
+        super().__init__(parent)
+        self.profile = profile
+        self.tab_registry = tab_registry
+        self.store = store or ArchiveStore()
+        self.temp_dir = os.path.join(self.store.root, 'tmp')
+        os.makedirs(self.temp_dir, exist_ok=True)
+        self.clear_temp()
+        self.pending = deque()
+        self.running = []
+        self.saving = {}
+        self.abandoned = set()    # сохранения заданий, завершенных раньше загрузки
+        self.sequence = 0
+        self.reset_stats()
+        self.ingested.connect(self.ingest_done)
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.ingest_loop, daemon=True)
+        self.thread.start()
+
+    def clear_temp(self):
+        # Остатки заданий, прерванных закрытием или падением браузера.
+        # Страницы, открытые из архива (view-*), удаляет Browser
+        for name in os.listdir(self.temp_dir):
+            if not name.startswith('view-'):
+                try:
+                    os.remove(os.path.join(self.temp_dir, name))
+                except OSError:
+                    pass
+
+    def reset_stats(self):
+        self.stats = {'total': 0, 'done': 0, 'failed': 0, 'last_error': '',
+                      'logical_bytes': 0, 'stored_bytes': 0, 'started': time.time()}
+
+    def archive(self, targets):
+        # targets — список (адрес, id вкладки или None)
+        if not self.running and not self.pending:
+            self.reset_stats()
+        for url, tab_id in targets:
+            self.pending.append(ArchiveJob(url, tab_id))
+        self.stats['total'] += len(targets)
+        try:
+            self.start_jobs()
+        except Exception as e:
+            print(f"Ошибка при запуске архивации: {str(e)}")
+
+    def tab_page(self, tab_id):
+        # Вкладку ищем по id в момент запуска: пока задание ждало очереди,
+        # ее могли закрыть, выгрузить или заменить заглушкой
+        info = self.tab_registry.get(tab_id)
+        if info is None or not isinstance(info.widget, QWebEngineView):
+            return None
+        page = info.widget.page()
+        if page.lifecycleState() == QWebEnginePage.LifecycleState.Discarded:
+            return None
+        return page
+
+    def start_jobs(self):
+        while self.pending and len(self.running) < ARCHIVE_MAX_IN_FLIGHT:
+            job = self.pending.popleft()
+            page = None
+            if job.tab_id is not None:
+                page = self.tab_page(job.tab_id)
+                if page is None:
+                    self.job_failed(job, 'вкладка закрыта или выгружена')
+                    continue
+            self.running.append(job)
+            self.sequence += 1
+            job.temp_path = os.path.join(self.temp_dir, f'{os.getpid()}-{self.sequence}.mhtml')
+            job.timer = QTimer(self)
+            job.timer.setSingleShot(True)
+            job.timer.timeout.connect(lambda job=job: self.job_done(job, 'время истекло'))
+            job.timer.start(ARCHIVE_TIMEOUT * 1000)
+            if page is not None:
+                self.save(job, page)
+            else:
+                job.page = QWebEnginePage(self.profile, self)
+                job.page.loadFinished.connect(lambda ok, job=job: self.page_loaded(job, ok))
+                job.page.setUrl(QUrl(job.url))
+        self.progress.emit(self.stats['done'] + self.stats['failed'], self.stats['total'])
+        self.check_finished()
+
+    def page_loaded(self, job, ok):
+        if job not in self.running or job.temp_path in self.saving:
+            return
+        if not ok:
+            self.job_done(job, 'страница не загрузилась')
+            return
+        self.save(job, job.page)
+
+    def save(self, job, page):
+        self.saving[os.path.normcase(os.path.abspath(job.temp_path))] = job
+        page.save(job.temp_path, QWebEngineDownloadItem.MimeHtmlSaveFormat)
+
+    def claim(self, download):
+        # Вызывается из handle_download: свои сохранения архиватор забирает
+        path = os.path.normcase(os.path.abspath(download.path()))
+        if path in self.abandoned:
+            # Задание уже завершилось по времени, сохранение не нужно
+            self.abandoned.discard(path)
+            download.cancel()
+            self.remove_temp(download.path())
+            return True
+        job = self.saving.pop(path, None)
+        if job is None:
+            return False
+        job.download = download
+        download.finished.connect(lambda job=job, download=download:
+            self.download_finished(job, download))
+        return True
+
+    def download_finished(self, job, download):
+        if job not in self.running:
+            return
+        if download.state() != QWebEngineDownloadItem.DownloadCompleted:
+            self.job_done(job, 'ошибка сохранения')
+            return
+        job.timer.stop()
+        self.queue.put(job)
+
+    def ingest_loop(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            try:
+                result = self.store.add_mhtml(job.temp_path, job.url)
+            except Exception as e:
+                result = f"Ошибка при архивации {job.url}: {str(e)}"
+            self.remove_temp(job.temp_path)
+            self.ingested.emit(job, result)
+
+    @staticmethod
+    def remove_temp(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def ingest_done(self, job, result):
+        if isinstance(result, dict):
+            self.stats['logical_bytes'] += result['logical_bytes']
+            self.stats['stored_bytes'] += result['stored_bytes']
+            self.job_done(job)
+        else:
+            self.job_done(job, result)
+
+    def job_done(self, job, error=None):
+        if job not in self.running:
+            return
+        self.running.remove(job)
+        job.timer.stop()
+        for path, other in list(self.saving.items()):
+            if other is job:
+                del self.saving[path]
+                self.abandoned.add(path)
+        if job.page is not None:
+            job.page.deleteLater()
+            job.page = None
+        if error:
+            # Недописанный MHTML не должен копиться в tmp
+            if job.download is not None and \
+                    job.download.state() == QWebEngineDownloadItem.DownloadInProgress:
+                job.download.cancel()
+            self.remove_temp(job.temp_path)
+            self.job_failed(job, error)
+        else:
+            self.stats['done'] += 1
+        try:
+            self.start_jobs()
+        except Exception as e:
+            print(f"Ошибка при запуске архивации: {str(e)}")
+
+    def job_failed(self, job, error):
+        # Итог показывает строка состояния, последняя ошибка — в ней же
+        self.stats['failed'] += 1
+        self.stats['last_error'] = f"{job.url}: {error}"
+
+    def check_finished(self):
+        if not self.running and not self.pending and 'seconds' not in self.stats:
+            self.stats['seconds'] = round(time.time() - self.stats['started'], 2)
+            self.finished.emit(dict(self.stats))
+
+    def close(self):
+        self.queue.put(None)
+
+OfflineEntry = namedtuple('OfflineEntry', 'segment offset length content_type record')
+
+def offline_key(url):
+    # Ключ адреса без схемы и якоря: хост[:порт]/путь?запрос.
+    # Тот же ключ получается из archive://, поэтому ссылки внутри
+    # сохраненной страницы находят свои части
+    qurl = QUrl(url) if isinstance(url, str) else url
+    key = qurl.host().lower()
+    if qurl.port() != -1:
+        key += f':{qurl.port()}'
+    key += qurl.path(QUrl.FullyEncoded) or '/'
+    if qurl.hasQuery():
+        key += '?' + qurl.query(QUrl.FullyEncoded)
+    return key
+
+def offline_url(url):
+    return QUrl(f'{OFFLINE_SCHEME}://{offline_key(url)}')
+
+def register_offline_scheme():
+    # Схему нужно зарегистрировать до создания QApplication
+    scheme = QWebEngineUrlScheme(OFFLINE_SCHEME.encode('ascii'))
+    scheme.setSyntax(QWebEngineUrlScheme.Syntax.HostAndPort)
+    scheme.setDefaultPort(QWebEngineUrlScheme.SpecialPort.PortUnspecified)
+    scheme.setFlags(QWebEngineUrlScheme.SecureScheme)
+    QWebEngineUrlScheme.registerScheme(scheme)
+
+class OfflineStore:
+    # Офлайн-копии посещенных страниц. Части MHTML дописываются записями
+    # WARC/1.0 в файлы-сегменты, index.jsonl хранит для каждого адреса
+    # сегмент, смещение и длину тела записи. Одинаковое содержимое
+    # (общие CSS и JS сайта) записывается один раз. Чтение идет прямо
+    # из сегментов, отображенных в память. Когда сегменты перерастают
+    # OFFLINE_MAX_BYTES, самые старые страницы удаляются, а живые записи
+    # переписываются в новые сегменты.
+    def __init__(self, root=None, max_bytes=OFFLINE_MAX_BYTES):
+        self.root = root or offline_path
+        os.makedirs(self.root, exist_ok=True)
+        self.index_path = os.path.join(self.root, 'index.jsonl')
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()        # словари индекса и отображения
+        self.write_lock = threading.Lock()  # запись сегментов и индекса
+        self.entries = {}         # ключ адреса -> OfflineEntry
+        self.digests = {}         # sha256 -> (сегмент, смещение, длина, начало записи)
+        self.pages = {}           # ключ адреса страницы -> (адрес, заголовок, время)
+        self.page_parts = {}      # ключ адреса страницы -> ключи ее частей
+        self.maps = {}            # сегмент -> mmap
+        self.segment = 1
+        self.size = 0             # байт во всех сегментах
+        self.load_index()
+
+    def segment_path(self, segment):
+        return os.path.join(self.root, f'segment-{segment:05d}.warc')
+
+    def segment_files(self):
+        return [os.path.join(self.root, name) for name in os.listdir(self.root)
+                if name.startswith('segment-') and name.endswith('.warc')]
+
+    def load_index(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        # Строка, недописанная при падении
+                        continue
+                    self.add_to_index(item)
+            self.prune()
+        self.size = sum(os.path.getsize(path) for path in self.segment_files())
+        while (os.path.exists(self.segment_path(self.segment)) and
+               os.path.getsize(self.segment_path(self.segment)) >= OFFLINE_SEGMENT_SIZE):
+            self.segment += 1
+
+    def add_to_index(self, item):
+        if 'deleted' in item:
+            self.pages.pop(item['deleted'], None)
+            self.page_parts.pop(item['deleted'], None)
+            return
+        entry = OfflineEntry(item['segment'], item['offset'], item['length'],
+                             item['type'], item.get('record', item['offset']))
+        self.entries[item['key']] = entry
+        self.digests[item['sha256']] = (entry.segment, entry.offset, entry.length, entry.record)
+        self.segment = max(self.segment, item['segment'])
+        if 'title' in item:
+            self.pages[item['key']] = (item['url'], item['title'], item['saved'])
+            self.page_parts[item['key']] = item.get('parts', [item['key']])
+
+    def prune(self):
+        # Части, на которые не ссылается ни одна страница, больше не отдаются
+        live = set()
+        for parts in self.page_parts.values():
+            live.update(parts)
+        self.entries = {key: entry for key, entry in self.entries.items() if key in live}
+        places = {(entry.segment, entry.offset) for entry in self.entries.values()}
+        self.digests = {digest: place for digest, place in self.digests.items()
+                        if place[:2] in places}
+
+    def lookup(self, url):
+        return self.entries.get(offline_key(url))
+
+    def captured_at(self, url):
+        page = self.pages.get(offline_key(url))
+        return page[2] if page else None
+
+    def add_mhtml(self, mhtml_path, url=''):
+        # Вызывается из потока PageArchiver
+        with open(mhtml_path, 'rb') as f:
+            message, parts = ArchiveStore.split_mhtml(f.read())
+        title = str(email.header.make_header(email.header.decode_header(message.get('Subject', ''))))
+        saved = time.time()
+        date = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(saved))
+        with self.write_lock:
+            if os.path.exists(self.segment_path(self.segment)) and \
+                    os.path.getsize(self.segment_path(self.segment)) >= OFFLINE_SEGMENT_SIZE:
+                self.segment += 1
+            segment = self.segment
+
+            items = []
+            logical = stored = 0
+            with open(self.segment_path(segment), 'ab') as out:
+                for headers, data in parts:
+                    location = headers.get('Content-Location')
+                    if not location:
+                        continue
+                    content_type = ' '.join((headers.get('Content-Type') or
+                                             'application/octet-stream').split())
+                    digest = hashlib.sha256(data).hexdigest()
+                    logical += len(data)
+                    place = self.digests.get(digest)
+                    if place is None:
+                        header = (f'WARC/1.0\r\nWARC-Type: resource\r\n'
+                                  f'WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n'
+                                  f'WARC-Date: {date}\r\nWARC-Target-URI: {location}\r\n'
+                                  f'WARC-Payload-Digest: sha256:{digest}\r\n'
+                                  f'Content-Type: {content_type}\r\n'
+                                  f'Content-Length: {len(data)}\r\n\r\n').encode('utf-8')
+                        record = out.tell()
+                        out.write(header)
+                        place = (segment, out.tell(), len(data), record)
+                        out.write(data)
+                        out.write(b'\r\n\r\n')
+                        stored += len(header) + len(data) + 4
+                        self.digests[digest] = place
+                    items.append({'key': offline_key(location), 'sha256': digest, 'segment': place[0],
+                                  'offset': place[1], 'length': place[2], 'record': place[3],
+                                  'type': content_type})
+
+            if items:
+                # Первая часть MHTML — сам документ; адрес вкладки мог отличаться
+                # от итогового после редиректа, сохраняем оба
+                page = dict(items[0], url=url or parts[0][0].get('Content-Location'),
+                            title=title, saved=saved, parts=[item['key'] for item in items])
+                if url and offline_key(url) != page['key']:
+                    items.append(dict(page, key=offline_key(url),
+                                      parts=page['parts'] + [offline_key(url)]))
+                items[0] = page
+            lines = ''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in items)
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+            with self.lock:
+                for item in items:
+                    self.add_to_index(item)
+            self.size += stored
+            if self.size > self.max_bytes:
+                self.compact()
+        return {'manifest': self.index_path, 'parts': len(items),
+                'logical_bytes': logical, 'stored_bytes': stored}
+
+    def delete(self, keys):
+        # Страницы пропадают из списка сразу, а место на диске
+        # освобождается сжатием в отдельном потоке
+        with self.lock:
+            for key in keys:
+                self.pages.pop(key, None)
+                self.page_parts.pop(key, None)
+            self.prune()
+        threading.Thread(target=self.write_deleted, args=(list(keys),), daemon=True).start()
+
+    def write_deleted(self, keys):
+        try:
+            with self.write_lock:
+                with open(self.index_path, 'a', encoding='utf-8') as f:
+                    f.write(''.join(json.dumps({'deleted': key}, ensure_ascii=False) + '\n'
+                                    for key in keys))
+                self.compact()
+        except Exception as e:
+            print(f"Ошибка при удалении офлайн-копий: {str(e)}")
+
+    def clear(self):
+        with self.write_lock:
+            with self.lock:
+                maps = self.maps
+                self.entries, self.digests, self.pages, self.page_parts, self.maps = {}, {}, {}, {}, {}
+            self.release_maps(maps)
+            for path in self.segment_files() + [self.index_path]:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    print(f"Ошибка при удалении офлайн-копий: {str(e)}")
+            self.segment = 1
+            self.size = 0
+
+    def release_maps(self, maps):
+        for mapped in maps.values():
+            try:
+                mapped.close()
+            except BufferError:
+                # Сегмент еще читает ответ archive://; закроется вместе с ним
+                pass
+
+    def compact(self):
+        # Вызывается под write_lock. Если сегменты больше предела, сначала
+        # удаляются самые старые страницы, пока живые записи не займут
+        # OFFLINE_COMPACT_TARGET от предела. Живые записи копируются
+        # в новые сегменты, индекс заменяется целиком, старые сегменты
+        # удаляются.
+        with self.lock:
+            pages = dict(self.pages)
+            page_parts = dict(self.page_parts)
+            entries = dict(self.entries)
+            digests = {place[:2]: digest for digest, place in self.digests.items()}
+
+        def record_size(entry):
+            return entry.offset - entry.record + entry.length + 4
+
+        refs = {}
+        for parts in page_parts.values():
+            for key in set(parts):
+                if key in entries:
+                    refs[key] = refs.get(key, 0) + 1
+        place_refs = {}
+        live = 0
+        for key in refs:
+            entry = entries[key]
+            place = (entry.segment, entry.offset)
+            if place not in place_refs:
+                place_refs[place] = 0
+                live += record_size(entry)
+            place_refs[place] += 1
+
+        if self.size > self.max_bytes:
+            target = self.max_bytes * OFFLINE_COMPACT_TARGET
+            for key in sorted(pages, key=lambda key: pages[key][2]):
+                if live <= target:
+                    break
+                del pages[key]
+                for part in set(page_parts.pop(key)):
+                    if part not in refs:
+                        continue
+                    refs[part] -= 1
+                    if refs[part]:
+                        continue
+                    del refs[part]
+                    entry = entries[part]
+                    place = (entry.segment, entry.offset)
+                    place_refs[place] -= 1
+                    if not place_refs[place]:
+                        live -= record_size(entry)
+
+        first = segment = self.segment + 1
+        moved = {}
+        new_entries = {}
+        items = []
+        out = open(self.segment_path(segment), 'wb')
+        try:
+            for key in refs:
+                entry = entries[key]
+                place = (entry.segment, entry.offset)
+                new = moved.get(place)
+                if new is None:
+                    if out.tell() >= OFFLINE_SEGMENT_SIZE:
+                        out.close()
+                        segment += 1
+                        out = open(self.segment_path(segment), 'wb')
+                    record = out.tell()
+                    out.write(self.read(entry.segment, entry.record, entry.offset + entry.length))
+                    out.write(b'\r\n\r\n')
+                    new = moved[place] = OfflineEntry(segment, record + entry.offset - entry.record,
+                                                      entry.length, entry.content_type, record)
+                new_entries[key] = new
+                item = {'key': key, 'sha256': digests.get(place, ''), 'segment': new.segment,
+                        'offset': new.offset, 'length': new.length, 'record': new.record,
+                        'type': new.content_type}
+                if key in pages:
+                    url, title, saved = pages[key]
+                    item.update(url=url, title=title, saved=saved, parts=page_parts[key])
+                items.append(item)
+        finally:
+            out.close()
+
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in items))
+        os.replace(temp_path, self.index_path)
+
+        with self.lock:
+            maps = self.maps
+            self.maps = {}
+            self.entries = new_entries
+            self.digests = {item['sha256']: (item['segment'], item['offset'], item['length'], item['record'])
+                            for item in items if item['sha256']}
+            # Страницы, удаленные из окна, пока шло сжатие, не возвращаются
+            self.pages = {key: page for key, page in pages.items() if key in self.pages}
+            self.page_parts = {key: page_parts[key] for key in self.pages}
+            self.prune()
+        self.release_maps(maps)
+        keep = {self.segment_path(number) for number in range(first, segment + 1)}
+        for path in self.segment_files():
+            if path not in keep:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    print(f"Ошибка при удалении старого сегмента: {str(e)}")
+        self.segment = segment
+        self.size = sum(os.path.getsize(path) for path in keep if os.path.exists(path))
+
+    def read(self, segment, start, end):
+        with self.lock:
+            mapped = self.maps.get(segment)
+            if mapped is None or len(mapped) < end:
+                # Сегмент дописан после отображения — отображаем заново
+                with open(self.segment_path(segment), 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.maps[segment] = mapped
+        return memoryview(mapped)[start:end]
+
+    def body(self, entry):
+        # memoryview тела записи в отображенном сегменте, без копирования
+        return self.read(entry.segment, entry.offset, entry.offset + entry.length)
+
+class MappedReply(QIODevice):
+    # Ответ схемы archive:// из отображенного файла. Chromium читает его
+    # кусками, и в объекты Python копируется только очередной кусок
+    def __init__(self, body, parent=None):
+        super().__init__(parent)
+        self.body = body
+        self.position = 0
+        self.open(QIODevice.ReadOnly | QIODevice.Unbuffered)
+
+    def readData(self, maxlen):
+        chunk = self.body[self.position:self.position + maxlen]
+        self.position += len(chunk)
+        return chunk.tobytes()
+
+    def seek(self, pos):
+        self.position = pos
+        return super().seek(pos)
+
+    def size(self):
+        return len(self.body)
+
+    def bytesAvailable(self):
+        return len(self.body) - self.position
+
+    def atEnd(self):
+        return self.position >= len(self.body)
+
+class OfflineSchemeHandler(QWebEngineUrlSchemeHandler):
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+
+    def requestStarted(self, job):
+        try:
+            entry = self.store.lookup(job.requestUrl())
+            if entry is None:
+                job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+                return
+            # Устройство принадлежит запросу и удаляется вместе с ним
+            reply = MappedReply(self.store.body(entry), job)
+            job.reply(entry.content_type.encode('utf-8'), reply)
+        except Exception as e:
+            print(f"Ошибка при чтении офлайн-копии: {str(e)}")
+            job.fail(QWebEngineUrlRequestJob.RequestFailed)
+
+class OfflinePagesDialog(QDialog):
+    # Список офлайн-копий с поиском по заголовку и адресу
+    def __init__(self, store, open_page, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.open_page = open_page
+        self.setWindowTitle("Офлайн-копии страниц")
+        self.resize(560, 420)
+
+        layout = QVBoxLayout(self)
+        self.search = QLineEdit()
+        self.search.setPlaceholderText("Поиск по сохраненным страницам")
+        self.search.setClearButtonEnabled(True)
+        layout.addWidget(self.search)
+
+        self.model = QStandardItemModel(self)
+        self.proxy = QSortFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+        self.proxy.setFilterRole(Qt.UserRole + 1)
+        self.proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.search.textChanged.connect(self.proxy.setFilterFixedString)
+        self.search.returnPressed.connect(lambda: self.activate(self.proxy.index(0, 0)))
+
+        self.view = QListView()
+        self.view.setModel(self.proxy)
+        self.view.setUniformItemSizes(True)
+        self.view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.view.activated.connect(self.activate)
+        self.view.doubleClicked.connect(self.activate)
+        layout.addWidget(self.view)
+
+        buttons = QHBoxLayout()
+        delete_btn = QPushButton("Удалить")
+        delete_btn.setShortcut('Del')
+        delete_btn.clicked.connect(self.delete_selected)
+        buttons.addWidget(delete_btn)
+        clear_btn = QPushButton("Удалить все")
+        clear_btn.clicked.connect(self.clear_all)
+        buttons.addWidget(clear_btn)
+        buttons.addStretch()
+        self.size_label = QLabel()
+        buttons.addWidget(self.size_label)
+        layout.addLayout(buttons)
+
+    def showEvent(self, event):
+        self.refresh()
+        super().showEvent(event)
+
+    def refresh(self):
+        self.model.clear()
+        with self.store.lock:
+            pages = sorted(self.store.pages.items(), key=lambda page: -page[1][2])
+        for key, (url, title, saved) in pages:
+            item = QStandardItem(f"{title or url} — {time.strftime('%d.%m.%Y %H:%M', time.localtime(saved))}")
+            item.setToolTip(url)
+            item.setData(url, Qt.UserRole)
+            item.setData(f"{title} {url}", Qt.UserRole + 1)
+            item.setData(key, Qt.UserRole + 2)
+            self.model.appendRow(item)
+        self.size_label.setText(f"{format_size(self.store.size)} из {format_size(self.store.max_bytes)}")
+
+    def activate(self, index):
+        if index.isValid():
+            self.open_page(index.data(Qt.UserRole))
+
+    def delete_selected(self):
+        keys = [index.data(Qt.UserRole + 2) for index in self.view.selectionModel().selectedIndexes()]
+        if not keys:
+            return
+        try:
+            self.store.delete(keys)
+        except Exception as e:
+            print(f"Ошибка при удалении офлайн-копий: {str(e)}")
+        self.refresh()
+
+    def clear_all(self):
+        reply = QMessageBox.question(
+            self, "Офлайн-копии", "Удалить все сохраненные страницы?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+        try:
+            self.store.clear()
+        except Exception as e:
+            print(f"Ошибка при удалении офлайн-копий: {str(e)}")
+        self.refresh()
+
+# Параметры окна загрузок
+DOWNLOAD_REFRESH_MS = 250        # как часто окно загрузок перерисовывает строки
+DOWNLOAD_SPEED_WINDOW = 5.0      # секунд для расчета текущей скорости
+
+# Очередь загрузок
+DOWNLOAD_MAX_ACTIVE = 3          # одновременных загрузок
+DOWNLOAD_RATE_LIMIT_KB = 0       # общий лимит скорости, КБ/с (0 — без лимита)
+DOWNLOAD_HOST_RATE_LIMIT_KB = 0  # лимит скорости на один сайт, КБ/с
+DOWNLOAD_THROTTLE_MS = 200       # шаг проверки лимитов скорости
+DOWNLOAD_AUTO_ACCEPT = False     # сохранять в downloads_path без диалога
+
+# Поиск одинаковых загрузок по SHA-256
+DOWNLOAD_DEDUP = True            # заменять повторные файлы жесткими ссылками
+DEDUP_CHUNK = 1024 * 1024        # байт за одно чтение при хэшировании
+downloads_db_path = os.path.join(app_data_path, 'downloads.db')
+
+PRIORITY_LOW = -1
+PRIORITY_NORMAL = 0
+PRIORITY_HIGH = 1
+PRIORITY_NAMES = {PRIORITY_HIGH: 'высокий', PRIORITY_NORMAL: 'обычный', PRIORITY_LOW: 'низкий'}
+
+# Многопоточная загрузка
+DOWNLOAD_SEGMENTED = False       # качать своим движком по HTTP Range
+DOWNLOAD_SEGMENTS = 4            # соединений на одну загрузку
+SEGMENT_MIN_SIZE = 1024 * 1024   # меньше сегменты не делятся
+SEGMENT_CHUNK = 64 * 1024
+SEGMENT_RETRIES = 3
+SEGMENT_TIMEOUT = 30
+SEGMENT_SAVE_INTERVAL = 1.0      # секунд между сохранениями состояния
+SEGMENT_RESUME_DELAY = 1000      # мс после запуска: cookies профиля приходят не сразу
+SEGMENT_SIDECAR_SUFFIX = '.part.json'
+# Список файлов состояния незавершенных загрузок: их могли сохранить
+# в любую папку, а не только в downloads_path
+segmented_list_path = os.path.join(app_data_path, 'segmented.json')
+SEGMENT_USER_AGENT = 'Mozilla/5.0 (WebBrowser segmented download)'
+
+# Пакетное сохранение картинок страницы
+IMAGE_MAX_PARALLEL = 8           # одновременных загрузок
+IMAGE_THUMBNAIL_SIZE = 256       # px по большей стороне
+IMAGE_TIMEOUT = 30               # секунд на одну картинку
+IMAGE_MAX_BYTES = 50 * 1024 * 1024
+
+def unique_path(path, reserved=()):
+    # file.zip -> file (1).zip, если файл уже есть или занят загрузкой
+    # (reserved — нормализованные пути незавершенных загрузок)
+    def taken(candidate):
+        return (os.path.exists(candidate) or
+                os.path.normcase(os.path.abspath(candidate)) in reserved)
+    if not taken(path):
+        return path
+    base, ext = os.path.splitext(path)
+    n = 1
+    while taken(f"{base} ({n}){ext}"):
+        n += 1
+    return f"{base} ({n}){ext}"
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds} с"
+    if seconds < 3600:
+        return f"{seconds // 60} мин {seconds % 60} с"
+    return f"{seconds // 3600} ч {seconds % 3600 // 60} мин"
+
+# Все картинки страницы: img и srcset (в том числе ленивые data-src),
+# picture/source, SVG image, input type=image и CSS-фоны. Адреса
+# приводятся к абсолютным и не повторяются.
+COLLECT_IMAGES_JS = """
+(function() {
+    var urls = new Set();
+    function add(url) {
+        if (!url) return;
+        try { urls.add(new URL(url.trim(), document.baseURI).href); } catch (e) {}
+    }
+    function addSrcset(srcset) {
+        if (!srcset) return;
+        srcset.split(/,\\s+/).forEach(function(candidate) {
+            add(candidate.trim().split(/\\s+/)[0]);
+        });
+    }
+    document.querySelectorAll('img').forEach(function(img) {
+        add(img.currentSrc);
+        add(img.getAttribute('src'));
+        add(img.getAttribute('data-src'));
+        addSrcset(img.getAttribute('srcset'));
+        addSrcset(img.getAttribute('data-srcset'));
+    });
+    document.querySelectorAll('source[srcset]').forEach(function(source) {
+        addSrcset(source.getAttribute('srcset'));
+    });
+    document.querySelectorAll('image, input[type=image]').forEach(function(el) {
+        add(el.getAttribute('href') || el.getAttribute('xlink:href') || el.getAttribute('src'));
+    });
+    var pattern = /url\\(\\s*(['"]?)(.*?)\\1\\s*\\)/g;
+    document.querySelectorAll('*').forEach(function(el) {
+        var background = getComputedStyle(el).backgroundImage;
+        if (!background || background === 'none') return;
+        var match;
+        while ((match = pattern.exec(background))) add(match[2]);
+    });
+    return Array.from(urls).filter(function(url) { return /^(https?|data):/.test(url); });
+})();
+"""
+
+def image_filename(url, content_type, digest):
+    # Имя из адреса, расширение — по типу, если в адресе его нет
+    name = ''
+    if not url.startswith('data:'):
+        name = urllib.parse.unquote(urllib.parse.urlsplit(url).path.rsplit('/', 1)[-1])
+    name = re.sub(r'[^\w.-]+', '_', name).strip('._')[:100] or digest[:16]
+    if not os.path.splitext(name)[1]:
+        name += mimetypes.guess_extension(content_type or '') or '.img'
+    return name
+
+class ImageHarvester(QObject):
+    # Скачивает картинки страницы пулом потоков: не больше IMAGE_MAX_PARALLEL
+    # сразу. В том же потоке считается SHA-256 и делается миниатюра,
+    # одинаковые по содержимому картинки сохраняются один раз.
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(dict)
+    image_done = pyqtSignal(object)
+
+    def __init__(self, parent=None, max_parallel=IMAGE_MAX_PARALLEL):
+        super().__init__(parent)
+        self.pool = ThreadPoolExecutor(max_workers=max_parallel)
+        self.lock = threading.Lock()
+        self.image_done.connect(self.record)
+        self.results = []
+        self.total = 0
+        self.busy = False
+
+    def harvest(self, urls, directory, referer=''):
+        if self.busy:
+            return False
+        os.makedirs(os.path.join(directory, 'thumbnails'), exist_ok=True)
+        self.busy = True
+        self.directory = directory
+        self.total = len(urls)
+        self.results = []
+        self.files = {}
+        self.started = time.time()
+        self.progress.emit(0, self.total)
+        if not urls:
+            self.finish()
+        for url in urls:
+            self.pool.submit(self.fetch, url, referer)
+        return True
+
+    def fetch(self, url, referer):
+        result = {'url': url}
+        try:
+            headers = {'User-Agent': SEGMENT_USER_AGENT}
+            if referer:
+                headers['Referer'] = referer
+            request = urllib.request.Request(url, headers=headers)
+            with urllib.request.urlopen(request, timeout=IMAGE_TIMEOUT) as response:
+                data = response.read(IMAGE_MAX_BYTES + 1)
+                content_type = response.headers.get_content_type()
+            if len(data) > IMAGE_MAX_BYTES:
+                raise ValueError('файл больше IMAGE_MAX_BYTES')
+            digest = hashlib.sha256(data).hexdigest()
+            result.update(sha256=digest, size=len(data), content_type=content_type)
+
+            # Имя занимаем под блокировкой, чтобы потоки не выбрали одно и то же
+            with self.lock:
+                path = self.files.get(digest)
+                duplicate = path is not None
+                if not duplicate:
+                    path = unique_path(os.path.join(
+                        self.directory, image_filename(url, content_type, digest)))
+                    open(path, 'wb').close()
+                    self.files[digest] = path
+            result['file'] = path
+            if duplicate:
+                result['duplicate'] = True
+            else:
+                with open(path, 'wb') as f:
+                    f.write(data)
+                self.make_thumbnail(data, path, result)
+        except Exception as e:
+            result['error'] = str(e)
+        self.image_done.emit(result)
+
+    def make_thumbnail(self, data, path, result):
+        # QImage, в отличие от QPixmap, можно использовать вне UI-потока
+        image = QImage.fromData(data)
+        if image.isNull():
+            return
+        result['width'] = image.width()
+        result['height'] = image.height()
+        thumbnail = image.scaled(IMAGE_THUMBNAIL_SIZE, IMAGE_THUMBNAIL_SIZE,
+                                 Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        thumbnail_path = os.path.join(self.directory, 'thumbnails',
+                                      os.path.basename(path) + '.jpg')
+        if thumbnail.save(thumbnail_path, 'JPG', 85):
+            result['thumbnail'] = thumbnail_path
+
+    def record(self, result):
+        self.results.append(result)
+        self.progress.emit(len(self.results), self.total)
+        if len(self.results) == self.total:
+            self.finish()
+
+    def finish(self):
+        stats = {
+            'total': self.total,
+            'saved': sum(1 for r in self.results if 'file' in r and not r.get('duplicate')),
+            'duplicates': sum(1 for r in self.results if r.get('duplicate')),
+            'failed': sum(1 for r in self.results if 'error' in r),
+            'bytes': sum(r.get('size', 0) for r in self.results if not r.get('duplicate')),
+            'seconds': round(time.time() - self.started, 2),
+            'directory': self.directory,
+        }
+        try:
+            with open(os.path.join(self.directory, 'images.json'), 'w', encoding='utf-8') as f:
+                json.dump({'stats': stats, 'images': self.results}, f, ensure_ascii=False, indent=1)
+        except Exception as e:
+            print(f"Ошибка при записи списка изображений: {str(e)}")
+        self.busy = False
+        self.finished.emit(stats)
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+
+class DownloadEntry(QObject):
+    # Состояние одной загрузки. Виджетов не создает: строку рисует
+    # DownloadDelegate, а модель перерисовывает ее пачками по таймеру
+    changed = pyqtSignal(object)
+    # Пауза, продолжение и смена состояния — без прогресса
+    status_changed = pyqtSignal(object)
+    # Загрузка успешно завершена, файл на диске
+    completed = pyqtSignal(object)
+
+    def __init__(self, download, priority=PRIORITY_NORMAL, parent=None):
+        super().__init__(parent)
+        self.download = download
+        self.download_path = download.path()
+        self.filename = os.path.basename(self.download_path)
+        self.directory = os.path.dirname(self.download_path)
+        self.host = download.url().host()
+        self.priority = priority
+        self.is_paused = False
+        # queued — ждет свободного места в очереди,
+        # throttled — временно остановлена лимитом скорости
+        self.queued = False
+        self.throttled = False
+        self.seq = 0
+        self.state = download.state()
+        self.bytes_received = 0
+        self.bytes_total = 0
+        self.speed = 0.0
+        # Замеры (время, байты) за последние DOWNLOAD_SPEED_WINDOW секунд
+        self.samples = deque()
+        # Итог проверки на дубликаты после завершения
+        self.check_requested = False
+        self.checking = False
+        self.check_status = ""
+
+        # Подключаем сигналы загрузки
+        self.download.downloadProgress.connect(self.update_progress)
+        self.download.finished.connect(self.download_finished)
+        self.download.stateChanged.connect(self.state_changed)
+
+    def is_active(self):
+        return self.state == QWebEngineDownloadItem.DownloadInProgress
+
+    def is_running(self):
+        return self.is_active() and not self.is_paused and not self.queued
+
+    def toggle_pause(self):
+        if not self.is_active():
+            return
+        if self.is_paused:
+            # Продолжит DownloadScheduler, когда освободится место
+            self.is_paused = False
+            self.queued = True
+        else:
+            self.download.pause()
+            self.is_paused = True
+            self.queued = False
+            self.throttled = False
+            self.samples.clear()
+            self.speed = 0.0
+        self.changed.emit(self)
+        self.status_changed.emit(self)
+
+    def cancel_download(self):
+        self.download.cancel()
+        self.state = QWebEngineDownloadItem.DownloadCancelled
+        self.changed.emit(self)
+        self.status_changed.emit(self)
+
+    def state_changed(self, state):
+        self.state = state
+        if state != QWebEngineDownloadItem.DownloadInProgress:
+            self.speed = 0.0
+            self.samples.clear()
+        self.changed.emit(self)
+        self.status_changed.emit(self)
+
+    @traced('DownloadEntry.update_progress')
+    def update_progress(self, bytes_received, bytes_total):
+        # Вызывается очень часто, поэтому только запоминаем значения
+        self.bytes_received = bytes_received
+        self.bytes_total = bytes_total
+        self.changed.emit(self)
+
+    def sample_speed(self, now):
+        if not self.is_running():
+            return
+        self.samples.append((now, self.bytes_received))
+        while len(self.samples) > 2 and now - self.samples[0][0] > DOWNLOAD_SPEED_WINDOW:
+            self.samples.popleft()
+        first_time, first_bytes = self.samples[0]
+        if now > first_time:
+            self.speed = (self.bytes_received - first_bytes) / (now - first_time)
+
+    def eta(self):
+        if self.speed <= 0 or self.bytes_total <= 0:
+            return None
+        return max(0, self.bytes_total - self.bytes_received) / self.speed
+
+    def status_text(self):
+        if self.state == QWebEngineDownloadItem.DownloadCompleted:
+            return f"Завершено, {self.check_status}" if self.check_status else "Завершено"
+        if self.state == QWebEngineDownloadItem.DownloadCancelled:
+            return "Отменено"
+        if self.state == QWebEngineDownloadItem.DownloadInterrupted:
+            return "Прервано"
+        if self.is_paused:
+            return "Приостановлено"
+        if self.queued:
+            if self.priority != PRIORITY_NORMAL:
+                return f"В очереди ({PRIORITY_NAMES[self.priority]})"
+            return "В очереди"
+        if not self.samples:
+            return "Ожидание"
+        return f"{format_size(self.speed)}/s"
+
+    def eta_text(self):
+        if not self.is_running():
+            return ""
+        eta = self.eta()
+        return f"осталось {format_duration(eta)}" if eta is not None else ""
+
+    def size_text(self):
+        if self.bytes_total > 0:
+            return f"{format_size(self.bytes_received)} / {format_size(self.bytes_total)}"
+        return format_size(self.bytes_received)
+
+    @traced('DownloadEntry.download_finished')
+    def download_finished(self):
+        try:
+            self.state = self.download.state()
+            if self.state == QWebEngineDownloadItem.DownloadCompleted:
+                self.bytes_received = max(self.bytes_received, self.bytes_total)
+            self.speed = 0.0
+            self.samples.clear()
+            self.changed.emit(self)
+            if self.state == QWebEngineDownloadItem.DownloadCompleted and not self.check_requested:
+                self.check_requested = True
+                self.completed.emit(self)
+        except Exception as e:
+            print(f"Ошибка при завершении загрузки: {str(e)}")
+
+    def set_check_status(self, text):
+        self.check_status = text
+        self.changed.emit(self)
+
+    def check_finished(self, result):
+        self.checking = False
+        if 'error' in result:
+            self.set_check_status("")
+            print(f"Ошибка при проверке дубликатов {self.filename}: {result['error']}")
+        elif result['saved_bytes']:
+            self.set_check_status(f"дубликат {os.path.basename(result['duplicate_of'])}, "
+                                  f"сэкономлено {format_size(result['saved_bytes'])}")
+        elif result['duplicate_of']:
+            self.set_check_status(f"такой же файл: {os.path.basename(result['duplicate_of'])}")
+        else:
+            self.set_check_status("")
+
+class DownloadsModel(QAbstractListModel):
+    EntryRole = Qt.UserRole + 1
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.entries = []
+        self.rows = {}
+        self.dirty = set()
+
+        # Изменения копятся и отдаются виду не чаще DOWNLOAD_REFRESH_MS
+        self.timer = QTimer(self)
+        self.timer.setInterval(DOWNLOAD_REFRESH_MS)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        entry = self.entries[index.row()]
+        if role == self.EntryRole:
+            return entry
+        if role == Qt.DisplayRole:
+            return entry.filename
+        if role == Qt.ToolTipRole:
+            return entry.download_path
+        return None
+
+    def add_entry(self, entry):
+        row = len(self.entries)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.entries.append(entry)
+        self.rows[entry] = row
+        self.endInsertRows()
+        entry.setParent(self)
+        entry.changed.connect(self.mark_dirty)
+
+    def mark_dirty(self, entry):
+        self.dirty.add(entry)
+
+    def reserved_paths(self):
+        # Пути загрузок, которые еще могут дописать файл
+        return {os.path.normcase(os.path.abspath(entry.download_path)) for entry in self.entries
+                if entry.state not in (QWebEngineDownloadItem.DownloadCompleted,
+                                       QWebEngineDownloadItem.DownloadCancelled)}
+
+    @traced('DownloadsModel.flush')
+    def flush(self):
+        now = time.monotonic()
+        for entry in self.entries:
+            if entry.is_running():
+                entry.sample_speed(now)
+                self.dirty.add(entry)
+        if not self.dirty:
+            return
+        rows = [self.rows[entry] for entry in self.dirty if entry in self.rows]
+        self.dirty.clear()
+        if rows:
+            self.dataChanged.emit(self.index(min(rows)), self.index(max(rows)))
+
+    def remove_finished(self):
+        # Загрузки, которые еще хэширует DownloadDeduplicator, остаются
+        # до следующей очистки: его сигналы придут к живому объекту
+        removed = [entry for entry in self.entries
+                   if entry.state != QWebEngineDownloadItem.DownloadInProgress and not entry.checking]
+        if not removed:
+            return
+        self.beginResetModel()
+        self.entries = [entry for entry in self.entries
+                        if entry.state == QWebEngineDownloadItem.DownloadInProgress or entry.checking]
+        self.rows = {entry: row for row, entry in enumerate(self.entries)}
+        self.dirty.clear()
+        self.endResetModel()
+        for entry in removed:
+            # Свою многопоточную загрузку создал браузер, удаляем и ее;
+            # QWebEngineDownloadItem принадлежит профилю
+            if isinstance(entry.download, SegmentedDownload):
+                entry.download.deleteLater()
+            entry.deleteLater()
+
+class DownloadDeduplicator(QObject):
+    # После загрузки файл хэшируется в отдельном потоке кусками по
+    # DEDUP_CHUNK (hashlib отпускает GIL, окно загрузок не замирает даже
+    # на файлах в несколько ГБ). Если такой же файл уже есть в индексе,
+    # новый заменяется жесткой ссылкой на него и место на диске не тратится.
+    progress = pyqtSignal(object, int)      # загрузка, проценты
+    checked = pyqtSignal(object, dict)      # загрузка, результат
 
-# Создаем папку для загрузок, если её нет
-downloads_path = os.path.join(os.path.expanduser('~'), 'Downloads', 'WebBrowser')
-if not os.path.exists(downloads_path):
-    os.makedirs(downloads_path)
+    def __init__(self, db_path=None, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path or downloads_db_path
+        self.enabled = DOWNLOAD_DEDUP
+        self.closing = False
+        self.saved_bytes = 0
+
+        # Соединение потока интерфейса только читает (поиск по адресу),
+        # все записи идут из рабочего потока
+        self.reader = sqlite3.connect(self.db_path)
+        self.reader.execute('PRAGMA journal_mode=WAL')
+        self.reader.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, '
+                            'sha256 TEXT, size INTEGER, mtime REAL, url TEXT, added REAL)')
+        self.reader.execute('CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256)')
+        self.reader.execute('CREATE INDEX IF NOT EXISTS files_url ON files (url)')
+        self.reader.commit()
+        self.conn = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def check(self, entry):
+        if not self.enabled or entry.state != QWebEngineDownloadItem.DownloadCompleted:
+            return
+        entry.checking = True
+        entry.set_check_status("проверка дубликатов")
+        url = entry.download.url().toString()
+        self.executor.submit(self.process, entry, entry.download_path, url)
+
+    def process(self, entry, path, url):
+        try:
+            if self.conn is None:
+                self.conn = sqlite3.connect(self.db_path)
+            digest = self.hash_file(entry, path)
+            if digest is None:
+                return
+            result = self.deduplicate(path, digest)
+            stat = os.stat(path)
+            self.conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                              (path, digest, stat.st_size, stat.st_mtime, url, time.time()))
+            self.conn.commit()
+        except Exception as e:
+            result = {'error': str(e)}
+        self.checked.emit(entry, result)
+
+    def hash_file(self, entry, path):
+        size = os.path.getsize(path)
+        digest = hashlib.sha256()
+        done = 0
+        reported = -1
+        with open(path, 'rb') as f:
+            while True:
+                if self.closing:
+                    return None
+                chunk = f.read(DEDUP_CHUNK)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                done += len(chunk)
+                percent = done * 100 // size if size else 100
+                if percent // 5 != reported // 5:
+                    reported = percent
+                    self.progress.emit(entry, percent)
+        return digest.hexdigest()
+
+    def deduplicate(self, path, digest):
+        result = {'sha256': digest, 'duplicate_of': None, 'linked': False, 'saved_bytes': 0}
+        stat = os.stat(path)
+        rows = self.conn.execute('SELECT path, size, mtime FROM files WHERE sha256 = ? AND path <> ?',
+                                 (digest, path)).fetchall()
+        for other, size, mtime in rows:
+            try:
+                other_stat = os.stat(other)
+            except OSError:
+                other_stat = None
+            if other_stat is None or other_stat.st_size != size or other_stat.st_mtime != mtime:
+                # Файл удалили или изменили после записи в индекс
+                self.conn.execute('DELETE FROM files WHERE path = ?', (other,))
+                continue
+            result['duplicate_of'] = other
+            if os.path.samestat(stat, other_stat):
+                result['linked'] = True
+            elif other_stat.st_dev == stat.st_dev:
+                # Ссылка создается рядом и атомарно занимает место файла
+                temp_path = f'{path}.dedup'
+                try:
+                    os.link(other, temp_path)
+                    os.replace(temp_path, path)
+                    result['linked'] = True
+                    result['saved_bytes'] = stat.st_size
+                except OSError:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+            break
+        return result
+
+    def find_url(self, url):
+        # Уже загруженный с этого адреса файл, если он цел, иначе None
+        rows = self.reader.execute('SELECT path, size, mtime FROM files WHERE url = ? '
+                                   'ORDER BY added DESC', (url,)).fetchall()
+        for path, size, mtime in rows:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_size == size and stat.st_mtime == mtime:
+                return path
+        return None
 
-class DownloadWidget(QWidget):
-    def __init__(self, download, parent=None):
+    def close(self):
+        self.closing = True
+        self.executor.shutdown(wait=False)
+
+class DownloadScheduler(QObject):
+    # QtWebEngine отменяет загрузку, если ее не приняли сразу в downloadRequested,
+    # поэтому загрузки в очереди приняты, но стоят на паузе. Ограничения
+    # скорости работают так же: корзина токенов на сайт и общая, при перерасходе
+    # загрузки ставятся на паузу до пополнения корзины.
+    queue_paused_changed = pyqtSignal(bool)
+
+    def __init__(self, parent=None):
         super().__init__(parent)
-        self.download = download
-        self.download_path = download.path()
-        self.is_paused = False
-        
-        layout = QHBoxLayout()
-        
-        # Информация о файле
-        info_layout = QVBoxLayout()
-        
-        # Название файла
-        self.filename_label = QLabel(os.path.basename(self.download_path))
-        self.filename_label.setStyleSheet("font-weight: bold;")
-        info_layout.addWidget(self.filename_label)
-        
-        # Путь к файлу
-        self.path_label = QLabel(os.path.dirname(self.download_path))
-        self.path_label.setStyleSheet("color: gray;")
-        info_layout.addWidget(self.path_label)
-        
-        layout.addLayout(info_layout)
-        
+        self.entries = []
+        self.max_active = DOWNLOAD_MAX_ACTIVE
+        self.rate_limit = DOWNLOAD_RATE_LIMIT_KB * 1024
+        self.host_rate_limit = DOWNLOAD_HOST_RATE_LIMIT_KB * 1024
+        self.paused = False
+        self.next_seq = 0
+        self.global_tokens = 0.0
+        self.host_tokens = {}
+        self.last_bytes = {}
+        self.last_tick = time.monotonic()
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(DOWNLOAD_THROTTLE_MS)
+        self.timer.timeout.connect(self.tick)
+        self.timer.start()
+
+    def add(self, entry):
+        entry.seq = self.next_seq
+        self.next_seq += 1
+        entry.queued = True
+        entry.download.pause()
+        self.entries.append(entry)
+        entry.status_changed.connect(self.schedule)
+        self.schedule()
+
+    def running(self):
+        return [entry for entry in self.entries if entry.is_running()]
+
+    def waiting(self):
+        waiting = [entry for entry in self.entries
+                   if entry.is_active() and entry.queued and not entry.is_paused]
+        waiting.sort(key=lambda entry: (-entry.priority, entry.seq))
+        return waiting
+
+    def schedule(self, *_):
+        # Завершенные и отмененные загрузки больше не нужны очереди
+        self.entries = [entry for entry in self.entries if entry.is_active()]
+        for entry in list(self.last_bytes):
+            if entry not in self.entries:
+                del self.last_bytes[entry]
+        if self.paused:
+            return
+        free = self.max_active - len(self.running())
+        for entry in self.waiting()[:max(0, free)]:
+            entry.queued = False
+            entry.throttled = False
+            self.last_bytes[entry] = entry.bytes_received
+            entry.download.resume()
+            entry.changed.emit(entry)
+
+    def requeue(self, entry):
+        entry.queued = True
+        entry.throttled = False
+        entry.download.pause()
+        entry.samples.clear()
+        entry.speed = 0.0
+        entry.changed.emit(entry)
+
+    def set_priority(self, entry, priority):
+        entry.priority = priority
+        entry.changed.emit(entry)
+        # Более важная загрузка вытесняет менее важную
+        waiting = self.waiting()
+        running = sorted(self.running(), key=lambda e: (e.priority, -e.seq))
+        if waiting and running and len(running) >= self.max_active \
+                and waiting[0].priority > running[0].priority:
+            self.requeue(running[0])
+        self.schedule()
+
+    def set_max_active(self, value):
+        self.max_active = max(1, value)
+        running = sorted(self.running(), key=lambda e: (e.priority, -e.seq))
+        for entry in running[:max(0, len(running) - self.max_active)]:
+            self.requeue(entry)
+        self.schedule()
+
+    def set_rate_limits(self, limit_kb, host_limit_kb):
+        self.rate_limit = limit_kb * 1024
+        self.host_rate_limit = host_limit_kb * 1024
+
+    def pause_queue(self):
+        self.paused = True
+        for entry in self.running():
+            self.requeue(entry)
+        self.queue_paused_changed.emit(True)
+
+    def resume_queue(self):
+        self.paused = False
+        self.queue_paused_changed.emit(False)
+        self.schedule()
+
+    def refill(self, tokens, limit, dt):
+        # Запас не больше чем на секунду, чтобы не было долгих всплесков
+        return min(tokens + limit * dt, limit)
+
+    def tick(self):
+        now = time.monotonic()
+        dt = now - self.last_tick
+        self.last_tick = now
+
+        # pause() сразу после accept() может не сработать,
+        # поэтому ожидающие загрузки останавливаем повторно
+        for entry in self.entries:
+            if entry.is_active() and (entry.queued or entry.is_paused) \
+                    and not entry.download.isPaused():
+                entry.download.pause()
+
+        if not self.rate_limit and not self.host_rate_limit:
+            for entry in self.entries:
+                if entry.throttled:
+                    entry.throttled = False
+                    entry.download.resume()
+            return
+
+        # Сколько байт получено с прошлого шага, по сайтам
+        used = {}
+        for entry in self.running():
+            previous = self.last_bytes.get(entry, entry.bytes_received)
+            self.last_bytes[entry] = entry.bytes_received
+            used[entry.host] = used.get(entry.host, 0) + max(0, entry.bytes_received - previous)
+
+        if self.rate_limit:
+            self.global_tokens = self.refill(self.global_tokens, self.rate_limit, dt) \
+                - sum(used.values())
+        if self.host_rate_limit:
+            for host in set(used) | set(self.host_tokens):
+                self.host_tokens[host] = self.refill(self.host_tokens.get(host, 0.0),
+                                                     self.host_rate_limit, dt) \
+                    - used.get(host, 0)
+
+        for entry in self.running():
+            over = (self.rate_limit and self.global_tokens < 0) or \
+                (self.host_rate_limit and self.host_tokens.get(entry.host, 0.0) < 0)
+            if over and not entry.throttled:
+                entry.throttled = True
+                entry.download.pause()
+            elif not over and entry.throttled:
+                entry.throttled = False
+                entry.download.resume()
+
+class ProfileCookies:
+    # Копия cookies профиля для запросов мимо Chromium (многопоточные
+    # загрузки). Хранилище профиля присылает cookies сигналами в поток
+    # интерфейса; http.cookiejar сам выбирает подходящие адресу
+    # и безопасен для чтения из потоков загрузки.
+    def __init__(self, profile):
+        # Cookie без домена (host-only) не отправляется поддоменам
+        self.jar = http.cookiejar.CookieJar(http.cookiejar.DefaultCookiePolicy(
+            strict_ns_domain=http.cookiejar.DefaultCookiePolicy.DomainStrictNonDomain))
+        store = profile.cookieStore()
+        store.cookieAdded.connect(self.add)
+        store.cookieRemoved.connect(self.remove)
+        store.loadAllCookies()
+
+    @staticmethod
+    def text(data):
+        return bytes(data).decode('utf-8', 'replace')
+
+    def add(self, cookie):
+        try:
+            domain = cookie.domain()
+            expires = None if cookie.isSessionCookie() else cookie.expirationDate().toSecsSinceEpoch()
+            self.jar.set_cookie(http.cookiejar.Cookie(
+                0, self.text(cookie.name()), self.text(cookie.value()), None, False,
+                domain, domain.startswith('.'), domain.startswith('.'),
+                cookie.path() or '/', True, cookie.isSecure(), expires,
+                cookie.isSessionCookie(), None, None,
+                {'HttpOnly': None} if cookie.isHttpOnly() else {}))
+        except Exception as e:
+            print(f"Ошибка при чтении cookie: {str(e)}")
+
+    def remove(self, cookie):
+        try:
+            self.jar.clear(cookie.domain(), cookie.path() or '/', self.text(cookie.name()))
+        except KeyError:
+            pass
+
+class SegmentedTransfer:
+    # Загрузка по HTTP Range в несколько соединений. Файл заранее создается
+    # нужного размера (path + '.part'), а состояние сегментов периодически
+    # сохраняется рядом (path + '.part.json'), чтобы докачать после перезапуска.
+    # Запросы идут с Referer и cookies профиля (cookie_jar), а ответ должен
+    # совпасть по типу и размеру с тем, что ожидала исходная загрузка.
+    # Работает в потоках и не зависит от Qt.
+    def __init__(self, url, path, connections=DOWNLOAD_SEGMENTS, referer='', cookie_jar=None,
+                 expected_type='', expected_total=-1):
+        self.url = url
+        self.path = path
+        self.referer = referer
+        self.cookie_jar = cookie_jar
+        self.expected_type = expected_type
+        self.expected_total = expected_total
+        self.part_path = path + '.part'
+        self.sidecar_path = path + SEGMENT_SIDECAR_SUFFIX
+        self.connections = max(1, connections)
+        self.total = -1
+        self.validator = ''
+        self.resumable = False
+        # Сегмент: start и end (не включая) в файле, pos — сколько уже записано
+        self.segments = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.done = False
+        self.cancelled = False
+        self.error = None
+
+    @classmethod
+    def from_sidecar(cls, sidecar_path, cookie_jar=None):
+        with open(sidecar_path, encoding='utf-8') as f:
+            data = json.load(f)
+        transfer = cls(data['url'], data['path'], data.get('connections', DOWNLOAD_SEGMENTS),
+                       data.get('referer', ''), cookie_jar, data.get('expected_type', ''),
+                       data.get('expected_total', -1))
+        transfer.total = data['total']
+        transfer.validator = data.get('validator', '')
+        transfer.resumable = True
+        transfer.segments = [{'start': start, 'end': end, 'pos': pos, 'busy': False}
+                             for start, end, pos in data['segments']]
+        return transfer
+
+    @property
+    def received(self):
+        with self.lock:
+            return sum(seg['pos'] - seg['start'] for seg in self.segments)
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.is_running() or self.done or self.cancelled:
+            return
+        self.stop_event = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def wait(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def cancel(self):
+        self.cancelled = True
+        self.stop()
+        if not self.is_running():
+            self.cleanup()
+
+    def cleanup(self):
+        for path in (self.part_path, self.sidecar_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def request(self, headers):
+        headers = {'User-Agent': SEGMENT_USER_AGENT, **headers}
+        if self.referer:
+            headers['Referer'] = self.referer
+        request = urllib.request.Request(self.url, headers=headers)
+        if self.cookie_jar is not None:
+            self.cookie_jar.add_cookie_header(request)
+        return urllib.request.urlopen(request, timeout=SEGMENT_TIMEOUT)
+
+    def probe(self):
+        # Запрос первого байта сразу показывает и размер, и поддержку Range
+        with self.request({'Range': 'bytes=0-0'}) as resp:
+            validator = resp.headers.get('ETag') or resp.headers.get('Last-Modified') or ''
+            if resp.status == 206:
+                total = resp.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+                total = int(total) if total.isdigit() else -1
+            else:
+                total = int(resp.headers.get('Content-Length') or -1)
+            resumable = resp.status == 206 and total > 0
+            content_type = resp.headers.get_content_type() if resp.headers.get('Content-Type') else ''
+        # Без cookies или с другим Referer сервер может отдать страницу входа
+        # или ошибки вместо файла — такую загрузку не продолжаем
+        if self.expected_type and content_type and content_type != self.expected_type:
+            raise ValueError(f"сервер вернул {content_type} вместо {self.expected_type}")
+        if self.expected_total > 0 and total > 0 and total != self.expected_total:
+            raise ValueError(f"сервер вернул {total} байт вместо {self.expected_total}")
+        if self.segments and (not resumable or total != self.total or validator != self.validator):
+            # Файл на сервере изменился — начинаем заново
+            self.segments = []
+        self.total = total
+        self.validator = validator
+        self.resumable = resumable
+
+    def plan_segments(self):
+        if self.resumable:
+            count = max(1, min(self.connections, self.total // SEGMENT_MIN_SIZE))
+            size = -(-self.total // count)
+            self.segments = [{'start': start, 'end': min(start + size, self.total),
+                              'pos': start, 'busy': False}
+                             for start in range(0, self.total, size)]
+        else:
+            # Без Range только одно соединение, размер может быть неизвестен (-1)
+            self.segments = [{'start': 0, 'end': self.total, 'pos': 0, 'busy': False}]
+        with open(self.part_path, 'wb') as f:
+            if self.total > 0:
+                f.truncate(self.total)
+
+    def next_segment(self):
+        with self.lock:
+            for seg in self.segments:
+                if not seg['busy'] and (seg['end'] < 0 or seg['pos'] < seg['end']):
+                    seg['busy'] = True
+                    return seg
+            if not self.resumable:
+                return None
+            # Свободных сегментов нет — делим пополам самый большой остаток
+            candidates = [seg for seg in self.segments
+                          if seg['end'] - seg['pos'] >= 2 * SEGMENT_MIN_SIZE]
+            if not candidates:
+                return None
+            seg = max(candidates, key=lambda seg: seg['end'] - seg['pos'])
+            middle = seg['pos'] + (seg['end'] - seg['pos']) // 2
+            new_seg = {'start': middle, 'end': seg['end'], 'pos': middle, 'busy': True}
+            seg['end'] = middle
+            self.segments.append(new_seg)
+            return new_seg
+
+    def fetch(self, seg):
+        headers = {}
+        if self.resumable:
+            headers['Range'] = f"bytes={seg['pos']}-{seg['end'] - 1}"
+        else:
+            seg['pos'] = 0
+        # Без буфера: данные попадают в ОС раньше, чем pos в файл состояния
+        with self.request(headers) as resp, open(self.part_path, 'r+b', buffering=0) as f:
+            if self.resumable and resp.status != 206:
+                raise IOError("Сервер перестал поддерживать докачку")
+            f.seek(seg['pos'])
+            if not self.resumable:
+                f.truncate()
+            while not self.stop_event.is_set():
+                with self.lock:
+                    remaining = seg['end'] - seg['pos'] if seg['end'] >= 0 else SEGMENT_CHUNK
+                if remaining <= 0:
+                    return
+                chunk = resp.read(min(SEGMENT_CHUNK, remaining))
+                if not chunk:
+                    if seg['end'] < 0:
+                        with self.lock:
+                            seg['end'] = seg['pos']
+                        return
+                    raise IOError("Соединение оборвалось")
+                f.write(chunk)
+                with self.lock:
+                    seg['pos'] += len(chunk)
+
+    def worker(self):
+        while not self.stop_event.is_set():
+            seg = self.next_segment()
+            if seg is None:
+                return
+            try:
+                for attempt in range(SEGMENT_RETRIES + 1):
+                    try:
+                        self.fetch(seg)
+                        break
+                    except Exception:
+                        if attempt == SEGMENT_RETRIES or self.stop_event.is_set() \
+                                or not self.resumable:
+                            raise
+                        self.stop_event.wait(2 ** attempt)
+            except Exception as e:
+                self.error = str(e)
+                self.stop_event.set()
+            finally:
+                with self.lock:
+                    seg['busy'] = False
+
+    def is_complete(self):
+        with self.lock:
+            return bool(self.segments) and all(
+                seg['end'] >= 0 and seg['pos'] >= seg['end'] for seg in self.segments)
+
+    def save_sidecar(self):
+        if not self.resumable or self.cancelled:
+            return
+        with self.lock:
+            segments = [[seg['start'], seg['end'], seg['pos']] for seg in self.segments]
+        data = {'url': self.url, 'path': self.path, 'total': self.total,
+                'validator': self.validator, 'connections': self.connections,
+                'referer': self.referer, 'expected_type': self.expected_type,
+                'expected_total': self.expected_total, 'segments': segments}
+        try:
+            tmp_path = self.sidecar_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.sidecar_path)
+        except OSError as e:
+            print(f"Ошибка при сохранении состояния загрузки: {str(e)}")
+
+    def run(self):
+        try:
+            self.probe()
+            if not self.segments or not os.path.exists(self.part_path):
+                self.plan_segments()
+            self.save_sidecar()
+
+            count = self.connections if self.resumable else 1
+            workers = [threading.Thread(target=self.worker, daemon=True) for _ in range(count)]
+            for worker in workers:
+                worker.start()
+            while True:
+                alive = [worker for worker in workers if worker.is_alive()]
+                if not alive:
+                    break
+                alive[0].join(SEGMENT_SAVE_INTERVAL)
+                self.save_sidecar()
+
+            if self.cancelled:
+                self.cleanup()
+            elif self.is_complete():
+                os.replace(self.part_path, self.path)
+                try:
+                    os.remove(self.sidecar_path)
+                except OSError:
+                    pass
+                self.done = True
+            else:
+                self.save_sidecar()
+        except Exception as e:
+            self.error = str(e)
+            if self.cancelled:
+                self.cleanup()
+
+class SegmentedDownload(QObject):
+    # Обертка над SegmentedTransfer с тем же интерфейсом, что у
+    # QWebEngineDownloadItem, чтобы ее показывало окно загрузок
+    downloadProgress = pyqtSignal('qint64', 'qint64')
+    finished = pyqtSignal()
+    stateChanged = pyqtSignal(int)
+
+    def __init__(self, transfer, parent=None):
+        super().__init__(parent)
+        self.transfer = transfer
+        self._state = QWebEngineDownloadItem.DownloadRequested
+        self.paused = False
+        self.last_received = -1
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(DOWNLOAD_REFRESH_MS)
+        self.timer.timeout.connect(self.poll)
+
+    def url(self):
+        return QUrl(self.transfer.url)
+
+    def path(self):
+        return self.transfer.path
+
+    def suggestedFileName(self):
+        return os.path.basename(self.transfer.path)
+
+    def state(self):
+        return self._state
+
+    def isPaused(self):
+        return self.paused
+
+    def set_state(self, state):
+        self._state = state
+        self.stateChanged.emit(state)
+
+    def accept(self):
+        if self._state != QWebEngineDownloadItem.DownloadRequested:
+            return
+        self.set_state(QWebEngineDownloadItem.DownloadInProgress)
+        self.timer.start()
+        # Запуск откладываем: очередь загрузок может сразу поставить паузу
+        QTimer.singleShot(0, self.poll)
+
+    def pause(self):
+        if self._state != QWebEngineDownloadItem.DownloadInProgress:
+            return
+        self.paused = True
+        self.transfer.stop()
+
+    def resume(self):
+        if self._state != QWebEngineDownloadItem.DownloadInProgress:
+            return
+        self.paused = False
+        self.transfer.start()
+
+    def cancel(self):
+        if self._state not in (QWebEngineDownloadItem.DownloadRequested,
+                               QWebEngineDownloadItem.DownloadInProgress):
+            return
+        self.transfer.cancel()
+        self.timer.stop()
+        self.set_state(QWebEngineDownloadItem.DownloadCancelled)
+        self.finished.emit()
+
+    def poll(self):
+        if self._state != QWebEngineDownloadItem.DownloadInProgress:
+            return
+        transfer = self.transfer
+        received = transfer.received
+        if received != self.last_received:
+            self.last_received = received
+            self.downloadProgress.emit(received, transfer.total)
+        if transfer.done:
+            self.timer.stop()
+            self.set_state(QWebEngineDownloadItem.DownloadCompleted)
+            self.finished.emit()
+        elif transfer.error and not transfer.is_running():
+            print(f"Ошибка при загрузке: {transfer.error}")
+            self.timer.stop()
+            self.set_state(QWebEngineDownloadItem.DownloadInterrupted)
+            self.finished.emit()
+        elif not self.paused and not transfer.is_running():
+            transfer.start()
+
+class DownloadDelegate(QStyledItemDelegate):
+    ROW_HEIGHT = 52
+
+    def sizeHint(self, option, index):
+        return QSize(option.rect.width(), self.ROW_HEIGHT)
+
+    def paint(self, painter, option, index):
+        entry = index.data(DownloadsModel.EntryRole)
+        if entry is None:
+            return
+        painter.save()
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(option.rect, QColor('#e8f0fe'))
+
+        rect = option.rect.adjusted(10, 6, -10, -6)
+        bar_width = 200
+        right_width = 160
+        text_rect = QRect(rect.left(), rect.top(),
+                          rect.width() - bar_width - right_width - 20, rect.height())
+
+        # Имя файла и папка
+        bold = QFont(option.font)
+        bold.setBold(True)
+        painter.setFont(bold)
+        painter.setPen(QColor('#202124'))
+        metrics = QFontMetrics(bold)
+        painter.drawText(text_rect.adjusted(0, 0, 0, -rect.height() // 2),
+                         Qt.AlignLeft | Qt.AlignVCenter,
+                         metrics.elidedText(entry.filename, Qt.ElideMiddle, text_rect.width()))
+        painter.setFont(option.font)
+        painter.setPen(QColor('gray'))
+        metrics = QFontMetrics(option.font)
+        painter.drawText(text_rect.adjusted(0, rect.height() // 2, 0, 0),
+                         Qt.AlignLeft | Qt.AlignVCenter,
+                         metrics.elidedText(entry.directory, Qt.ElideMiddle, text_rect.width()))
+
         # Размер и прогресс
-        progress_layout = QVBoxLayout()
-        
-        # Размер файла
-        self.size_label = QLabel()
-        progress_layout.addWidget(self.size_label)
-        
-        # Прогресс бар
-        self.progress_bar = QProgressBar()
-        self.progress_bar.setFixedWidth(200)
-        progress_layout.addWidget(self.progress_bar)
-        
-        layout.addLayout(progress_layout)
-        
-        # Скорость загрузки
-        self.speed_label = QLabel()
-        layout.addWidget(self.speed_label)
-        
-        # Добавляем кнопки управления
-        control_layout = QHBoxLayout()
-        
-        # Кнопка паузы/возобновления
-        self.pause_btn = QPushButton()
-        self.pause_btn.setFixedSize(32, 32)
-        self.pause_btn.setStyleSheet("""
+        bar_left = text_rect.right() + 10
+        painter.setPen(QColor('#202124'))
+        painter.drawText(QRect(bar_left, rect.top(), bar_width, rect.height() // 2),
+                         Qt.AlignLeft | Qt.AlignVCenter, entry.size_text())
+        bar = QStyleOptionProgressBar()
+        bar.rect = QRect(bar_left, rect.top() + rect.height() // 2 + 4, bar_width, 10)
+        bar.minimum = 0
+        bar.maximum = 1000
+        bar.progress = (int(entry.bytes_received * 1000 / entry.bytes_total)
+                        if entry.bytes_total > 0 else 0)
+        bar.state = option.state | QStyle.State_Enabled
+        QApplication.style().drawControl(QStyle.CE_ProgressBar, bar, painter)
+
+        # Скорость и оставшееся время или состояние
+        painter.setPen(QColor('#5f6368'))
+        status_left = bar_left + bar_width + 10
+        painter.drawText(QRect(status_left, rect.top(), right_width, rect.height() // 2),
+                         Qt.AlignLeft | Qt.AlignVCenter, entry.status_text())
+        painter.drawText(QRect(status_left, rect.top() + rect.height() // 2,
+                               right_width, rect.height() // 2),
+                         Qt.AlignLeft | Qt.AlignVCenter, entry.eta_text())
+        painter.restore()
+
+class DownloadsWindow(QMainWindow):
+    @traced('DownloadsWindow.__init__')
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Загрузки")
+        self.setGeometry(200, 200, 700, 400)
+
+        # Все стили окна задаются один раз
+        self.setStyleSheet("""
             QPushButton {
                 border: none;
-                border-radius: 16px;
+                border-radius: 14px;
                 background: #f0f0f0;
                 color: #333333;
+                padding: 6px 14px;
             }
             QPushButton:hover {
                 background: #e0e0e0;
@@ -81,58 +5195,109 @@ class DownloadWidget(QWidget):
             QPushButton:pressed {
                 background: #d0d0d0;
             }
-        """)
-        self.pause_btn.setText("⏸")
-        self.pause_btn.setToolTip("Пауза")
-        self.pause_btn.clicked.connect(self.toggle_pause)
-        control_layout.addWidget(self.pause_btn)
-        
-        # Кнопка отмены
-        self.cancel_btn = QPushButton()
-        self.cancel_btn.setFixedSize(32, 32)
-        self.cancel_btn.setStyleSheet("""
-            QPushButton {
+            QListView {
                 border: none;
-                border-radius: 16px;
-                background: #f0f0f0;
-                color: #333333;
-            }
-            QPushButton:hover {
-                background: #ffebee;
-                color: #d32f2f;
-            }
-            QPushButton:pressed {
-                background: #ffcdd2;
             }
         """)
-        self.cancel_btn.setText("✕")
-        self.cancel_btn.setToolTip("Отменить")
-        self.cancel_btn.clicked.connect(self.cancel_download)
-        control_layout.addWidget(self.cancel_btn)
         
-        layout.addLayout(control_layout)
-        self.setLayout(layout)
+        # Центральный виджет
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
         
-        # Подключаем сигналы загрузки
-        self.download.downloadProgress.connect(self.update_progress)
-        self.download.finished.connect(self.download_finished)
-        self.download.stateChanged.connect(self.state_changed)
+        # Основной layout
+        layout = QVBoxLayout(central_widget)
+
+        # Кнопки управления выбранными загрузками
+        controls = QHBoxLayout()
+        self.pause_btn = QPushButton("⏸ Пауза")
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        controls.addWidget(self.pause_btn)
+        self.cancel_btn = QPushButton("✕ Отменить")
+        self.cancel_btn.clicked.connect(self.cancel_selected)
+        controls.addWidget(self.cancel_btn)
+        open_btn = QPushButton("Открыть папку")
+        open_btn.clicked.connect(self.open_folder)
+        controls.addWidget(open_btn)
+        controls.addStretch()
+        clear_btn = QPushButton("Очистить")
+        clear_btn.setToolTip("Убрать завершенные загрузки из списка")
+        clear_btn.clicked.connect(self.clear_finished)
+        controls.addWidget(clear_btn)
+        layout.addLayout(controls)
+
+        # Очередь: число одновременных загрузок и лимиты скорости
+        self.scheduler = DownloadScheduler(self)
+        queue_controls = QHBoxLayout()
+        self.queue_btn = QPushButton("Приостановить очередь")
+        self.queue_btn.clicked.connect(self.toggle_queue)
+        queue_controls.addWidget(self.queue_btn)
+        queue_controls.addStretch()
+
+        queue_controls.addWidget(QLabel("Одновременно:"))
+        self.max_active_box = QSpinBox()
+        self.max_active_box.setRange(1, 50)
+        self.max_active_box.setValue(self.scheduler.max_active)
+        self.max_active_box.valueChanged.connect(self.scheduler.set_max_active)
+        queue_controls.addWidget(self.max_active_box)
+
+        queue_controls.addWidget(QLabel("Лимит:"))
+        self.rate_box = QSpinBox()
+        self.host_rate_box = QSpinBox()
+        for box, value in ((self.rate_box, DOWNLOAD_RATE_LIMIT_KB),
+                           (self.host_rate_box, DOWNLOAD_HOST_RATE_LIMIT_KB)):
+            box.setRange(0, 1024 * 1024)
+            box.setSingleStep(100)
+            box.setSuffix(" КБ/с")
+            box.setSpecialValueText("нет")
+            box.setValue(value)
+            box.valueChanged.connect(self.update_rate_limits)
+        queue_controls.addWidget(self.rate_box)
+        queue_controls.addWidget(QLabel("На сайт:"))
+        queue_controls.addWidget(self.host_rate_box)
+        layout.addLayout(queue_controls)
+
+        # Повторные загрузки одного и того же файла
+        self.dedup = DownloadDeduplicator(parent=self)
+        self.dedup.progress.connect(lambda entry, percent:
+            entry.set_check_status(f"проверка дубликатов {percent}%"))
+        self.dedup.checked.connect(lambda entry, result: entry.check_finished(result))
+        dedup_box = QCheckBox("Заменять повторные загрузки ссылками на уже скачанный файл")
+        dedup_box.setChecked(self.dedup.enabled)
+        dedup_box.toggled.connect(lambda checked: setattr(self.dedup, 'enabled', checked))
+        layout.addWidget(dedup_box)
+        
+        # Список загрузок: строки рисует делегат, виджеты на строку не создаются
+        self.model = DownloadsModel(self)
+        self.view = QListView()
+        self.view.setModel(self.model)
+        self.view.setItemDelegate(DownloadDelegate(self.view))
+        self.view.setUniformItemSizes(True)
+        self.view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.view.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.view.customContextMenuRequested.connect(self.show_context_menu)
+        self.view.doubleClicked.connect(self.open_file)
+        layout.addWidget(self.view)
         
+    @traced('DownloadsWindow.add_download')
+    def add_download(self, entry):
+        self.model.add_entry(entry)
+        self.scheduler.add(entry)
+        entry.completed.connect(self.dedup.check)
+        self.show()
+        self.raise_()
+
+    def selected_entries(self):
+        return [index.data(DownloadsModel.EntryRole)
+                for index in self.view.selectionModel().selectedRows()]
+
     def toggle_pause(self):
-        if self.is_paused:
-            self.download.resume()
-            self.pause_btn.setText("⏸")
-            self.pause_btn.setToolTip("Пауза")
-            self.is_paused = False
-            self.speed_label.setText("Возобновлено")
-        else:
-            self.download.pause()
-            self.pause_btn.setText("▶")
-            self.pause_btn.setToolTip("Продолжить")
-            self.is_paused = True
-            self.speed_label.setText("Приостановлено")
-    
-    def cancel_download(self):
+        for entry in self.selected_entries():
+            entry.toggle_pause()
+
+    def cancel_selected(self):
+        entries = [entry for entry in self.selected_entries() if entry.is_active()]
+        if not entries:
+            return
         reply = QMessageBox.question(
             self,
             'Подтверждение',
@@ -140,86 +5305,644 @@ class DownloadWidget(QWidget):
             QMessageBox.Yes | QMessageBox.No,
             QMessageBox.No
         )
-        
         if reply == QMessageBox.Yes:
-            self.download.cancel()
-            self.speed_label.setText("Отменено")
-            self.progress_bar.setEnabled(False)
-            self.pause_btn.setEnabled(False)
-            self.cancel_btn.setEnabled(False)
-    
-    def state_changed(self, state):
-        if state == QWebEngineDownloadItem.DownloadCompleted:
-            self.pause_btn.setEnabled(False)
-            self.cancel_btn.setEnabled(False)
-            self.speed_label.setText("Завершено")
-        elif state == QWebEngineDownloadItem.DownloadCancelled:
-            self.pause_btn.setEnabled(False)
-            self.cancel_btn.setEnabled(False)
-            self.speed_label.setText("Отменено")
-        elif state == QWebEngineDownloadItem.DownloadInterrupted:
-            self.speed_label.setText("Прервано")
-            self.pause_btn.setEnabled(False)
-            self.cancel_btn.setEnabled(False)
-            
-    def update_progress(self, bytes_received, bytes_total):
+            for entry in entries:
+                entry.cancel_download()
+
+    def open_folder(self):
+        entries = self.selected_entries()
+        path = entries[0].directory if entries else downloads_path
+        QDesktopServices.openUrl(QUrl.fromLocalFile(path))
+
+    def open_file(self, index):
+        entry = index.data(DownloadsModel.EntryRole)
+        if entry and entry.state == QWebEngineDownloadItem.DownloadCompleted:
+            QDesktopServices.openUrl(QUrl.fromLocalFile(entry.download_path))
+
+    def clear_finished(self):
+        self.model.remove_finished()
+
+    def toggle_queue(self):
+        if self.scheduler.paused:
+            self.scheduler.resume_queue()
+            self.queue_btn.setText("Приостановить очередь")
+        else:
+            self.scheduler.pause_queue()
+            self.queue_btn.setText("Возобновить очередь")
+
+    def update_rate_limits(self):
+        self.scheduler.set_rate_limits(self.rate_box.value(), self.host_rate_box.value())
+
+    def set_priority(self, priority):
+        for entry in self.selected_entries():
+            self.scheduler.set_priority(entry, priority)
+
+    def show_context_menu(self, pos):
+        if not self.selected_entries():
+            return
+        menu = QMenu(self)
+        menu.addAction("Пауза / продолжить", self.toggle_pause)
+        menu.addAction("Отменить", self.cancel_selected)
+        menu.addAction("Открыть папку", self.open_folder)
+        priority_menu = menu.addMenu("Приоритет")
+        for priority in (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW):
+            priority_menu.addAction(PRIORITY_NAMES[priority].capitalize(),
+                                    lambda priority=priority: self.set_priority(priority))
+        menu.exec_(self.view.viewport().mapToGlobal(pos))
+
+class RenderTask:
+    def __init__(self, url, script=None, html=False, timeout=RENDER_TIMEOUT, callback=None,
+                 pdf=None, png=None, full_page=False):
+        self.url = url
+        self.script = script      # выполнить после загрузки, результат в result['result']
+        self.html = html          # вернуть HTML страницы
+        self.pdf = pdf            # путь для PDF или None
+        self.png = png            # путь для снимка или None
+        self.full_page = full_page  # снимок всей страницы, а не только окна
+        self.timeout = timeout
+        self.callback = callback  # получает словарь с результатом
+        self.page = None
+        self.timer = None
+        self.started = 0.0
+        self.stage_began = 0.0
+        self.done = False
+        self.result = {'url': url}
+
+class RenderPool(QObject):
+    # Скрытые страницы для пакетной обработки адресов: не больше size
+    # одновременно, остальные ждут в очереди. Успешно отработавшая страница
+    # сразу берет следующий адрес (процесс рендерера уже запущен), при пустой
+    # очереди удаляется. Страница с ошибкой или по тайм-ауту не переиспользуется:
+    # ее прерванная загрузка могла бы завершиться уже для следующего адреса.
+    # Для снимков страница живет в невидимом QWebEngineView, PNG кодируется
+    # в отдельном потоке, а страница тем временем берет следующий адрес.
+    saved = pyqtSignal(object, bool)
+
+    def __init__(self, profile, size=RENDER_POOL_SIZE, views=False, parent=None):
+        super().__init__(parent)
+        self.profile = profile
+        self.size = size
+        self.with_views = views
+        self.pending = deque()
+        self.running = {}
+        self.idle = []
+        self.views = {}
+        self.executor = None
+        self.stats_data = {'done': 0, 'failed': 0, 'started': time.time()}
+        self.saved.connect(self.png_saved)
+
+    def submit(self, task):
+        self.pending.append(task)
+        self.start_tasks()
+
+    def cancel(self, predicate):
+        kept = deque(task for task in self.pending if not predicate(task))
+        cancelled = len(self.pending) - len(kept)
+        self.pending = kept
+        return cancelled
+
+    def resize(self, size):
+        self.size = max(1, size)
+        self.start_tasks()
+
+    def create_page(self):
+        if self.with_views:
+            # Снимок требует отрисованного вида; на экран окно не выводится
+            view = QWebEngineView()
+            view.setAttribute(Qt.WA_DontShowOnScreen)
+            view.setPage(QWebEnginePage(self.profile, view))
+            view.resize(*RENDER_VIEWPORT)
+            view.show()
+            page = view.page()
+            self.views[page] = view
+        else:
+            page = QWebEnginePage(self.profile, self)
+        page.loadFinished.connect(lambda ok, page=page: self.page_loaded(page, ok))
+        page.pdfPrintingFinished.connect(lambda path, ok, page=page: self.pdf_done(page, ok))
+        return page
+
+    def dispose(self, page):
+        view = self.views.pop(page, None)
+        (view or page).deleteLater()
+
+    def start_tasks(self):
+        while self.pending and len(self.running) < self.size:
+            task = self.pending.popleft()
+            page = self.idle.pop() if self.idle else self.create_page()
+            if page in self.views:
+                self.views[page].resize(*RENDER_VIEWPORT)
+            task.page = page
+            task.started = time.perf_counter()
+            task.timer = QTimer(self)
+            task.timer.setSingleShot(True)
+            task.timer.timeout.connect(lambda task=task: self.finish(task, 'время истекло'))
+            task.timer.start(int(task.timeout * 1000))
+            self.running[page] = task
+            page.setUrl(QUrl(task.url))
+        # Лишние страницы не держим: очередь пуста
+        if not self.pending:
+            while self.idle:
+                self.dispose(self.idle.pop())
+
+    def page_loaded(self, page, ok):
+        task = self.running.get(page)
+        if task is None or task.done or 'load_ms' in task.result:
+            return
+        if not ok:
+            self.finish(task, 'страница не загрузилась')
+            return
+        task.result['load_ms'] = round((time.perf_counter() - task.started) * 1000, 1)
+        task.result['final_url'] = page.url().toString()
+        task.result['title'] = page.title()
+        self.after_load(task)
+
+    def after_load(self, task):
+        if task.script:
+            task.page.runJavaScript(task.script, lambda result, task=task:
+                self.script_done(task, result))
+        else:
+            self.collect_html(task)
+
+    def script_done(self, task, result):
+        if task.done:
+            return
+        task.result['result'] = result
+        self.collect_html(task)
+
+    def collect_html(self, task):
+        if task.html:
+            task.page.toHtml(lambda html, task=task: self.html_done(task, html))
+        else:
+            self.print_pdf(task)
+
+    def html_done(self, task, html):
+        if task.done:
+            return
+        task.result['html'] = html
+        self.print_pdf(task)
+
+    def print_pdf(self, task):
+        if task.pdf:
+            task.stage_began = time.perf_counter()
+            task.page.printToPdf(task.pdf)
+        else:
+            self.capture_png(task)
+
+    def pdf_done(self, page, ok):
+        task = self.running.get(page)
+        if task is None or task.done:
+            return
+        if not ok:
+            self.finish(task, 'PDF не сохранился')
+            return
+        task.result['pdf'] = task.pdf
+        task.result['pdf_ms'] = round((time.perf_counter() - task.stage_began) * 1000, 1)
+        self.capture_png(task)
+
+    def capture_png(self, task):
+        if not task.png or task.page not in self.views:
+            self.finish(task)
+            return
+        task.stage_began = time.perf_counter()
+        if task.full_page:
+            task.page.runJavaScript(RENDER_HEIGHT_JS, lambda height, task=task:
+                self.resize_for_png(task, height))
+        else:
+            QTimer.singleShot(RENDER_PAINT_DELAY, lambda task=task: self.grab_png(task))
+
+    def resize_for_png(self, task, height):
+        if task.done:
+            return
+        if isinstance(height, (int, float)):
+            width, min_height = RENDER_VIEWPORT
+            self.views[task.page].resize(width, max(min_height, min(int(height), RENDER_MAX_HEIGHT)))
+        # Ждем, пока вид перерисуется в новом размере
+        QTimer.singleShot(RENDER_PAINT_DELAY, lambda task=task: self.grab_png(task))
+
+    def grab_png(self, task):
+        if task.done:
+            return
+        image = self.views[task.page].grab().toImage()
+        if image.isNull():
+            self.finish(task, 'снимок не получился')
+            return
+        # Страница свободна, пока PNG пишется на диск
+        self.release(task, reuse=True)
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=2)
+        self.executor.submit(self.save_png, task, image)
+
+    def save_png(self, task, image):
+        self.saved.emit(task, image.save(task.png, 'PNG'))
+
+    def png_saved(self, task, ok):
+        if ok:
+            task.result['png'] = task.png
+            task.result['png_ms'] = round((time.perf_counter() - task.stage_began) * 1000, 1)
+            self.finish(task)
+        else:
+            self.finish(task, 'снимок не сохранился')
+
+    def release(self, task, reuse):
+        page = task.page
+        if page is None:
+            return
+        task.page = None
+        self.running.pop(page, None)
+        if reuse:
+            self.idle.append(page)
+        else:
+            self.dispose(page)
+        self.start_tasks()
+
+    def finish(self, task, error=None):
+        if task.done:
+            return
+        task.done = True
+        task.timer.stop()
+        task.result['ms'] = round((time.perf_counter() - task.started) * 1000, 1)
+        if error:
+            task.result['error'] = error
+            self.stats_data['failed'] += 1
+        else:
+            self.stats_data['done'] += 1
+        if task.callback is not None:
+            try:
+                task.callback(task.result)
+            except Exception as e:
+                print(f"Ошибка при обработке результата {task.url}: {str(e)}")
+        self.release(task, reuse=not error)
+
+    def stats(self):
+        finished = self.stats_data['done'] + self.stats_data['failed']
+        elapsed = max(time.time() - self.stats_data['started'], 1e-6)
+        return {'size': self.size, 'pending': len(self.pending), 'running': len(self.running),
+                'done': self.stats_data['done'], 'failed': self.stats_data['failed'],
+                'pages_per_second': round(finished / elapsed, 2)}
+
+    def close(self):
+        self.pending.clear()
+        for task in list(self.running.values()):
+            self.finish(task, 'пул закрыт')
+        while self.idle:
+            self.dispose(self.idle.pop())
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+class ControlServer(QObject):
+    # Управление браузером из скриптов: JSON-RPC 2.0 через QLocalServer
+    # (Unix-сокет, на Windows — именованный канал), одно сообщение на строку.
+    # Работает в потоке интерфейса, как и вкладки, которыми управляет.
+    # Длинные вызовы (ожидание загрузки, скрипт, HTML) отвечают, когда готовы;
+    # результаты batch.submit приходят уведомлениями batch.result.
+    def __init__(self, browser, name=None, parent=None):
+        super().__init__(parent)
+        self.browser = browser
+        self.name = name or control_socket_name
+        self.server = QLocalServer(self)
+        self.server.setSocketOptions(QLocalServer.UserAccessOption)
+        self.server.newConnection.connect(self.new_connection)
+        self.buffers = {}
+        self.waiters = {}         # id вкладки -> ответы tab.wait
+        self.jobs = {}
+        self.next_job = 1
+        self.pool = None
+        self.methods = {
+            'tabs.list': self.tabs_list,
+            'tab.open': self.tab_open,
+            'tab.navigate': self.tab_navigate,
+            'tab.wait': self.tab_wait,
+            'tab.eval': self.tab_eval,
+            'tab.html': self.tab_html,
+            'tab.close': self.tab_close,
+            'batch.submit': self.batch_submit,
+            'batch.cancel': self.batch_cancel,
+            'pool.stats': self.pool_stats,
+            'pool.resize': self.pool_resize,
+        }
+
+    def start(self):
+        # Сокет, оставшийся от упавшего процесса, мешает listen
+        QLocalServer.removeServer(self.name)
+        if not self.server.listen(self.name):
+            print(f"Ошибка при запуске сервера управления: {self.server.errorString()}")
+            return False
+        self.browser.statusBar().showMessage(f"Сервер управления: {self.server.fullServerName()}", 10000)
+        return True
+
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = RenderPool(self.browser.profile, parent=self)
+        return self.pool
+
+    def new_connection(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            self.buffers[socket] = b''
+            socket.readyRead.connect(lambda socket=socket: self.read(socket))
+            socket.disconnected.connect(lambda socket=socket: self.dropped(socket))
+
+    def dropped(self, socket):
+        self.buffers.pop(socket, None)
+        # Адреса отключившегося клиента больше некому отдавать
+        for job_id, job in list(self.jobs.items()):
+            if job['socket'] is socket:
+                self.get_pool().cancel(lambda task, job_id=job_id: task.job_id == job_id)
+                del self.jobs[job_id]
+        socket.deleteLater()
+
+    def read(self, socket):
+        data = self.buffers.get(socket, b'') + bytes(socket.readAll())
+        lines = data.split(b'\n')
+        self.buffers[socket] = lines.pop()
+        for line in lines:
+            if line.strip():
+                self.dispatch(socket, line)
+
+    def dispatch(self, socket, line):
         try:
-            # Обновляем прогресс
-            self.progress_bar.setMaximum(bytes_total)
-            self.progress_bar.setValue(bytes_received)
-            
-            # Обновляем размер
-            total_mb = bytes_total / (1024 * 1024)
-            received_mb = bytes_received / (1024 * 1024)
-            self.size_label.setText(f"{received_mb:.1f} MB / {total_mb:.1f} MB")
-            
-            # Вычисляем и показываем скорость если загрузка не на паузе
-            if not self.is_paused:
-                speed = bytes_received / max(1, self.download.elapsedTime().elapsed() / 1000.0)
-                speed_mb = speed / (1024 * 1024)
-                self.speed_label.setText(f"{speed_mb:.1f} MB/s")
-            
-        except Exception as e:
-            print(f"Ошибка при обновлении прогресса: {str(e)}")
-            
-    def download_finished(self):
+            message = json.loads(line)
+        except ValueError:
+            self.send(socket, {'jsonrpc': '2.0', 'id': None,
+                               'error': {'code': -32700, 'message': 'некорректный JSON'}})
+            return
+        msg_id = message.get('id') if isinstance(message, dict) else None
+
+        def reply(result=None, error=None, code=-32000):
+            # Уведомления (без id) ответа не получают
+            if msg_id is None:
+                return
+            response = {'jsonrpc': '2.0', 'id': msg_id}
+            if error is None:
+                response['result'] = result
+            else:
+                response['error'] = {'code': code, 'message': error}
+            self.send(socket, response)
+
+        handler = self.methods.get(message.get('method')) if isinstance(message, dict) else None
+        if handler is None:
+            reply(error='неизвестный метод', code=-32601)
+            return
+        params = message.get('params') or {}
         try:
-            self.progress_bar.setValue(self.progress_bar.maximum())
-            self.speed_label.setText("Завершено")
-            self.pause_btn.setEnabled(False)
-            self.cancel_btn.setEnabled(False)
+            handler(socket, params, reply)
+        except (KeyError, TypeError, ValueError) as e:
+            reply(error=f'некорректные параметры: {str(e)}', code=-32602)
         except Exception as e:
-            print(f"Ошибка при завершении загрузки: {str(e)}")
+            print(f"Ошибка при выполнении {message.get('method')}: {str(e)}")
+            reply(error=str(e))
+
+    def send(self, socket, message):
+        if socket not in self.buffers:
+            return
+        socket.write(json.dumps(message, ensure_ascii=False, default=str).encode('utf-8') + b'\n')
+
+    def view(self, params):
+        info = self.browser.tab_registry.get(int(params['tab']))
+        if info is None:
+            raise ValueError(f"нет вкладки {params['tab']}")
+        if not isinstance(info.widget, QWebEngineView):
+            # Вкладка из сессии еще не загружалась: открываем ее
+            self.browser.tabs.setCurrentIndex(self.browser.tab_registry.row(info.tab_id))
+            self.browser.materialize_tab(info.widget)
+            info = self.browser.tab_registry.get(info.tab_id)
+        return info.widget
+
+    def load_finished(self, tab_id, view, ok):
+        # Вызывается браузером на loadFinished любой вкладки
+        for reply in self.waiters.pop(tab_id, []):
+            reply({'ok': ok, 'url': view.url().toString(), 'title': view.title()})
+
+    def tab_closed(self, tab_id):
+        for reply in self.waiters.pop(tab_id, []):
+            reply(error='вкладка закрыта')
+
+    def tabs_list(self, socket, params, reply):
+        reply([{'tab': info.tab_id, 'url': info.url, 'title': info.title}
+               for info in self.browser.tab_registry])
+
+    def tab_open(self, socket, params, reply):
+        tab_id = self.browser.add_new_tab(QUrl.fromUserInput(params.get('url', 'about:blank')))
+        if tab_id is None:
+            reply(error='вкладка не открылась')
+            return
+        reply({'tab': tab_id})
+
+    def tab_navigate(self, socket, params, reply):
+        view = self.view(params)
+        # loadStarted придет позже, а tab.wait может прийти сразу
+        self.browser.tab_registry.get(view.tab_id).loading = True
+        view.setUrl(QUrl.fromUserInput(params['url']))
+        reply({})
+
+    def tab_wait(self, socket, params, reply):
+        view = self.view(params)
+        info = self.browser.tab_registry.get(view.tab_id)
+        if not info.loading:
+            reply({'ok': info.load_ok, 'url': view.url().toString(), 'title': view.title()})
+            return
+        self.waiters.setdefault(view.tab_id, []).append(reply)
+
+        def expire(tab_id=view.tab_id):
+            waiters = self.waiters.get(tab_id, [])
+            if reply in waiters:
+                waiters.remove(reply)
+                reply(error='время ожидания загрузки истекло')
+        QTimer.singleShot(int(float(params.get('timeout', RENDER_TIMEOUT)) * 1000), expire)
 
-class DownloadsWindow(QMainWindow):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle("Загрузки")
-        self.setGeometry(200, 200, 600, 400)
-        
-        # Центральный виджет
-        central_widget = QWidget()
-        self.setCentralWidget(central_widget)
-        
-        # Основной layout
-        layout = QVBoxLayout(central_widget)
-        
-        # Область прокрутки для загрузок
-        scroll = QScrollArea()
-        scroll.setWidgetResizable(True)
-        layout.addWidget(scroll)
-        
-        # Контейнер для загрузок
-        self.downloads_container = QWidget()
-        self.downloads_layout = QVBoxLayout(self.downloads_container)
-        self.downloads_layout.addStretch()
-        
-        scroll.setWidget(self.downloads_container)
-        
-    def add_download(self, download_widget):
-        self.downloads_layout.insertWidget(self.downloads_layout.count()-1, download_widget)
-        self.show()
-        self.raise_()
+    def tab_eval(self, socket, params, reply):
+        self.view(params).page().runJavaScript(params['script'], lambda result: reply(result))
+
+    def tab_html(self, socket, params, reply):
+        self.view(params).page().toHtml(lambda html: reply(html))
+
+    def tab_close(self, socket, params, reply):
+        view = self.view(params)
+        if self.browser.tabs.count() < 2:
+            reply(error='последнюю вкладку закрыть нельзя')
+            return
+        self.browser.close_tab(self.browser.tab_registry.row(view.tab_id))
+        reply({})
+
+    def batch_submit(self, socket, params, reply):
+        urls = params['urls']
+        if not isinstance(urls, list):
+            raise TypeError('urls должен быть списком')
+        job_id = self.next_job
+        self.next_job += 1
+        job = {'socket': socket, 'total': len(urls), 'finished': 0, 'failed': 0,
+               'started': time.perf_counter()}
+        self.jobs[job_id] = job
+        pool = self.get_pool()
+        reply({'job': job_id, 'queued': len(urls)})
+        for url in urls:
+            task = RenderTask(QUrl.fromUserInput(url).toString(), params.get('script'),
+                              bool(params.get('html')), float(params.get('timeout', RENDER_TIMEOUT)),
+                              lambda result, job_id=job_id: self.batch_result(job_id, result))
+            task.job_id = job_id
+            pool.pending.append(task)
+        pool.start_tasks()
+        if not urls:
+            self.batch_result(job_id, None)
+
+    def batch_result(self, job_id, result):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        if result is not None:
+            job['finished'] += 1
+            job['failed'] += 'error' in result
+            self.send(job['socket'], {'jsonrpc': '2.0', 'method': 'batch.result',
+                                      'params': dict(result, job=job_id)})
+        if job['finished'] >= job['total']:
+            elapsed = time.perf_counter() - job['started']
+            del self.jobs[job_id]
+            self.send(job['socket'], {'jsonrpc': '2.0', 'method': 'batch.done', 'params': {
+                'job': job_id, 'total': job['total'], 'failed': job['failed'],
+                'seconds': round(elapsed, 3),
+                'pages_per_second': round(job['total'] / elapsed, 2) if elapsed else 0}})
+
+    def batch_cancel(self, socket, params, reply):
+        job_id = int(params['job'])
+        cancelled = self.get_pool().cancel(lambda task: task.job_id == job_id)
+        job = self.jobs.get(job_id)
+        if job is not None:
+            # Отмененные адреса считаются завершенными, чтобы пришел batch.done
+            job['total'] -= cancelled
+            self.batch_result(job_id, None)
+        reply({'cancelled': cancelled})
+
+    def pool_stats(self, socket, params, reply):
+        reply(self.get_pool().stats())
+
+    def pool_resize(self, socket, params, reply):
+        self.get_pool().resize(int(params['size']))
+        reply(self.get_pool().stats())
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+        self.server.close()
+        QLocalServer.removeServer(self.name)
+
+# Стиль главного окна. Применяется один раз: каждый setStyleSheet
+# заново разбирает лист и пересчитывает стиль всех дочерних виджетов
+BROWSER_STYLE = """
+    QMainWindow {
+        background-color: #ffffff;
+    }
+
+    /* Стиль вкладок */
+    QTabWidget::pane {
+        border: none;
+        background: #ffffff;
+        margin-top: -1px;
+    }
+    QTabBar::tab {
+        background: transparent;
+        border: none;
+        padding: 8px 25px 8px 30px;
+        margin-right: 2px;
+        color: #5f6368;
+        font-size: 13px;
+        min-width: 120px;
+        max-width: 200px;
+    }
+    QTabBar::tab:selected {
+        color: #1a73e8;
+        border-bottom: 2px solid #1a73e8;
+    }
+    QTabBar::tab:hover:!selected {
+        background: #f1f3f4;
+        border-radius: 4px;
+    }
+    QTabBar::close-button {
+        color: #666666;
+        margin: 2px;
+        padding: 2px;
+    }
+    QTabBar::close-button:hover {
+        background: #e8e8e8;
+        border-radius: 2px;
+    }
+    QTabBar::close-button:pressed {
+        background: #d0d0d0;
+    }
+
+    /* Стиль строки поиска */
+    QLineEdit#url_bar {
+        border: 1px solid #dfe1e5;
+        border-radius: 18px;
+        padding: 0 15px;
+        margin: 0 10px;
+        font-size: 14px;
+        background: white;
+        selection-background-color: #e8f0fe;
+        min-width: 400px;
+        max-width: 800px;
+    }
+    QLineEdit#url_bar:hover {
+        background: #f1f3f4;
+        border-color: #dfe1e5;
+    }
+    QLineEdit#url_bar:focus {
+        background: white;
+        border-color: #4285f4;
+        outline: none;
+    }
+
+    /* Стиль панели инструментов */
+    QToolBar {
+        spacing: 5px;
+        border: none;
+        background: white;
+        padding: 5px 10px;
+    }
+
+    /* Стиль кнопок */
+    QToolButton {
+        border: none;
+        background: transparent;
+        padding: 4px;
+        border-radius: 20px;
+        color: #5f6368;
+        font-size: 16px;
+        min-width: 32px;
+        min-height: 32px;
+    }
+    QToolBar QToolButton {
+        border-radius: 4px;
+        padding: 6px;
+        margin: 0 2px;
+    }
+    QToolButton:hover {
+        background: #f1f3f4;
+    }
+    QToolButton:pressed {
+        background: #e8eaed;
+    }
+    QToolButton:checked {
+        background: #e8f0fe;
+        color: #1a73e8;
+    }
+
+    /* Стиль меню в духе Safari */
+    QMenuBar {
+        background: transparent;
+        border: none;
+        padding: 8px;
+    }
+    QMenuBar::item {
+        padding: 4px 10px;
+        background: transparent;
+        border-radius: 4px;
+        color: #5f6368;
+    }
+    QMenuBar::item:selected {
+        background: #e5e5e5;
+        border-radius: 3px;
+    }
+"""
 
 class Browser(QMainWindow):
     def __init__(self):
@@ -227,118 +5950,32 @@ class Browser(QMainWindow):
         self.setWindowTitle('Web Browser')
         self.setGeometry(100, 100, 1200, 800)
         
-        # Современный стиль для всего браузера
-        self.setStyleSheet("""
-            QMainWindow {
-                background-color: #ffffff;
-            }
-            
-            /* Стиль вкладок */
-            QTabWidget::pane {
-                border: none;
-                background: #ffffff;
-                margin-top: -1px;
-            }
-            QTabBar::tab {
-                background: transparent;
-                border: none;
-                padding: 8px 30px;
-                margin-right: 2px;
-                color: #5f6368;
-                font-size: 13px;
-                min-width: 120px;
-                max-width: 200px;
-            }
-            QTabBar::tab:selected {
-                color: #1a73e8;
-                border-bottom: 2px solid #1a73e8;
-            }
-            QTabBar::tab:hover:!selected {
-                background: #f1f3f4;
-                border-radius: 4px;
-            }
-            
-            /* Стиль строки поиска */
-            QLineEdit {
-                border: 1px solid #dfe1e5;
-                border-radius: 24px;
-                padding: 8px 16px;
-                margin: 8px 10px;
-                font-size: 14px;
-                background: #ffffff;
-                selection-background-color: #e8f0fe;
-                min-width: 400px;
-                max-width: 800px;
-            }
-            QLineEdit:hover {
-                background: #ffffff;
-                border-color: #dfe1e5;
-                box-shadow: 0 1px 6px rgba(32,33,36,.28);
-            }
-            QLineEdit:focus {
-                border-color: #4285f4;
-                outline: none;
-            }
-            
-            /* Стиль панели инструментов */
-            QToolBar {
-                border: none;
-                background: #ffffff;
-                spacing: 2px;
-                padding: 4px;
-            }
-            
-            /* Стиль кнопок */
-            QToolButton {
-                border: none;
-                background: transparent;
-                padding: 4px;
-                border-radius: 20px;
-                color: #5f6368;
-                font-size: 16px;
-                min-width: 32px;
-                min-height: 32px;
-            }
-            QToolButton:hover {
-                background: #f1f3f4;
-            }
-            QToolButton:pressed {
-                background: #e8eaed;
-            }
-            QToolButton:checked {
-                background: #e8f0fe;
-                color: #1a73e8;
-            }
-            
-            /* Стиль меню */
-            QMenuBar {
-                background: #ffffff;
-                border: none;
-                padding: 8px;
-            }
-            QMenuBar::item {
-                padding: 8px 12px;
-                background: transparent;
-                border-radius: 4px;
-                color: #5f6368;
-            }
-            QMenuBar::item:selected {
-                background: #f1f3f4;
-            }
-            
-            /* Стиль прогресс-бара */
-            QProgressBar {
-                border: none;
-                background: #f1f3f4;
-                height: 3px;
-            }
-            QProgressBar::chunk {
-                background: #1a73e8;
-            }
-        """)
+        # Все стили окна — один лист, применяется один раз
+        with ui_tracer.span('setStyleSheet'):
+            self.setStyleSheet(BROWSER_STYLE)
+        startup_trace.mark('стили')
+
+        # Окна загрузок и кэша создаются при первом открытии
+        self.downloads_window = None
+        self.cache_window = None
+        self.archiver = None
+        self.archive_views = {}   # id вкладки -> временный MHTML страницы из архива
+        self.image_harvester = None
 
-        # Создаем окно загрузок
-        self.downloads_window = DownloadsWindow(self)
+        # Профиль запускает Chromium, поэтому создается после первой
+        # отрисовки окна, вместе с вкладками (finish_startup)
+        self.profile = None
+        self.cache_stats = None
+        self.view_pool = None
+        self.preloader = None
+        self.task_manager = None
+        self.task_manager_window = None
+        self.offline_store = None
+        self.offline_archiver = None
+        self.control_server = None
+        self.offline_dialog = None
+        self.painted = False
+        self.started = False
 
         # Создаем вкладки
         self.tabs = QTabWidget()
@@ -347,29 +5984,47 @@ class Browser(QMainWindow):
         self.tabs.tabCloseRequested.connect(self.close_tab)
         self.setCentralWidget(self.tabs)
 
+        # Реестр вкладок по id и вертикальный список (создается при первом показе)
+        self.tab_registry = TabRegistry(self.tabs, self)
+        self.tab_list_dock = None
+
+        # Миниатюры вкладок; снимки устаревших делаются при переключении на них
+        self.thumbnails = TabThumbnails(parent=self)
+        self.stale_thumbnails = set()
+        self.tab_overview = None
+        self.tab_search = TabTextIndex(self)
+        self.tab_search_dialog = None
+
+        # Заморозка и выгрузка фоновых вкладок
+        self.lifecycle = TabLifecycleManager(self.tabs, parent=self)
+
+        # Метрики загрузки страниц
+        self.metrics = PageMetrics(parent=self)
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.setInterval(METRICS_EXPORT_INTERVAL)
+        self.metrics_timer.timeout.connect(self.metrics.save)
+
+        # Поиск зависаний интерфейса, включается --trace-ui или из меню
+        self.stall_watchdog = StallWatchdog(self.metrics.registry, self)
+        if ui_tracer.enabled:
+            self.stall_watchdog.start()
+        if metrics_export_path:
+            self.metrics_timer.start()
+
+        # Блокировка рекламы: индекс фильтров загружается в finish_startup
+        self.content_blocker = ContentBlocker(self, self.metrics.registry)
+        self.network_recorder = NetworkRecorder()
+        self.content_blocker.recorder = self.network_recorder
+
+        # Журнал сессии
+        self.session = SessionJournal(session_path)
+        self.next_tab_id = 1
+        self.restoring = False
+        self.tabs.currentChanged.connect(self.tab_changed)
+
         # Настройка панели навигации
         navbar = QToolBar()
         navbar.setMovable(False)
-        navbar.setStyleSheet("""
-            QToolBar {
-                spacing: 5px;
-                border: none;
-                background: white;
-                padding: 5px 10px;
-            }
-            QToolButton {
-                border: none;
-                border-radius: 4px;
-                padding: 6px;
-                margin: 0 2px;
-            }
-            QToolButton:hover {
-                background: #f1f3f4;
-            }
-            QToolButton:pressed {
-                background: #e8eaed;
-            }
-        """)
         self.addToolBar(navbar)
 
         # Кнопки навигации
@@ -404,29 +6059,24 @@ class Browser(QMainWindow):
         # Строка поиска
         self.url_bar = QLineEdit()
         self.url_bar.setFixedHeight(36)
-        self.url_bar.setStyleSheet("""
-            QLineEdit {
-                border: 1px solid #dfe1e5;
-                border-radius: 18px;
-                padding: 0 15px;
-                font-size: 14px;
-                background: white;
-                margin: 0 10px;
-            }
-            QLineEdit:hover {
-                background: #f1f3f4;
-                border-color: #dfe1e5;
-            }
-            QLineEdit:focus {
-                background: white;
-                border-color: #4285f4;
-                outline: none;
-            }
-        """)
+        self.url_bar.setObjectName('url_bar')
         self.url_bar.setPlaceholderText('Поиск в Google или введите URL')
         self.url_bar.returnPressed.connect(self.navigate_to_url)
         navbar.addWidget(self.url_bar)
 
+        # История и подсказки: поиск по истории идет в потоке History,
+        # сюда приходят только готовые результаты
+        self.history = History(parent=self)
+        self.omnibox = Omnibox(self.history, self.open_tab_suggestions, self)
+        self.omnibox.suggestions_ready.connect(self.show_suggestions)
+        self.suggestions = QStandardItemModel(self)
+        self.completer = QCompleter(self.suggestions, self)
+        self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.completer.setCompletionRole(Qt.UserRole)
+        self.url_bar.setCompleter(self.completer)
+        self.completer.activated[QModelIndex].connect(self.suggestion_activated)
+        self.url_bar.textEdited.connect(self.omnibox.update)
+
         # Кнопки справа
         downloads_btn = QToolButton()
         downloads_btn.setText('↓')
@@ -442,26 +6092,8 @@ class Browser(QMainWindow):
         new_tab_btn.clicked.connect(lambda: self.add_new_tab())
         navbar.addWidget(new_tab_btn)
 
-        # Отключаем возможность закрытия вкладок
-        self.tabs.setTabsClosable(False)
-
         # Создаем меню в стиле Safari
         menu = self.menuBar()
-        menu.setStyleSheet("""
-            QMenuBar {
-                background: transparent;
-                border: none;
-            }
-            QMenuBar::item {
-                padding: 4px 10px;
-                background: transparent;
-            }
-            QMenuBar::item:selected {
-                background: #e5e5e5;
-                border-radius: 3px;
-            }
-        """)
-        
         file_menu = menu.addMenu('Файл')
         
         new_tab_action = QAction('Новая вкладка', self)
@@ -474,73 +6106,716 @@ class Browser(QMainWindow):
         save_page_action.triggered.connect(self.save_page)
         file_menu.addAction(save_page_action)
 
-        save_image_action = QAction('Сохранить изображение', self)
+        archive_tabs_action = QAction('Архивировать все вкладки', self)
+        archive_tabs_action.triggered.connect(self.archive_tabs)
+        file_menu.addAction(archive_tabs_action)
+
+        archive_list_action = QAction('Архивировать адреса из файла…', self)
+        archive_list_action.triggered.connect(self.archive_url_list)
+        file_menu.addAction(archive_list_action)
+
+        open_archived_action = QAction('Открыть страницу из архива…', self)
+        open_archived_action.triggered.connect(self.open_archived_page)
+        file_menu.addAction(open_archived_action)
+
+        offline_pages_action = QAction('Офлайн-копии страниц…', self)
+        offline_pages_action.triggered.connect(self.show_offline_pages)
+        file_menu.addAction(offline_pages_action)
+
+        offline_copy_action = QAction('Открыть офлайн-копию этой страницы', self)
+        offline_copy_action.setShortcut('Ctrl+Shift+O')
+        offline_copy_action.triggered.connect(self.open_offline_copy)
+        file_menu.addAction(offline_copy_action)
+
+        self.offline_action = QAction('Сохранять страницы для офлайн-чтения', self)
+        self.offline_action.setCheckable(True)
+        self.offline_action.setChecked(OFFLINE_CAPTURE)
+        file_menu.addAction(self.offline_action)
+
+        save_image_action = QAction('Сохранить все изображения', self)
         save_image_action.triggered.connect(self.save_image)
         file_menu.addAction(save_image_action)
 
-        # Создаем первую вкладку
-        self.add_new_tab(QUrl('https://www.google.com'))
+        self.auto_accept_action = QAction('Загружать без диалога', self)
+        self.auto_accept_action.setCheckable(True)
+        self.auto_accept_action.setChecked(DOWNLOAD_AUTO_ACCEPT)
+        file_menu.addAction(self.auto_accept_action)
+
+        self.segmented_action = QAction('Многопоточная загрузка', self)
+        self.segmented_action.setCheckable(True)
+        self.segmented_action.setChecked(DOWNLOAD_SEGMENTED)
+        file_menu.addAction(self.segmented_action)
+
+        cache_action = QAction('Кэш', self)
+        cache_action.triggered.connect(self.show_cache)
+        file_menu.addAction(cache_action)
+
+        self.blocking_action = QAction('Блокировать рекламу', self)
+        self.blocking_action.setCheckable(True)
+        self.blocking_action.setChecked(CONTENT_BLOCKING)
+        self.blocking_action.toggled.connect(
+            lambda checked: setattr(self.content_blocker, 'enabled', checked))
+        file_menu.addAction(self.blocking_action)
+
+        har_action = QAction('Экспорт запросов вкладки (HAR)', self)
+        har_action.triggered.connect(self.export_tab_har)
+        file_menu.addAction(har_action)
+
+        self.control_action = QAction('Сервер управления', self)
+        self.control_action.setCheckable(True)
+        self.control_action.setChecked(CONTROL_SERVER)
+        self.control_action.toggled.connect(self.set_control_server)
+        file_menu.addAction(self.control_action)
+
+        metrics_action = QAction('Экспорт метрик', self)
+        metrics_action.triggered.connect(self.export_metrics)
+        file_menu.addAction(metrics_action)
+
+        view_menu = menu.addMenu('Вид')
+        self.tab_list_action = QAction('Вертикальные вкладки', self)
+        self.tab_list_action.setCheckable(True)
+        self.tab_list_action.setShortcut('Ctrl+Shift+A')
+        self.tab_list_action.toggled.connect(self.show_tab_list)
+        view_menu.addAction(self.tab_list_action)
+
+        overview_action = QAction('Обзор вкладок', self)
+        overview_action.setShortcut('Ctrl+Shift+E')
+        overview_action.triggered.connect(self.show_tab_overview)
+        view_menu.addAction(overview_action)
+
+        tab_search_action = QAction('Поиск по вкладкам', self)
+        tab_search_action.setShortcut('Ctrl+Shift+F')
+        tab_search_action.triggered.connect(self.show_tab_search)
+        view_menu.addAction(tab_search_action)
+
+        self.preload_action = QAction('Предзагружать подсказку', self)
+        self.preload_action.setCheckable(True)
+        self.preload_action.setChecked(SPECULATIVE_PRELOAD)
+        self.preload_action.toggled.connect(self.set_preload)
+        view_menu.addAction(self.preload_action)
+
+        task_manager_action = QAction('Диспетчер задач', self)
+        task_manager_action.setShortcut('Shift+Esc')
+        task_manager_action.triggered.connect(self.show_task_manager)
+        view_menu.addAction(task_manager_action)
+
+        speedup_action = QAction('Статистика ускорения вкладок', self)
+        speedup_action.triggered.connect(self.show_speedup_stats)
+        view_menu.addAction(speedup_action)
+
+        view_menu.addSeparator()
+        self.ui_trace_action = QAction('Трассировка интерфейса', self)
+        self.ui_trace_action.setCheckable(True)
+        self.ui_trace_action.setChecked(ui_tracer.enabled)
+        self.ui_trace_action.toggled.connect(self.set_ui_tracing)
+        view_menu.addAction(self.ui_trace_action)
+
+        save_trace_action = QAction('Сохранить трассировку…', self)
+        save_trace_action.triggered.connect(self.save_ui_trace)
+        view_menu.addAction(save_trace_action)
 
-        # Настраиваем параметры загрузки
+        startup_trace.mark('панели и меню')
+
+        # Если окно так и не отрисуется (например, свернуто), все равно
+        # доводим запуск до конца
+        QTimer.singleShot(STARTUP_DEFER_TIMEOUT, self.finish_startup)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.painted:
+            self.painted = True
+            startup_trace.mark('первая отрисовка')
+            QTimer.singleShot(0, self.finish_startup)
+
+    @traced('finish_startup')
+    def finish_startup(self):
+        # Все, что не нужно для первого кадра: профиль, вкладки, загрузки
+        if self.started:
+            return
+        self.started = True
+
+        # Постоянный профиль с ограниченным HTTP-кэшем
+        self.profile = create_profile()
+        self.cache_stats = CacheStats(self.profile, self)
+        self.cookies = ProfileCookies(self.profile)
+        self.offline_store = OfflineStore()
+        self.offline_handler = OfflineSchemeHandler(self.offline_store, self)
+        self.offline_archiver = PageArchiver(self.profile, self.tab_registry, self.offline_store, self)
+        self.content_blocker.offline_store = self.offline_store
+        self.view_pool = ViewPool(self.profile, self.metrics.registry, parent=self)
+        self.preloader = PagePreloader(self.profile, self.metrics.registry,
+                                       self.preload_action.isChecked(), self)
+        self.content_blocker.load_async()
         self.download_settings()
+        startup_trace.mark('профиль')
 
-        # Включаем возможность закрытия вкладок
-        self.tabs.setTabsClosable(True)
-        self.tabs.tabCloseRequested.connect(self.close_tab)
+        # Восстанавливаем прошлую сессию или создаем первую вкладку
+        self.restore_session()
+        self.thumbnails.prune([info.tab_id for info in self.tab_registry])
+        self.clear_archive_views()
+        startup_trace.mark('сессия')
 
-        # Обновляем стили для вкладок и кнопки закрытия
-        self.setStyleSheet(self.styleSheet() + """
-            QTabBar::close-button {
-                color: #666666;
-                margin: 2px;
-                padding: 2px;
-            }
-            QTabBar::close-button:hover {
-                background: #e8e8e8;
-                border-radius: 2px;
-            }
-            QTabBar::close-button:pressed {
-                background: #d0d0d0;
-            }
-            QTabBar::tab {
-                padding-right: 25px;
-            }
-        """)
+        QTimer.singleShot(SEGMENT_RESUME_DELAY, self.resume_segmented_downloads)
+        if self.control_action.isChecked():
+            self.set_control_server(True)
+        # При периодической выгрузке метрик память и CPU вкладок замеряются всегда
+        if metrics_export_path:
+            self.get_task_manager().start()
+        startup_trace.report()
+
+    def show_tab_list(self, visible):
+        # Вертикальный список заменяет полосу вкладок
+        if self.tab_list_dock is None:
+            if not visible:
+                return
+            panel = TabListPanel(self.tab_registry, self.tabs)
+            panel.close_requested.connect(self.close_tab)
+            self.tab_list_dock = QDockWidget('Вкладки', self)
+            self.tab_list_dock.setWidget(panel)
+            self.tab_list_dock.setFeatures(QDockWidget.DockWidgetMovable)
+            self.addDockWidget(Qt.LeftDockWidgetArea, self.tab_list_dock)
+            panel.sync_selection(self.tabs.currentIndex())
+        self.tab_list_dock.setVisible(visible)
+        self.tabs.tabBar().setVisible(not visible)
+        if visible:
+            self.tab_list_dock.widget().search.setFocus()
+
+    def get_task_manager(self):
+        if self.task_manager is None:
+            self.task_manager = TaskManager(self.tab_registry, self.metrics.registry, self)
+        return self.task_manager
+
+    def show_task_manager(self):
+        self.finish_startup()
+        if self.task_manager_window is None:
+            self.task_manager_window = TaskManagerWindow(self.get_task_manager(), self, self)
+        self.task_manager_window.show()
+        self.task_manager_window.raise_()
+
+    def capture_thumbnail(self, tab_id):
+        # Снять можно только видимую вкладку; фоновая снимется, когда ее откроют
+        info = self.tab_registry.get(tab_id)
+        if info is None or not isinstance(info.widget, QWebEngineView):
+            return
+        if info.widget is self.tabs.currentWidget() and self.thumbnails.capture(tab_id, info.widget):
+            self.stale_thumbnails.discard(tab_id)
+        else:
+            self.stale_thumbnails.add(tab_id)
+
+    def show_tab_overview(self):
+        self.finish_startup()
+        browser = self.tabs.currentWidget()
+        if isinstance(browser, QWebEngineView):
+            self.capture_thumbnail(browser.tab_id)
+        if self.tab_overview is None:
+            self.tab_overview = TabOverview(self.tab_registry, self.thumbnails, self.tabs, self)
+        self.tab_overview.show()
+        self.tab_overview.raise_()
+
+    def index_tab_text(self, tab_id):
+        info = self.tab_registry.get(tab_id)
+        if info is None or not isinstance(info.widget, QWebEngineView):
+            return
+        view = info.widget
+        view.page().runJavaScript(TAB_TEXT_JS, lambda text, tab_id=tab_id, view=view:
+            self.tab_text_ready(tab_id, view, text))
+
+    def tab_text_ready(self, tab_id, view, text):
+        # Ответ мог прийти уже после закрытия вкладки
+        info = self.tab_registry.get(tab_id)
+        if info is None or info.widget is not view or not isinstance(text, str):
+            return
+        self.tab_search.add(tab_id, view.title(), view.url().toString(), text)
+
+    def show_tab_search(self):
+        self.finish_startup()
+        if self.tab_search_dialog is None:
+            self.tab_search_dialog = TabSearchDialog(self.tab_search, self)
+            self.tab_search_dialog.open_hit.connect(self.open_search_hit)
+        self.tab_search_dialog.show()
+        self.tab_search_dialog.raise_()
+
+    def open_search_hit(self, tab_id, query):
+        row = self.tab_registry.row(tab_id)
+        if row < 0:
+            return
+        self.tabs.setCurrentIndex(row)
+        # Заглушка восстановленной вкладки заменяется страницей на следующем
+        # проходе цикла событий, поэтому подсветка — после него
+        QTimer.singleShot(0, lambda: self.find_in_tab(tab_id, query))
+
+    def find_in_tab(self, tab_id, query, retry=True):
+        info = self.tab_registry.get(tab_id)
+        if info is None or not isinstance(info.widget, QWebEngineView) or not query:
+            return
+        view = info.widget
+
+        def found(ok):
+            if ok:
+                return
+            # Слова запроса могут стоять на странице не подряд — ищем самое длинное
+            words = tokenize(query)
+            longest = max(words, key=len) if words else ''
+            if longest and longest != query.lower():
+                view.findText(longest)
+            elif retry and info.loading:
+                # Выгруженная вкладка еще загружается. Если загрузка
+                # не закончится, обработчик снимается по таймеру
+                def reloaded(ok=True, search=True):
+                    try:
+                        view.loadFinished.disconnect(reloaded)
+                    except TypeError:
+                        return
+                    if search:
+                        self.find_in_tab(tab_id, query, retry=False)
+                view.loadFinished.connect(reloaded)
+                QTimer.singleShot(TAB_SEARCH_RETRY_TIMEOUT, lambda: reloaded(search=False))
+
+        view.findText(query, QWebEnginePage.FindFlags(), found)
+
+    def get_downloads_window(self):
+        if self.downloads_window is None:
+            self.downloads_window = DownloadsWindow(self)
+        return self.downloads_window
+
+    def restore_session(self):
+        tabs, active = self.session.load()
+        self.session.start()
+        if not tabs:
+            self.add_new_tab(QUrl('https://www.google.com'))
+            return
+
+        self.restoring = True
+        active_index = 0
+        for tab in tabs:
+            self.next_tab_id = max(self.next_tab_id, tab['id'] + 1)
+            title = tab['title'] or 'Новая вкладка'
+            placeholder = TabPlaceholder(tab['id'], QUrl(tab['url']), title)
+            i = self.tab_registry.insert(tab['id'], placeholder, tab['url'], title)
+            if tab['id'] == active:
+                active_index = i
+        self.tabs.setCurrentIndex(active_index)
+        self.restoring = False
+        self.tab_changed(active_index)
+
+    @traced('tab_changed')
+    def tab_changed(self, index):
+        if self.restoring:
+            return
+        widget = self.tabs.widget(index)
+        if isinstance(widget, TabPlaceholder):
+            # Откладываем до следующего цикла событий: currentChanged
+            # приходит и изнутри removeTab, менять вкладки там нельзя
+            QTimer.singleShot(0, lambda widget=widget: self.materialize_tab(widget))
+            return
+        if widget is not None:
+            if widget.tab_id in self.stale_thumbnails:
+                QTimer.singleShot(THUMBNAIL_DELAY, lambda tab_id=widget.tab_id:
+                    self.capture_thumbnail(tab_id))
+            self.session.append({'op': 'active', 'id': widget.tab_id})
+            self.update_urlbar(widget.url(), widget)
+
+    @traced('materialize_tab')
+    def materialize_tab(self, placeholder):
+        if self.tabs.currentWidget() is not placeholder:
+            return
+        self.add_new_tab(placeholder.url, tab_id=placeholder.tab_id, title=placeholder.title)
+        placeholder.deleteLater()
+
+    def closeEvent(self, event):
+        self.stall_watchdog.stop()
+        if self.control_server is not None:
+            self.control_server.close()
+        if ui_tracer.enabled and ui_tracer.events:
+            # Трассировка, включенная на время сеанса, сохраняется при выходе
+            try:
+                os.makedirs(traces_path, exist_ok=True)
+                path = os.path.join(traces_path, time.strftime('ui-%Y%m%d-%H%M%S.json'))
+                ui_tracer.save(path)
+                print(f"Трассировка интерфейса: {path}", file=sys.stderr)
+            except Exception as e:
+                print(f"Ошибка при сохранении трассировки: {str(e)}")
+        self.session.close()
+        self.history.close()
+        self.metrics.save()
+        if self.task_manager is not None:
+            self.task_manager.close()
+        if self.view_pool is not None:
+            self.view_pool.close()
+            self.preloader.discard()
+        if self.archiver is not None:
+            self.archiver.close()
+        if self.offline_archiver is not None:
+            self.offline_archiver.close()
+        if self.image_harvester is not None:
+            self.image_harvester.close()
+        if self.downloads_window is not None:
+            self.downloads_window.dedup.close()
+        self.thumbnails.close()
+        self.tab_search.close()
+        super().closeEvent(event)
 
     def show_downloads(self):
-        self.downloads_window.show()
-        self.downloads_window.raise_()
+        downloads_window = self.get_downloads_window()
+        downloads_window.show()
+        downloads_window.raise_()
+
+    def show_cache(self):
+        self.finish_startup()
+        if self.cache_window is None:
+            self.cache_window = CacheWindow(self.cache_stats, self)
+        self.cache_window.show()
+        self.cache_window.raise_()
 
     def download_settings(self):
         try:
-            profile = QWebEngineProfile.defaultProfile()
+            profile = self.profile
             profile.downloadRequested.connect(self.handle_download)
             profile.setDownloadPath(downloads_path)
+            # Фильтрация запросов всех вкладок профиля
+            profile.setUrlRequestInterceptor(self.content_blocker)
+            profile.installUrlSchemeHandler(OFFLINE_SCHEME.encode('ascii'), self.offline_handler)
         except Exception as e:
             print(f"Ошибка при настройке загрузок: {str(e)}")
 
+    @traced('handle_download')
     def handle_download(self, download):
         try:
+            # Сохранения страниц из архиватора и офлайн-копии он обрабатывает сам
+            if self.archiver is not None and self.archiver.claim(download):
+                return
+            if self.offline_archiver is not None and self.offline_archiver.claim(download):
+                return
+            if download.state() != QWebEngineDownloadItem.DownloadRequested:
+                # page.save() приходит уже принятой загрузкой: только показываем ее
+                self.get_downloads_window().add_download(DownloadEntry(download))
+                return
+
+            if not self.auto_accept_action.isChecked() and not self.offer_existing_download(download):
+                return
+
             default_path = os.path.join(downloads_path, download.suggestedFileName())
-            path, _ = QFileDialog.getSaveFileName(
-                self, "Сохранить файл", default_path,
-                "Все файлы (*.*)"
-            )
+            if self.auto_accept_action.isChecked():
+                # Пакетный режим: без диалога, имя не затирает ни существующий
+                # файл, ни файл загрузки, которая еще идет или ждет в очереди
+                path = unique_path(default_path, self.get_downloads_window().model.reserved_paths())
+            else:
+                # Модальный диалог: отрезок показывает, сколько ждали пользователя
+                with ui_tracer.span('QFileDialog.getSaveFileName'):
+                    path, _ = QFileDialog.getSaveFileName(
+                        self, "Сохранить файл", default_path,
+                        "Все файлы (*.*)"
+                    )
             
             if path:
-                download.setPath(path)
+                url = download.url()
+                # Свой движок повторяет только обычный GET с cookies и Referer;
+                # ответы на формы (POST) и адреса с логином остаются QtWebEngine
+                if (self.segmented_action.isChecked() and url.scheme() in ('http', 'https')
+                        and not url.userName()
+                        and offline_key(url) not in self.content_blocker.form_pages):
+                    page = download.page()
+                    referer = page.url().toString() if page else ''
+                    # Загрузку QtWebEngine отменяем и качаем своим движком
+                    download.cancel()
+                    transfer = SegmentedTransfer(url.toString(), path, referer=referer,
+                                                 cookie_jar=self.cookies.jar,
+                                                 expected_type=download.mimeType(),
+                                                 expected_total=download.totalBytes())
+                    self.save_segmented_list(self.load_segmented_list() + [transfer.sidecar_path])
+                    download = SegmentedDownload(transfer, self)
+                else:
+                    download.setPath(path)
                 download.accept()
                 
-                # Создаем виджет для отображения прогресса загрузки
-                download_widget = DownloadWidget(download)
-                self.downloads_window.add_download(download_widget)
+                # Добавляем загрузку в список окна загрузок
+                entry = DownloadEntry(download)
+                self.get_downloads_window().add_download(entry)
                 
         except Exception as e:
             print(f"Ошибка при обработке загрузки: {str(e)}")
 
-    def show_download_complete(self, path):
-        QMessageBox.information(self, "Загрузка завершена",
-                              f"Файл сохранен в:\n{path}")
+    def offer_existing_download(self, download):
+        # Файл с этого адреса уже скачан и не менялся: предлагаем его,
+        # False — загрузку отменили
+        existing = self.get_downloads_window().dedup.find_url(download.url().toString())
+        if existing is None:
+            return True
+        box = QMessageBox(QMessageBox.Question, "Файл уже загружен",
+                          f"Этот файл уже скачан:\n{existing}", parent=self)
+        show_btn = box.addButton("Показать файл", QMessageBox.AcceptRole)
+        box.addButton("Загрузить снова", QMessageBox.DestructiveRole)
+        cancel_btn = box.addButton(QMessageBox.Cancel)
+        box.exec_()
+        if box.clickedButton() is show_btn:
+            download.cancel()
+            QDesktopServices.openUrl(QUrl.fromLocalFile(os.path.dirname(existing)))
+            return False
+        if box.clickedButton() is cancel_btn:
+            download.cancel()
+            return False
+        return True
+
+    def load_segmented_list(self):
+        try:
+            with open(segmented_list_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def save_segmented_list(self, paths):
+        try:
+            tmp_path = segmented_list_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(paths, f, ensure_ascii=False)
+            os.replace(tmp_path, segmented_list_path)
+        except OSError as e:
+            print(f"Ошибка при сохранении списка загрузок: {str(e)}")
+
+    def resume_segmented_downloads(self):
+        # Докачиваем многопоточные загрузки, прерванные закрытием браузера:
+        # из списка и из папки загрузок. Завершенные и отмененные загрузки
+        # удаляют свой файл состояния и выпадают из списка здесь же
+        paths = self.load_segmented_list()
+        if os.path.isdir(downloads_path):
+            paths += [os.path.join(downloads_path, name) for name in os.listdir(downloads_path)
+                      if name.endswith(SEGMENT_SIDECAR_SUFFIX)]
+        pending = []
+        seen = set()
+        for path in paths:
+            key = os.path.normcase(os.path.abspath(path))
+            if key in seen or not os.path.exists(path):
+                continue
+            seen.add(key)
+            pending.append(path)
+            try:
+                transfer = SegmentedTransfer.from_sidecar(path, self.cookies.jar)
+                download = SegmentedDownload(transfer, self)
+                download.accept()
+                self.get_downloads_window().add_download(DownloadEntry(download))
+            except Exception as e:
+                print(f"Ошибка при возобновлении загрузки {os.path.basename(path)}: {str(e)}")
+        self.save_segmented_list(pending)
+
+    def set_control_server(self, enabled):
+        if not self.started:
+            # Сервер стартует в finish_startup, когда будет профиль
+            return
+        if enabled and self.control_server is None:
+            self.control_server = ControlServer(self, parent=self)
+            if not self.control_server.start():
+                self.control_server = None
+                self.control_action.setChecked(False)
+        elif not enabled and self.control_server is not None:
+            self.control_server.close()
+            self.control_server = None
+
+    def record_tab_requests(self, browser):
+        # Перехватчики отдельных страниц появились в Qt 5.13; без них
+        # в журнал попадают только заблокированные запросы
+        page = browser.page()
+        if hasattr(page, 'setUrlRequestInterceptor'):
+            page.setUrlRequestInterceptor(TabRequestRecorder(self.network_recorder, browser.tab_id, page))
+
+    def export_tab_har(self):
+        browser = self.tabs.currentWidget()
+        if not isinstance(browser, QWebEngineView):
+            return
+        name = browser.url().host() or 'page'
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Экспорт запросов вкладки", os.path.join(downloads_path, f'{name}.har'),
+            "HAR (*.har)"
+        )
+        if not path:
+            return
+        tab_id = browser.tab_id
+        browser.page().runJavaScript(NETWORK_TIMING_JS, lambda entries, browser=browser:
+            self.write_tab_har(path, tab_id, browser, entries))
+
+    def write_tab_har(self, path, tab_id, browser, entries):
+        try:
+            count = self.network_recorder.export_har(
+                path, tab_id, browser.title(), browser.url().toString(),
+                entries if isinstance(entries, list) else None)
+            self.statusBar().showMessage(f"HAR сохранен: {count} запросов", 5000)
+        except Exception as e:
+            print(f"Ошибка при экспорте HAR: {str(e)}")
+
+    def set_ui_tracing(self, enabled):
+        ui_tracer.enabled = enabled
+        if enabled:
+            self.stall_watchdog.start()
+        else:
+            self.stall_watchdog.stop()
+
+    def save_ui_trace(self):
+        os.makedirs(traces_path, exist_ok=True)
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Сохранить трассировку",
+            os.path.join(traces_path, time.strftime('ui-%Y%m%d-%H%M%S.json')),
+            "Chrome trace (*.json)"
+        )
+        if not path:
+            return
+        try:
+            count = ui_tracer.save(path)
+            self.statusBar().showMessage(f"Трассировка сохранена: {count} событий", 5000)
+        except Exception as e:
+            print(f"Ошибка при сохранении трассировки: {str(e)}")
+
+    def export_metrics(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Экспорт метрик", os.path.join(downloads_path, 'metrics.json'),
+            "JSON (*.json);;Prometheus (*.prom *.txt)"
+        )
+        if not path:
+            return
+        try:
+            self.metrics.export(path)
+        except Exception as e:
+            print(f"Ошибка при экспорте метрик: {str(e)}")
+
+    def get_archiver(self):
+        if self.archiver is None:
+            self.finish_startup()
+            self.archiver = PageArchiver(self.profile, self.tab_registry, parent=self)
+            self.archiver.progress.connect(lambda done, total:
+                self.statusBar().showMessage(f"Архивация: {done} из {total}"))
+            self.archiver.finished.connect(self.archive_finished)
+        return self.archiver
+
+    def archive_tabs(self):
+        targets = []
+        for info in self.tab_registry:
+            widget = info.widget
+            if isinstance(widget, TabPlaceholder):
+                url, tab_id = widget.url.toString(), None
+            else:
+                url, tab_id = widget.url().toString(), info.tab_id
+                # Выгруженную вкладку загрузим заново в скрытой странице
+                if widget.page().lifecycleState() == QWebEnginePage.LifecycleState.Discarded:
+                    tab_id = None
+            if url.startswith(('http://', 'https://', 'file:')):
+                targets.append((url, tab_id))
+        if targets:
+            self.get_archiver().archive(targets)
+
+    def archive_url_list(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Список адресов", downloads_path,
+            "Текстовые файлы (*.txt);;Все файлы (*.*)"
+        )
+        if not path:
+            return
+        try:
+            with open(path, encoding='utf-8') as f:
+                urls = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        except Exception as e:
+            print(f"Ошибка при чтении списка адресов: {str(e)}")
+            return
+        targets = [(QUrl.fromUserInput(url).toString(), None) for url in urls]
+        if targets:
+            self.get_archiver().archive(targets)
+
+    def archive_finished(self, stats):
+        saved = stats['logical_bytes'] - stats['stored_bytes']
+        message = (f"Архивация завершена: {stats['done']} из {stats['total']} страниц за "
+                   f"{stats['seconds']} с, записано {format_size(stats['stored_bytes'])}, "
+                   f"повторов не записано {format_size(max(saved, 0))}")
+        if stats['failed']:
+            message += f", не сохранено {stats['failed']}, последняя ошибка — {stats['last_error']}"
+        self.statusBar().showMessage(message, 15000)
+
+    def open_archived_page(self):
+        store = ArchiveStore()
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Страница из архива", store.pages_path, "Манифесты (*.json)"
+        )
+        if not path:
+            return
+        try:
+            out_path = os.path.join(store.root, 'tmp', 'view-' + os.path.basename(path)[:-5] + '.mhtml')
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            store.export_mhtml(path, out_path)
+            tab_id = self.add_new_tab(QUrl.fromLocalFile(out_path))
+            if tab_id is not None:
+                self.archive_views[tab_id] = out_path
+        except Exception as e:
+            print(f"Ошибка при открытии страницы из архива: {str(e)}")
+
+    def clear_archive_views(self):
+        # Файлы страниц из архива живут, пока открыта их вкладка.
+        # После падения остаются лишние; файлы вкладок из сессии оставляем
+        views_dir = os.path.join(archive_path, 'tmp')
+        if not os.path.isdir(views_dir):
+            return
+        open_paths = {}
+        for info in self.tab_registry:
+            url = QUrl(info.url)
+            if url.isLocalFile():
+                open_paths[os.path.normcase(os.path.abspath(url.toLocalFile()))] = info.tab_id
+        for name in os.listdir(views_dir):
+            if not name.startswith('view-'):
+                continue
+            path = os.path.join(views_dir, name)
+            tab_id = open_paths.get(os.path.normcase(os.path.abspath(path)))
+            if tab_id is not None:
+                self.archive_views[tab_id] = path
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def remove_archive_view(self, tab_id):
+        path = self.archive_views.pop(tab_id, None)
+        if path is None or path in self.archive_views.values():
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def capture_offline(self, tab_id):
+        if not self.offline_action.isChecked():
+            return
+        # Вкладку могли закрыть, пока шел сигнал
+        info = self.tab_registry.get(tab_id)
+        if info is None or not isinstance(info.widget, QWebEngineView):
+            return
+        url = info.widget.url()
+        # Не сохраняем адреса с логином, исключенные сайты и ответы на отправку форм
+        if url.scheme() not in ('http', 'https') or url.userName():
+            return
+        host = url.host().lower()
+        if any(host == excluded or host.endswith('.' + excluded) for excluded in OFFLINE_EXCLUDED_HOSTS):
+            return
+        if offline_key(url) in self.content_blocker.form_pages:
+            return
+        saved = self.offline_store.captured_at(url)
+        if saved is not None and time.time() - saved < OFFLINE_RECAPTURE_AFTER:
+            return
+        self.offline_archiver.archive([(url.toString(), tab_id)])
+
+    def open_offline_page(self, url):
+        self.add_new_tab(offline_url(url))
+
+    def open_offline_copy(self):
+        browser = self.tabs.currentWidget()
+        if not isinstance(browser, QWebEngineView):
+            return
+        url = browser.url()
+        if self.offline_store is None or self.offline_store.lookup(url) is None:
+            self.statusBar().showMessage("Офлайн-копии этой страницы нет", 5000)
+            return
+        browser.setUrl(offline_url(url))
+
+    def show_offline_pages(self):
+        self.finish_startup()
+        if self.offline_dialog is None:
+            self.offline_dialog = OfflinePagesDialog(self.offline_store, self.open_offline_page, self)
+        self.offline_dialog.show()
+        self.offline_dialog.raise_()
 
     def save_page(self):
         if not self.tabs.currentWidget():
@@ -561,29 +6836,35 @@ class Browser(QMainWindow):
             self.tabs.currentWidget().page().save(path, QWebEngineDownloadItem.CompleteHtmlSaveFormat)
 
     def save_image(self):
-        if not self.tabs.currentWidget():
+        # Все картинки текущей страницы одним действием
+        view = self.tabs.currentWidget()
+        if not isinstance(view, QWebEngineView):
             return
-            
-        path, _ = QFileDialog.getSaveFileName(
-            self, "Сохранить изображение",
-            downloads_path,
-            "Images (*.png *.jpg *.jpeg);;All Files (*.*)"
+
+        directory = QFileDialog.getExistingDirectory(
+            self, "Папка для изображений", downloads_path
         )
-        
-        if path:
-            self.tabs.currentWidget().page().runJavaScript("""
-                (function() {
-                    var img = document.querySelector('img');
-                    return img ? img.src : null;
-                })();
-            """, lambda result: self.download_image(result, path) if result else None)
-
-    def download_image(self, url, save_path):
-        if url:
-            download = QWebEngineDownloadItem(QUrl(url))
-            download.setPath(save_path)
-            download.accept()
-            download.finished.connect(lambda: self.show_download_complete(save_path))
+
+        if directory:
+            referer = view.url().toString()
+            view.page().runJavaScript(COLLECT_IMAGES_JS,
+                lambda urls: self.download_images(urls or [], directory, referer))
+
+    def get_image_harvester(self):
+        if self.image_harvester is None:
+            self.image_harvester = ImageHarvester(self)
+            self.image_harvester.progress.connect(lambda done, total:
+                self.statusBar().showMessage(f"Изображения: {done} из {total}"))
+            self.image_harvester.finished.connect(lambda stats:
+                self.statusBar().showMessage(
+                    f"Сохранено изображений: {stats['saved']} ({format_size(stats['bytes'])}), "
+                    f"повторов: {stats['duplicates']}, ошибок: {stats['failed']}, "
+                    f"за {stats['seconds']} с", 15000))
+        return self.image_harvester
+
+    def download_images(self, urls, directory, referer):
+        if not self.get_image_harvester().harvest(urls, directory, referer):
+            self.statusBar().showMessage("Предыдущие изображения еще сохраняются", 5000)
 
     def back_clicked(self):
         if self.tabs.currentWidget():
@@ -597,38 +6878,226 @@ class Browser(QMainWindow):
         if self.tabs.currentWidget():
             self.tabs.currentWidget().reload()
 
-    def add_new_tab(self, qurl=QUrl('https://www.google.com')):
+    @traced('add_new_tab')
+    def add_new_tab(self, qurl=QUrl('https://www.google.com'), index=None,
+                    tab_id=None, title='Новая вкладка'):
+        # Вкладку могут открыть раньше, чем закончился запуск
+        self.finish_startup()
         try:
-            browser = QWebEngineView()
+            # Вкладка из сессии сохраняет свой id, новая получает следующий
+            restored = tab_id is not None
+            if not restored:
+                tab_id = self.next_tab_id
+                self.next_tab_id += 1
+
+            browser = self.view_pool.take() or self.view_pool.create()
+            browser.tab_id = tab_id
+            self.record_tab_requests(browser)
             browser.setUrl(qurl)
-            
-            i = self.tabs.addTab(browser, 'Новая вкладка')
-            self.tabs.setCurrentIndex(i)
-            
+            self.lifecycle.track(browser)
+            self.metrics.track(browser)
+
+            if self.tab_registry.get(tab_id) is not None:
+                # Заглушка из сессии становится страницей на том же месте
+                self.tab_registry.replace_widget(tab_id, browser)
+            else:
+                if not restored:
+                    self.session.append({'op': 'open', 'id': tab_id,
+                                         'index': self.tabs.count() if index is None else index,
+                                         'url': qurl.toString(), 'title': title})
+                i = self.tab_registry.insert(tab_id, browser, qurl.toString(), title, index)
+                self.tabs.setCurrentIndex(i)
+            # setUrl уже начал загрузку, loadStarted придет позже
+            self.tab_registry.get(tab_id).loading = True
+
             browser.urlChanged.connect(lambda qurl, browser=browser:
                 self.update_urlbar(qurl, browser))
-            browser.loadFinished.connect(lambda _, i=i, browser=browser:
-                self.tabs.setTabText(i, browser.page().title()))
+            browser.urlChanged.connect(lambda qurl:
+                self.history.record_visit(qurl.toString()))
+            browser.loadFinished.connect(lambda ok, browser=browser:
+                self.history.record_title(browser.url().toString(), browser.title()) if ok else None)
+            browser.urlChanged.connect(lambda qurl, tab_id=tab_id:
+                self.session.append({'op': 'update', 'id': tab_id,
+                                     'url': qurl.toString()}))
+            browser.titleChanged.connect(lambda title, tab_id=tab_id:
+                self.session.append({'op': 'update', 'id': tab_id,
+                                     'title': title}))
+            # Вкладка ищется по id: индекс, захваченный здесь, устаревает
+            # после закрытия вкладок левее
+            browser.titleChanged.connect(lambda title, tab_id=tab_id:
+                self.tab_registry.update(tab_id, title=title))
+            browser.urlChanged.connect(lambda qurl, tab_id=tab_id:
+                self.tab_registry.update(tab_id, url=qurl.toString()))
+            browser.iconChanged.connect(lambda icon, tab_id=tab_id:
+                self.tab_registry.update(tab_id, icon=icon))
+            browser.loadStarted.connect(lambda tab_id=tab_id:
+                self.tab_load_started(tab_id))
+            browser.loadFinished.connect(lambda ok, tab_id=tab_id, browser=browser:
+                self.tab_load_finished(tab_id, browser, ok))
+            browser.loadFinished.connect(lambda ok, browser=browser:
+                self.cache_stats.collect(browser.page()) if ok else None)
+            browser.loadFinished.connect(lambda ok, tab_id=tab_id:
+                self.capture_offline(tab_id) if ok else None)
+            browser.loadFinished.connect(lambda ok, tab_id=tab_id:
+                QTimer.singleShot(THUMBNAIL_DELAY, lambda: self.capture_thumbnail(tab_id)))
+            browser.loadFinished.connect(lambda ok, tab_id=tab_id:
+                QTimer.singleShot(TAB_SEARCH_DELAY, lambda: self.index_tab_text(tab_id)) if ok else None)
+            return tab_id
         except Exception as e:
             print(f"Ошибка при создании новой вкладки: {str(e)}")
 
+    def tab_load_started(self, tab_id):
+        info = self.tab_registry.get(tab_id)
+        if info is not None:
+            info.loading = True
+
+    def tab_load_finished(self, tab_id, browser, ok):
+        info = self.tab_registry.get(tab_id)
+        if info is None:
+            return
+        info.loading = False
+        info.load_ok = ok
+        if self.control_server is not None:
+            self.control_server.load_finished(tab_id, browser, ok)
+
+    @traced('close_tab')
     def close_tab(self, i):
         if self.tabs.count() < 2:
             return
-        self.tabs.removeTab(i)
+        browser = self.tabs.widget(i)
+        self.lifecycle.untrack(browser)
+        self.metrics.untrack(browser)
+        self.session.append({'op': 'close', 'id': browser.tab_id})
+        self.tab_registry.remove(browser.tab_id)
+        self.thumbnails.remove(browser.tab_id)
+        self.stale_thumbnails.discard(browser.tab_id)
+        self.tab_search.remove(browser.tab_id)
+        self.remove_archive_view(browser.tab_id)
+        if self.control_server is not None:
+            self.control_server.tab_closed(browser.tab_id)
+        # removeTab не удаляет виджет, без этого страница остается в памяти
+        browser.deleteLater()
 
     def navigate_home(self):
         if self.tabs.currentWidget():
             self.tabs.currentWidget().setUrl(QUrl('https://www.google.com'))
 
+    @traced('navigate_to_url')
     def navigate_to_url(self):
         if not self.tabs.currentWidget():
             return
             
-        q = QUrl(self.url_bar.text())
-        if q.scheme() == '':
-            q.setScheme('http')
-        self.tabs.currentWidget().setUrl(q)
+        text = self.url_bar.text().strip()
+        kind = classify_input(text)
+        if kind is None:
+            return
+        self.omnibox.cancel()
+        if kind == 'search':
+            self.search()
+            return
+        # fromUserInput сам добавляет http:// к адресу без схемы
+        qurl = QUrl.fromUserInput(text)
+        if not self.use_preloaded(qurl):
+            self.tabs.currentWidget().setUrl(qurl)
+
+    def can_preload(self):
+        # Замена страницы стирает историю вкладки, поэтому предзагрузка
+        # только для вкладок без «Назад»: новых и только что открытых
+        browser = self.tabs.currentWidget()
+        return (isinstance(browser, QWebEngineView) and
+                browser.page().history().count() <= 1)
+
+    def use_preloaded(self, qurl):
+        if self.preloader is None or not self.can_preload():
+            return False
+        page = self.preloader.take(qurl)
+        if page is None:
+            return False
+        browser = self.tabs.currentWidget()
+        old_page = browser.page()
+        page.setParent(browser)
+        browser.setPage(page)
+        old_page.deleteLater()
+        self.record_tab_requests(browser)
+        # Сигналы вкладки при смене страницы сами не приходят
+        browser.urlChanged.emit(page.url())
+        browser.titleChanged.emit(page.title())
+        if self.preloader.load_ok is not None:
+            browser.loadFinished.emit(self.preloader.load_ok)
+        return True
+
+    def set_preload(self, enabled):
+        if self.preloader is not None:
+            self.preloader.enabled = enabled
+            if not enabled:
+                self.preloader.discard()
+
+    def show_speedup_stats(self):
+        self.finish_startup()
+        pool = self.view_pool.stats()
+        preload = self.preloader.stats()
+        QMessageBox.information(self, 'Статистика ускорения вкладок',
+            f"Запас вкладок: {pool['hits']} из {pool['hits'] + pool['misses']} "
+            f"({pool['hit_rate']:.0%}), сэкономлено {pool['saved_ms']:.0f} мс\n"
+            f"Предзагрузка: использовано {preload['used']}, выброшено {preload['wasted']}, "
+            f"без готовой страницы {preload['missed']} ({preload['hit_rate']:.0%}), "
+            f"сэкономлено {preload['saved_ms']:.0f} мс")
+
+    def open_tab_suggestions(self):
+        current = self.tabs.currentWidget()
+        for info in self.tab_registry:
+            if info.widget is not current:
+                yield info.tab_id, info.url, info.title
+
+    def show_suggestions(self, text, suggestions):
+        # Ответ на уже измененный текст не нужен
+        if text != self.url_bar.text():
+            return
+        self.suggestions.clear()
+        for suggestion in suggestions:
+            if suggestion.kind == 'search':
+                label = f"🔍 {suggestion.text} — поиск в Google"
+            elif suggestion.kind == 'url':
+                label = f"→ {suggestion.text}"
+            elif suggestion.kind == 'tab':
+                label = f"⇥ {suggestion.title or suggestion.text} — открытая вкладка"
+            else:
+                label = f"{suggestion.title} — {suggestion.text}" if suggestion.title else suggestion.text
+            item = QStandardItem(label)
+            item.setToolTip(suggestion.text)
+            item.setData(suggestion.text, Qt.UserRole)
+            item.setData(suggestion.kind, Qt.UserRole + 1)
+            item.setData(suggestion.tab_id, Qt.UserRole + 2)
+            self.suggestions.appendRow(item)
+        if self.preloader is not None and self.can_preload():
+            self.preloader.suggest(self.preload_candidate(suggestions))
+        if suggestions and self.url_bar.hasFocus():
+            self.completer.complete()
+        else:
+            self.completer.popup().hide()
+
+    def preload_candidate(self, suggestions):
+        # Загружаем только адреса из истории: недопечатанный URL
+        # (example.co вместо example.com) открыл бы чужой сайт
+        for suggestion in suggestions:
+            if suggestion.kind == 'history':
+                return QUrl(suggestion.text)
+        return None
+
+    def suggestion_activated(self, index):
+        kind = index.data(Qt.UserRole + 1)
+        text = index.data(Qt.UserRole)
+        self.omnibox.cancel()
+        if kind == 'tab':
+            row = self.tab_registry.row(index.data(Qt.UserRole + 2))
+            if row >= 0:
+                self.tabs.setCurrentIndex(row)
+                return
+        self.url_bar.setText(text)
+        if kind == 'search':
+            self.search()
+        else:
+            self.navigate_to_url()
 
     def update_urlbar(self, q, browser=None):
         if not browser or browser != self.tabs.currentWidget():
@@ -640,21 +7109,122 @@ class Browser(QMainWindow):
         if not self.tabs.currentWidget():
             return
             
-        search_text = self.url_bar.text()
-        search_url = f'https://www.google.com/search?q={search_text}'
-        self.tabs.currentWidget().setUrl(QUrl(search_url))
+        search_text = self.url_bar.text().strip()
+        if search_text:
+            self.tabs.currentWidget().setUrl(search_url(search_text))
+
+def render_file_name(index, url):
+    # Номер сохраняет порядок списка, остальное — читаемая часть адреса
+    qurl = QUrl(url)
+    slug = re.sub(r'[^\w.-]+', '_', f'{qurl.host()}{qurl.path()}').strip('_')[:80]
+    return f'{index:05d}-{slug or "page"}'
+
+def run_render(argv):
+    # python web.py render urls.txt --pdf --png -j 8: пакетное сохранение
+    # страниц без окна браузера пулом переиспользуемых страниц
+    parser = argparse.ArgumentParser(prog='web.py render',
+                                     description='Сохранение страниц в PDF и PNG без окна браузера')
+    parser.add_argument('urls', help='файл с адресами, по одному в строке; - — стандартный ввод')
+    parser.add_argument('--pdf', action='store_true', help='сохранить страницу в PDF')
+    parser.add_argument('--png', action='store_true', help='сохранить снимок страницы')
+    parser.add_argument('--full-page', action='store_true', help='снимок всей страницы, а не окна')
+    parser.add_argument('-j', '--jobs', type=int, default=RENDER_POOL_SIZE,
+                        help=f'страниц одновременно (по умолчанию {RENDER_POOL_SIZE})')
+    parser.add_argument('-o', '--output', default='render', help='папка для файлов')
+    parser.add_argument('--timeout', type=float, default=RENDER_TIMEOUT, help='секунд на один адрес')
+    parser.add_argument('--report', help='JSON с результатами по каждому адресу')
+    parser.add_argument('--profile', action='store_true',
+                        help='профиль браузера с cookies и входом на сайты; '
+                             'не запускать, пока открыт браузер')
+    args = parser.parse_args(argv)
+    if not args.pdf and not args.png:
+        parser.error('укажите --pdf и/или --png')
+
+    if args.urls == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(args.urls, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    urls = [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
+    output = os.path.abspath(args.output)
+    os.makedirs(output, exist_ok=True)
+
+    # Окно не показывается, поэтому дисплей не нужен
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    app = QApplication(sys.argv[:1])
+    # Невидимые виды снимков — окна верхнего уровня; удаление последнего
+    # из них не должно завершать приложение, пока пишутся файлы
+    app.setQuitOnLastWindowClosed(False)
+    # По умолчанию — профиль без записи на диск: рендер не трогает cookies
+    # и кэш браузера, который может быть открыт в это же время
+    profile = create_profile() if args.profile else QWebEngineProfile(app)
+    pool = RenderPool(profile, max(1, args.jobs), views=args.png)
+    results = []
+    began = time.perf_counter()
+
+    def shutdown():
+        # Страницы удаляются раньше профиля, пока цикл событий еще идет
+        pool.close()
+        QTimer.singleShot(0, app.quit)
+
+    def done(result):
+        results.append(result)
+        error = result.get('error')
+        print(f"[{len(results)}/{len(urls)}] {'ошибка' if error else 'ok':6} {result['ms']:8.0f} мс  "
+              f"{result['url']}" + (f"  ({error})" if error else ''), flush=True)
+        if len(results) == len(urls):
+            QTimer.singleShot(0, shutdown)
+
+    for i, url in enumerate(urls, 1):
+        url = QUrl.fromUserInput(url).toString()
+        name = os.path.join(output, render_file_name(i, url))
+        task = RenderTask(url, timeout=args.timeout, callback=done,
+                          pdf=f'{name}.pdf' if args.pdf else None,
+                          png=f'{name}.png' if args.png else None,
+                          full_page=args.full_page)
+        task.result['index'] = i
+        pool.submit(task)
+    if urls:
+        app.exec_()
+    elapsed = time.perf_counter() - began
+
+    failed = sum('error' in result for result in results)
+    loads = sorted(result['load_ms'] for result in results if 'load_ms' in result)
+    summary = {
+        'urls': len(urls),
+        'failed': failed,
+        'jobs': pool.size,
+        'seconds': round(elapsed, 3),
+        'pages_per_second': round(len(results) / elapsed, 2) if elapsed else 0,
+        'median_load_ms': loads[len(loads) // 2] if loads else None,
+    }
+    print(f"Готово: {len(results) - failed} из {len(urls)}, ошибок {failed}, "
+          f"{elapsed:.1f} с, {summary['pages_per_second']} стр/с, {pool.size} страниц одновременно")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'results': sorted(results, key=lambda r: r['index'])},
+                      f, ensure_ascii=False, indent=1)
+    return 1 if failed else 0
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'render':
+        sys.exit(run_render(sys.argv[2:]))
     try:
         if sys.platform == 'win32':
             import ctypes
             myappid = 'mycompany.mybrowser.browser.1'  # произвольный идентификатор
             ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
         
+        startup_trace.mark('импорт модулей')
+        register_offline_scheme()
         app = QApplication(sys.argv)
         QApplication.setApplicationName('Web Browser')
+        startup_trace.mark('QApplication')
         window = Browser()
+        startup_trace.mark('Browser.__init__')
         window.show()
+        startup_trace.mark('show')
         sys.exit(app.exec_())
     except Exception as e:
         QMessageBox.critical(None, "Ошибка", f"Произошла ошибка: {str(e)}")